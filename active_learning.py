@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+active_learning.py
+
+Picks the unannotated frames that are most worth annotating next in CVAT.
+
+Every frame of the data_vN task folders that is not in the merged COCO file is scored by how
+unsure the current model is about it:
+  keypoint uncertainty   1 - mean keypoint confidence of the best person
+  flip disagreement      the frame is also predicted mirrored; the mirrored keypoints are mapped
+                         back (left/right swapped with flip_idx from dataset.yaml) and their mean
+                         distance to the normal prediction is divided by sqrt(box area), like OKS
+  score = keypoint uncertainty + --flip_weight * min(flip disagreement, 1)
+Frames where the model finds no person get the highest score (2 with the default weight).
+
+To spread the annotation effort, at most --per_video frames are taken from one video (same
+video id as split_train_val_test.py) and frames of one video are at least --min_gap frames apart.
+
+Both predictions of every frame are kept in the prediction cache of pseudo_label.py (per model
+and image sha256), so re-ranking with the same checkpoint is instant and a new checkpoint or new
+frames only predict what changed.
+
+Writes --out (the selected file names, one per line; the format extract_frames.py --frames_file
+reads) and <out>.csv with the scores. --copy_to puts the selected images in a folder for the
+CVAT task (--link-mode works as in select_and_copy_images.py).
+
+Usage:
+python active_learning.py --weights runs/pose/train22/weights/best.pt --data_dir data_v4 --coco annotations_v4/merged_coco.json --dataset yolopose_v4/dataset.yaml --top_k 100 --out annotations_v4/next_batch.txt
+python active_learning.py --weights best.onnx --data_dir data_v4 --coco annotations_v4/merged_coco.json --dataset yolopose_v4/dataset.yaml --top_k 50 --per_video 3 --out next_batch.txt --copy_to cvat_upload --link-mode hardlink
+"""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+from collections import defaultdict
+
+import numpy as np
+import yaml
+
+from extract_frames import read_frames_file
+from file_transfer import add_transfer_arguments, transfer_files
+from infer_onnx import create_session, export_onnx
+from pseudo_label import CANDIDATE_CONF, NUM_KEYPOINTS, PredictionCache, find_unannotated_frames, model_key, predict_with_cache
+from split_train_val_test import frame_number, get_video_id_from_filename
+
+def best_detection(record):
+    return max(record["detections"], key=lambda d: d["score"]) if record["detections"] else None
+
+def uncertainty(record, flipped_record):
+    """(score, mean keypoint confidence, flip distance) of one frame; higher score = less sure."""
+    det, flipped = best_detection(record), best_detection(flipped_record)
+    if det is None:
+        return None, 0.0, None
+    kpts = np.array(det["keypoints"], dtype=np.float64)
+    mean_conf = float(kpts[:, 2].mean())
+    if flipped is None:
+        return 1 - mean_conf, mean_conf, None
+    flipped_kpts = np.array(flipped["keypoints"], dtype=np.float64)
+    scale = np.sqrt(max(det["bbox"][2] * det["bbox"][3], 1.0))
+    flip_distance = float(np.linalg.norm(kpts[:, :2] - flipped_kpts[:, :2], axis=1).mean() / scale)
+    return 1 - mean_conf, mean_conf, flip_distance
+
+def select_diverse(ranked, top_k, per_video, min_gap):
+    """Walk frames from most to least uncertain, skipping full videos and frames too close to a picked one."""
+    picked_frames = defaultdict(list)
+    selected = []
+    for row in ranked:
+        if len(selected) >= top_k:
+            break
+        video = row["video_id"]
+        if len(picked_frames[video]) >= per_video:
+            continue
+        frame = row["frame"]
+        if frame >= 0 and any(other >= 0 and abs(frame - other) < min_gap for other in picked_frames[video]):
+            continue
+        picked_frames[video].append(frame)
+        selected.append(row)
+    return selected
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank unannotated frames by model uncertainty for the next CVAT task")
+    parser.add_argument("--weights", required=True, help="best.pt (exported to ONNX next to it) or an .onnx file")
+    parser.add_argument("--data_dir", required=True, help="Dataset image folder with one folder per CVAT task, e.g. data_v4")
+    parser.add_argument("--coco", required=True, help="Merged COCO file with the frames that are already annotated")
+    parser.add_argument("--dataset", required=True, help="dataset.yaml with flip_idx, e.g. yolopose_v4/dataset.yaml")
+    parser.add_argument("--out", required=True, help="Text file for the selected image names")
+    parser.add_argument("--top_k", type=int, default=100, help="Number of frames to select")
+    parser.add_argument("--per_video", type=int, default=2, help="Most frames taken from one video")
+    parser.add_argument("--min_gap", type=int, default=10, help="Minimum frame distance between picks of one video")
+    parser.add_argument("--flip_weight", type=float, default=1.0, help="Weight of the flip disagreement in the score")
+    parser.add_argument("--exclude", nargs='*', default=["merged"], help="Folders of --data_dir to skip")
+    parser.add_argument("--skip", default=None, help="Text file of image names already sent to CVAT (e.g. a previous --out)")
+    parser.add_argument("--cache", default=None, help="Prediction cache file (default: predictions_cache.json next to --out)")
+    parser.add_argument("--copy_to", default=None, help="Also put the selected images in this folder")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--max_batch", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads (0 = all cores)")
+    add_transfer_arguments(parser)
+    args = parser.parse_args()
+
+    with open(args.coco, 'r') as f:
+        coco = json.load(f)
+    with open(args.dataset, 'r') as f:
+        flip_idx = yaml.safe_load(f)["flip_idx"]
+    num_keypoints = len(coco["categories"][0].get("keypoints", [])) or NUM_KEYPOINTS
+
+    image_paths, task_dirs = find_unannotated_frames(args.data_dir, coco, args.exclude)
+    if args.skip:
+        skipped = {f"{stem}_{frame}" for stem, frames in read_frames_file(args.skip).items() for frame in frames}
+        image_paths = [path for path in image_paths if os.path.splitext(os.path.basename(path))[0] not in skipped]
+    print(f"{len(image_paths)} unannotated frames in {len(task_dirs)} task folders")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    cache = PredictionCache(args.cache or os.path.join(os.path.dirname(os.path.abspath(args.out)), "predictions_cache.json"))
+    session = create_session(export_onnx(args.weights, args.imgsz), args.threads)
+    model = model_key(args.weights, args.imgsz)
+    common = dict(imgsz=args.imgsz, max_batch=args.max_batch, workers=args.workers,
+                  conf=CANDIDATE_CONF, num_keypoints=num_keypoints)
+    predicted, records = predict_with_cache(session, cache, model, image_paths, **common)
+    predicted_flipped, flipped_records = predict_with_cache(session, cache, model, image_paths, flip_idx=flip_idx, **common)
+    print(f"Predicted {predicted} frames and {predicted_flipped} mirrored frames, the rest came from the cache")
+
+    rows = []
+    for path in image_paths:
+        file_name = os.path.basename(path)
+        kpt_uncertainty, mean_conf, flip_distance = uncertainty(records[path], flipped_records[path])
+        if kpt_uncertainty is None:
+            score = 1 + args.flip_weight
+        else:
+            score = kpt_uncertainty + args.flip_weight * (1.0 if flip_distance is None else min(flip_distance, 1.0))
+        rows.append({"file_name": file_name, "path": path, "video_id": get_video_id_from_filename(file_name),
+                     "frame": frame_number(file_name), "score": score, "mean_kpt_conf": mean_conf,
+                     "flip_distance": flip_distance})
+    ranked = sorted(rows, key=lambda row: (-row["score"], row["file_name"]))
+    selected = select_diverse(ranked, args.top_k, args.per_video, args.min_gap)
+
+    with open(args.out, 'w') as f:
+        f.write(''.join(row["file_name"] + '\n' for row in selected))
+    report_file = os.path.splitext(args.out)[0] + ".csv"
+    with open(report_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank", "file_name", "video_id", "score", "mean_kpt_conf", "flip_distance"])
+        for rank, row in enumerate(selected, start=1):
+            writer.writerow([rank, row["file_name"], row["video_id"], round(row["score"], 4),
+                             round(row["mean_kpt_conf"], 4),
+                             "" if row["flip_distance"] is None else round(row["flip_distance"], 4)])
+
+    if args.copy_to:
+        os.makedirs(args.copy_to, exist_ok=True)
+        transfer_files([(row["path"], os.path.join(args.copy_to, row["file_name"])) for row in selected],
+                       args.link_mode, shutil.copy2, args.workers)
+
+    videos = len({row["video_id"] for row in selected})
+    print(f"Selected {len(selected)} of {len(rows)} frames from {videos} videos "
+          f"(score {selected[-1]['score']:.3f} .. {selected[0]['score']:.3f})" if selected else "Nothing selected")
+    print(f"Selection written to: {args.out} (scores: {report_file})")
+
+if __name__ == "__main__":
+    main()
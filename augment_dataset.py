@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+augment_dataset.py
+
+Offline, keypoint-aware augmentation: expands a split of a YOLO pose tree (e.g. the train split
+of yolopose_v4/data) with --copies augmented versions of every image and writes a new, ready to
+train tree, so the augmentation is computed once instead of in every epoch.
+
+Each copy gets a random combination of
+  horizontal flip   (--flip, probability) with left/right keypoints swapped by flip_idx from dataset.yaml
+  affine            rotation (--degrees), scale (--scale) and translation (--translate) around the centre
+  brightness        gain in 1 +- --brightness
+Flip and affine are one 2x3 matrix per copy. The matrices of all copies are built at once, and
+the keypoints and box corners of all objects are transformed with one batched matrix product.
+Keypoints that land outside the image become 0 0 0 (like yolo_annot_correction.py), boxes are
+the clipped bounds of the transformed corners, and objects without a visible keypoint or with
+less than 10% of their box left in the image are dropped.
+
+Images are warped on a process pool (--processes, default one per CPU), each source image
+decoded once for all its copies; --workers is the number of file transfer and label reading
+threads. The original images and labels of every split are linked into the output as well
+(--link-mode, like select_and_copy_images.py), and <out>.yaml is written next to the output
+folder with the source dataset.yaml's keypoint settings, so it can be passed to train.py --data.
+
+Augmented files are named <stem>_aug<k>.jpg, so split_train_val_test.py still finds the video id.
+Those of an earlier run are deleted first, so a rerun with fewer --copies leaves no extra copies.
+
+Usage:
+python augment_dataset.py --data yolopose_v4/data --dataset yolopose_v4/dataset.yaml --out yolopose_v4/data_aug --copies 2 --link-mode hardlink
+python augment_dataset.py --data yolopose_v4/data --dataset yolopose_v4/dataset.yaml --out yolopose_v4/data_aug --copies 4 --degrees 10 --scale 0.15 --flip 0.5 --seed 1
+python train.py --data yolopose_v4/data_aug.yaml
+"""
+
+import argparse
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import yaml
+
+from check_dataset import parse_labels, read_label_texts
+from coco_to_yolo_pose import line_format
+from file_transfer import add_transfer_arguments, build_dir_index, transfer_files
+from image_cache import IMAGE_EXTENSIONS, PAD_VALUE
+from scan_images import scan_header
+
+AUG_STEM = re.compile(r"_aug\d+$")
+
+NUM_KEYPOINTS = 17
+# Objects keeping less of their transformed box inside the image are dropped
+MIN_BOX_FRACTION = 0.1
+
+def sample_params(rng, count, flip, degrees, scale, translate, brightness):
+    """Random parameters of count copies as arrays."""
+    return {
+        "flip": rng.random(count) < flip,
+        "angle": rng.uniform(-degrees, degrees, count),
+        "scale": rng.uniform(1 - scale, 1 + scale, count),
+        "tx": rng.uniform(-translate, translate, count),
+        "ty": rng.uniform(-translate, translate, count),
+        "gain": rng.uniform(1 - brightness, 1 + brightness, count),
+    }
+
+def affine_matrices(params, widths, heights):
+    """(copies, 2, 3) pixel transforms: optional mirror, then rotation/scale around the centre, then shift."""
+    count = len(widths)
+    flip = np.tile(np.eye(3), (count, 1, 1))
+    flip[params["flip"], 0, 0] = -1
+    flip[params["flip"], 0, 2] = widths[params["flip"]]
+
+    # Same convention as cv2.getRotationMatrix2D (positive angle = counter-clockwise)
+    theta = np.deg2rad(params["angle"])
+    a, b = params["scale"] * np.cos(theta), params["scale"] * np.sin(theta)
+    cx, cy = widths / 2, heights / 2
+    rotate = np.zeros((count, 3, 3))
+    rotate[:, 0, 0], rotate[:, 0, 1], rotate[:, 0, 2] = a, b, (1 - a) * cx - b * cy + params["tx"] * widths
+    rotate[:, 1, 0], rotate[:, 1, 1], rotate[:, 1, 2] = -b, a, b * cx + (1 - a) * cy + params["ty"] * heights
+    rotate[:, 2, 2] = 1
+    return (rotate @ flip)[:, :2]
+
+def transform_labels(rows, matrices, widths, heights, flipped, flip_idx, num_keypoints=NUM_KEYPOINTS):
+    """
+    Transform label rows (objects, 5 + K*3), normalized; object o belongs to the copy whose
+    matrix is matrices[o], image size widths[o] x heights[o]. Returns (new rows, kept mask).
+    """
+    size = np.stack([widths, heights], axis=1)[:, None, :]
+    kpts = rows[:, 5:].reshape(len(rows), num_keypoints, 3).copy()
+    # A mirrored left shoulder is the right shoulder
+    kpts[flipped] = kpts[flipped][:, flip_idx]
+    points = np.concatenate([kpts[:, :, :2] * size, np.ones((len(rows), num_keypoints, 1))], axis=2)
+    xy = np.einsum('oij,okj->oki', matrices, points)
+    visible = (kpts[:, :, 2] > 0) & (xy[:, :, 0] >= 0) & (xy[:, :, 0] < size[:, :, 0]) \
+              & (xy[:, :, 1] >= 0) & (xy[:, :, 1] < size[:, :, 1])
+    kpts[:, :, :2] = np.where(visible[:, :, None], xy / size, 0.0)
+    kpts[:, :, 2] = np.where(visible, kpts[:, :, 2], 0.0)
+
+    cx, cy, w, h = (rows[:, i] for i in range(1, 5))
+    corners = np.stack([np.stack([cx + dx * w / 2, cy + dy * h / 2], axis=1)
+                        for dx, dy in ((-1, -1), (1, -1), (1, 1), (-1, 1))], axis=1) * size
+    corners = np.einsum('oij,okj->oki', matrices, np.concatenate([corners, np.ones((len(rows), 4, 1))], axis=2))
+    low, high = corners.min(axis=1), corners.max(axis=1)
+    clipped_low, clipped_high = np.maximum(low, 0), np.minimum(high, size[:, 0])
+    clipped_area = np.prod(np.maximum(clipped_high - clipped_low, 0), axis=1)
+    full_area = np.maximum(np.prod(high - low, axis=1), 1e-9)
+    kept = visible.any(axis=1) & (clipped_area / full_area >= MIN_BOX_FRACTION)
+
+    out = np.empty_like(rows)
+    out[:, 0] = rows[:, 0]
+    out[:, 1:3] = (clipped_low + clipped_high) / 2 / size[:, 0]
+    out[:, 3:5] = (clipped_high - clipped_low) / size[:, 0]
+    out[:, 5:] = kpts.reshape(len(rows), -1)
+    return out, kept
+
+def augment_image(job):
+    """Process pool task: decode one source image and write all its augmented copies."""
+    src, copies, quality = job
+    img = cv2.imread(src, cv2.IMREAD_COLOR)
+    if img is None:
+        return src, 0
+    h, w = img.shape[:2]
+    for dst, matrix, gain in copies:
+        # Label coordinates put pixel i's centre at i + 0.5, OpenCV at i
+        matrix = matrix.copy()
+        matrix[:, 2] += matrix[:, :2].sum(axis=1) * 0.5 - 0.5
+        out = cv2.warpAffine(img, matrix, (w, h), flags=cv2.INTER_LINEAR, borderValue=(PAD_VALUE,) * 3)
+        if gain != 1.0:
+            out = cv2.convertScaleAbs(out, alpha=gain)
+        cv2.imwrite(dst, out, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return src, len(copies)
+
+def remove_old_copies(folder):
+    """Delete the <stem>_aug<k> files of an earlier run; returns how many."""
+    removed = 0
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.is_dir() and AUG_STEM.search(os.path.splitext(entry.name)[0]):
+                os.remove(entry.path)
+                removed += 1
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline keypoint-aware augmentation of a YOLO pose split")
+    parser.add_argument("--data", required=True, help="YOLO tree with images/ and labels/, e.g. yolopose_v4/data")
+    parser.add_argument("--dataset", required=True, help="dataset.yaml with kpt_shape and flip_idx")
+    parser.add_argument("--out", required=True, help="Output tree, e.g. yolopose_v4/data_aug (also writes <out>.yaml)")
+    parser.add_argument("--splits", nargs='+', default=["train"], help="Splits to augment; the others are only linked")
+    parser.add_argument("--copies", type=int, default=2, help="Augmented copies per image")
+    parser.add_argument("--flip", type=float, default=0.5, help="Probability of a horizontal flip")
+    parser.add_argument("--degrees", type=float, default=5.0, help="Rotation range +- in degrees")
+    parser.add_argument("--scale", type=float, default=0.1, help="Scale range 1 +- this")
+    parser.add_argument("--translate", type=float, default=0.05, help="Shift range +- this fraction of width/height")
+    parser.add_argument("--brightness", type=float, default=0.2, help="Brightness gain range 1 +- this")
+    parser.add_argument("--quality", type=int, default=95, help="JPEG quality of the augmented images")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                        help="Processes warping the images (default: one per CPU)")
+    add_transfer_arguments(parser)
+    args = parser.parse_args()
+
+    with open(args.dataset, 'r') as f:
+        dataset_cfg = yaml.safe_load(f)
+    num_keypoints = dataset_cfg.get("kpt_shape", [NUM_KEYPOINTS, 3])[0]
+    flip_idx = np.array(dataset_cfg["flip_idx"])
+    fmt = line_format(num_keypoints)
+    rng = np.random.default_rng(args.seed)
+
+    splits = sorted(name for name in os.listdir(os.path.join(args.data, "images"))
+                    if os.path.isdir(os.path.join(args.data, "images", name)))
+    for split in splits:
+        images_out = os.path.join(args.out, "images", split)
+        labels_out = os.path.join(args.out, "labels", split)
+        os.makedirs(images_out, exist_ok=True)
+        os.makedirs(labels_out, exist_ok=True)
+        removed = remove_old_copies(images_out) + remove_old_copies(labels_out)
+        if removed:
+            print(f"{split}: removed {removed} augmented files of an earlier run")
+        image_index = build_dir_index([os.path.join(args.data, "images", split)], recursive=False)
+        label_dir = os.path.join(args.data, "labels", split)
+        label_index = build_dir_index([label_dir], recursive=False) if os.path.isdir(label_dir) else {}
+        names = sorted(name for name in image_index if name.lower().endswith(IMAGE_EXTENSIONS))
+        pairs = [(image_index[name], os.path.join(images_out, name)) for name in names]
+        pairs += [(path, os.path.join(labels_out, name)) for name, path in sorted(label_index.items()) if name.endswith(".txt")]
+        transfer_files(pairs, args.link_mode, shutil.copy2, args.workers)
+        if split not in args.splits or args.copies < 1:
+            continue
+
+        # Image sizes from the headers, labels parsed in one conversion
+        headers = [scan_header(image_index[name]) for name in names]
+        names = [name for name, header in zip(names, headers) if "error" not in header]
+        sizes = np.array([(header["width"], header["height"]) for header in headers if "error" not in header], dtype=np.float64)
+        stems = [os.path.splitext(name)[0] for name in names]
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            texts = read_label_texts({stem: (label_index[stem + ".txt"],) for stem in stems if stem + ".txt" in label_index},
+                                     executor)
+        rows, spans, bad = parse_labels(texts, num_keypoints)
+        if bad:
+            print(f"Warning: skipping {len(bad)} malformed label files, e.g. {sorted(bad)[:3]}")
+
+        # One entry per (image, copy); parameters and matrices for all of them at once
+        image_of_copy = np.repeat(np.arange(len(names)), args.copies)
+        copy_number = np.tile(np.arange(1, args.copies + 1), len(names))
+        params = sample_params(rng, len(image_of_copy), args.flip, args.degrees, args.scale, args.translate, args.brightness)
+        widths, heights = sizes[image_of_copy, 0], sizes[image_of_copy, 1]
+        matrices = affine_matrices(params, widths, heights)
+
+        # All objects of all copies in one batch
+        object_rows, object_copy = [], []
+        for j, i in enumerate(image_of_copy):
+            start, stop = spans.get(stems[i], (0, 0))
+            object_rows.extend(range(start, stop))
+            object_copy.extend([j] * (stop - start))
+        object_copy = np.array(object_copy, dtype=np.int64)
+        new_rows, kept = transform_labels(rows[object_rows], matrices[object_copy], widths[object_copy],
+                                          heights[object_copy], params["flip"][object_copy], flip_idx, num_keypoints)
+
+        jobs = {}
+        lines = [[] for _ in image_of_copy]
+        for row, copy, keep in zip(new_rows, object_copy, kept):
+            if keep:
+                lines[copy].append(fmt % tuple(row))
+        for j, (i, k) in enumerate(zip(image_of_copy, copy_number)):
+            if stems[i] in bad:
+                continue
+            out_stem = f"{stems[i]}_aug{k}"
+            with open(os.path.join(labels_out, out_stem + ".txt"), 'w') as f:
+                f.write(''.join(line + '\n' for line in lines[j]))
+            jobs.setdefault(image_index[names[i]], []).append(
+                (os.path.join(images_out, out_stem + ".jpg"), matrices[j], float(params["gain"][j])))
+
+        written = 0
+        with ProcessPoolExecutor(max_workers=args.processes) as executor:
+            for src, count in executor.map(augment_image, [(src, copies, args.quality) for src, copies in jobs.items()],
+                                           chunksize=8):
+                if count == 0:
+                    print(f"Warning: could not read {src}")
+                written += count
+        print(f"{split}: {len(names)} images -> {written} augmented copies "
+              f"({int(kept.sum())} of {len(kept)} objects kept, {int(params['flip'].sum())} flipped)")
+
+    out_yaml = os.path.abspath(args.out.rstrip("/\\")) + ".yaml"
+    cfg = dict(dataset_cfg, path=os.path.abspath(args.out).replace(os.sep, '/'))
+    with open(out_yaml, 'w') as f:
+        yaml.safe_dump(cfg, f, sort_keys=False, default_flow_style=None)
+    print(f"Augmented tree written to: {args.out} (dataset file: {out_yaml})")
+
+if __name__ == "__main__":
+    main()
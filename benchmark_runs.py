@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+benchmark_runs.py
+
+Compares training runs (Ultralytics runs/pose/<name> folders such as
+train21-mar14-RTX2060-yolo11m or train_v3) side by side instead of opening every results.csv.
+
+For every run folder with a results.csv it reports:
+  s/epoch        median wall time per epoch (differences of the cumulative "time" column,
+                 training + validation)
+  img/s          training images per second: train split size / s/epoch
+  best P95       best metrics/mAP50-95(P) and the epoch it was reached
+  to best        wall time until that epoch
+next to the settings from args.yaml that matter for speed (model, batch, imgsz, workers,
+cache, amp, device).
+
+The train/val split sizes are read from the run's log.txt ("train: Scanning ... 638 images")
+when there is one, otherwise from the dataset.yaml given with --data (or the "data" entry of
+args.yaml when that path exists on this machine).
+
+Runs are ranked by --sort. With --baseline every other run is compared to that run and
+flagged when it is slower (s/epoch, img/s, time to best) or worse (best mAP50-95(P)) by more than
+--tolerance (relative; --map_tolerance absolute for mAP).
+
+Usage:
+python benchmark_runs.py
+python benchmark_runs.py --runs "runs/pose/*" train_v3 --baseline train21-mar14-RTX2060-yolo11m
+python benchmark_runs.py --data yolopose_v4/dataset.yaml --sort s_epoch --csv runs/pose/benchmark.csv
+"""
+
+import argparse
+import csv
+import glob
+import os
+import re
+import statistics
+
+import yaml
+
+MAP_COLUMN = "metrics/mAP50-95(P)"
+KEY_ARGS = ["model", "batch", "imgsz", "workers", "cache", "amp", "device"]
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+SCAN_LINE = re.compile(r"^(train|val): .*?Scanning .*?(\d+) images")
+ANSI_CODE = re.compile(r"\x1b\[[0-9;]*m")
+SORT_KEYS = {
+    # name -> (field, higher is better)
+    "map": ("best_map", True),
+    "s_epoch": ("s_epoch", False),
+    "img_s": ("img_s", True),
+    "time_to_best": ("time_to_best", False),
+}
+
+def read_results(results_file):
+    """results.csv as a list of dicts of floats (older Ultralytics versions pad the header with spaces)."""
+    rows = []
+    with open(results_file, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            parsed = {}
+            for key, value in row.items():
+                try:
+                    parsed[key.strip()] = float(value)
+                except (TypeError, ValueError):
+                    pass
+            rows.append(parsed)
+    return rows
+
+def split_sizes_from_log(log_file):
+    sizes = {}
+    if not os.path.exists(log_file):
+        return sizes
+    with open(log_file, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = SCAN_LINE.search(ANSI_CODE.sub('', line))
+            if match and match.group(1) not in sizes:
+                sizes[match.group(1)] = int(match.group(2))
+    return sizes
+
+def count_images(folder):
+    if not os.path.isdir(folder):
+        return None
+    return sum(1 for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS))
+
+def split_sizes_from_dataset(dataset_yaml):
+    """Image counts of the train/val folders of a dataset.yaml."""
+    with open(dataset_yaml, 'r') as f:
+        cfg = yaml.safe_load(f)
+    root = cfg.get("path") or os.path.dirname(dataset_yaml)
+    if not os.path.isdir(root):
+        # Configs written on another machine: fall back to the data folder next to the yaml
+        root = os.path.join(os.path.dirname(dataset_yaml), os.path.basename(root.rstrip("/\\")))
+    sizes = {}
+    for split in ("train", "val"):
+        if isinstance(cfg.get(split), str):
+            count = count_images(os.path.join(root, cfg[split]))
+            if count is not None:
+                sizes[split] = count
+    return sizes
+
+def summarize_run(run_dir, dataset_yaml=None):
+    rows = read_results(os.path.join(run_dir, "results.csv"))
+    args = {}
+    args_file = os.path.join(run_dir, "args.yaml")
+    if os.path.exists(args_file):
+        with open(args_file, 'r') as f:
+            args = yaml.safe_load(f) or {}
+
+    sizes = split_sizes_from_log(os.path.join(run_dir, "log.txt"))
+    if "train" not in sizes:
+        data = dataset_yaml or args.get("data")
+        if data and os.path.exists(data):
+            sizes = split_sizes_from_dataset(data)
+
+    times = [row["time"] for row in rows if "time" in row]
+    epoch_times = [b - a for a, b in zip([0.0] + times, times)]
+    s_epoch = statistics.median(epoch_times) if epoch_times else None
+
+    best_map = best_epoch = time_to_best = None
+    scored = [row for row in rows if MAP_COLUMN in row]
+    if scored:
+        best = max(scored, key=lambda row: row[MAP_COLUMN])
+        best_map, best_epoch = best[MAP_COLUMN], int(best.get("epoch", scored.index(best) + 1))
+        time_to_best = best.get("time")
+
+    train_images = sizes.get("train")
+    return {
+        "run": os.path.basename(os.path.normpath(run_dir)),
+        "epochs": len(rows),
+        "train_images": train_images,
+        "val_images": sizes.get("val"),
+        "s_epoch": s_epoch,
+        "img_s": train_images / s_epoch if train_images and s_epoch else None,
+        "best_map": best_map,
+        "best_epoch": best_epoch,
+        "time_to_best": time_to_best,
+        **{key: args.get(key) for key in KEY_ARGS},
+    }
+
+def regression_flags(run, baseline, tolerance, map_tolerance):
+    """Short flags for every metric where run is worse than baseline beyond the tolerance."""
+    flags = []
+    for field, higher_is_better, label in (("s_epoch", False, "slower epochs"),
+                                           ("img_s", True, "lower img/s"),
+                                           ("time_to_best", False, "slower to best")):
+        ours, theirs = run[field], baseline[field]
+        if ours is None or not theirs:
+            continue
+        change = (ours - theirs) / theirs
+        if (change < -tolerance) if higher_is_better else (change > tolerance):
+            flags.append(f"{label} {change:+.0%}")
+    if run["best_map"] is not None and baseline["best_map"] is not None:
+        if run["best_map"] < baseline["best_map"] - map_tolerance:
+            flags.append(f"mAP50-95(P) {run['best_map'] - baseline['best_map']:+.3f}")
+    return flags
+
+def fmt(value, spec=""):
+    if value is None:
+        return "-"
+    return format(value, spec) if spec else str(value)
+
+def print_table(runs, baseline_name):
+    header = ["#", "run", "model", "batch", "imgsz", "workers", "cache", "amp", "train",
+              "s/epoch", "img/s", "best P95", "@epoch", "to best", "flags"]
+    table = []
+    for rank, run in enumerate(runs, start=1):
+        flags = "baseline" if run["run"] == baseline_name else ", ".join(run.get("flags", []))
+        table.append([
+            str(rank), run["run"], fmt(run["model"] and os.path.basename(str(run["model"]))),
+            fmt(run["batch"]), fmt(run["imgsz"]), fmt(run["workers"]), fmt(run["cache"]), fmt(run["amp"]),
+            fmt(run["train_images"]), fmt(run["s_epoch"], ".1f"), fmt(run["img_s"], ".1f"),
+            fmt(run["best_map"], ".4f"), fmt(run["best_epoch"]),
+            fmt(run["time_to_best"] and run["time_to_best"] / 3600, ".2f") + ("h" if run["time_to_best"] else ""),
+            flags,
+        ])
+    widths = [max(len(row[i]) for row in [header] + table) for i in range(len(header))]
+    for row in [header] + table:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare training runs: throughput, time to best mAP and key settings")
+    parser.add_argument("--runs", nargs='+', default=["runs/pose/*"],
+                        help="Run folders or glob patterns (folders without results.csv are skipped)")
+    parser.add_argument("--data", default=None,
+                        help="dataset.yaml to count split sizes when a run has no log.txt (e.g. yolopose_v4/dataset.yaml)")
+    parser.add_argument("--baseline", default=None, help="Run name (folder name) to compare the others against")
+    parser.add_argument("--sort", choices=sorted(SORT_KEYS), default="map", help="Ranking metric")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Relative slowdown allowed before flagging (0.10 = 10%%)")
+    parser.add_argument("--map_tolerance", type=float, default=0.01,
+                        help="Absolute mAP50-95(P) drop allowed before flagging")
+    parser.add_argument("--csv", default=None, help="Also write the table to this CSV file")
+    args = parser.parse_args()
+
+    run_dirs = []
+    for pattern in args.runs:
+        for path in sorted(glob.glob(pattern)):
+            if os.path.exists(os.path.join(path, "results.csv")) and path not in run_dirs:
+                run_dirs.append(path)
+    if not run_dirs:
+        print(f"No runs with a results.csv found in {args.runs}")
+        return
+
+    runs = [summarize_run(run_dir, args.data) for run_dir in run_dirs]
+
+    field, higher_is_better = SORT_KEYS[args.sort]
+    missing = [run for run in runs if run[field] is None]
+    ranked = sorted((run for run in runs if run[field] is not None),
+                    key=lambda run: run[field], reverse=higher_is_better) + missing
+
+    if args.baseline:
+        baseline = next((run for run in runs if run["run"] == args.baseline), None)
+        if baseline is None:
+            parser.error(f"baseline run '{args.baseline}' not found among {[run['run'] for run in runs]}")
+        for run in runs:
+            if run is not baseline:
+                run["flags"] = regression_flags(run, baseline, args.tolerance, args.map_tolerance)
+
+    print_table(ranked, args.baseline)
+
+    if args.csv:
+        fields = ["run", "epochs", "train_images", "val_images", "s_epoch", "img_s", "best_map", "best_epoch",
+                  "time_to_best", *KEY_ARGS, "flags"]
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for run in ranked:
+                writer.writerow({**{key: run.get(key) for key in fields}, "flags": "; ".join(run.get("flags", []))})
+        print(f"Table written to: {args.csv}")
+
+    regressed = [run["run"] for run in runs if run.get("flags")]
+    if regressed:
+        print(f"Regressions against {args.baseline}: {', '.join(regressed)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+check_dataset.py
+
+Checks that the three views of one dataset version still describe the same frames:
+  annotations_vN/merged_coco.json       the annotations
+  data_vN/merged                        the images
+  yolopose_vN/data/{images,labels}      the YOLO pose training tree (train/val/test splits)
+
+All three are indexed by file stem (52723_8_10.jpg / 52723_8_10.txt -> 52723_8_10) and compared
+in one pass over the union of stems. Reported problems:
+  missing_data_image     in the COCO file but not in data_vN/merged
+  extra_data_image       in data_vN/merged but not in the COCO file
+  missing_yolo_image     in the COCO file but not in yolopose_vN/data/images
+  missing_label          a YOLO image without a label file
+  orphan_label           a label file without a YOLO image
+  not_in_coco            a YOLO image or label that the COCO file doesn't know
+  duplicate              a stem found more than once in one tree (e.g. in both train and test)
+  bad_label              a label file that isn't rows of 5 + 17 * 3 numbers
+  object_count           COCO annotations and label rows of a frame differ in number
+  keypoint_mismatch      a keypoint is labeled (v > 0) on one side only; COCO keypoints outside the
+                         image count as unlabeled, since yolo_annot_correction.py clears them
+  coordinates            a labeled keypoint is more than --tolerance pixels away from the COCO one
+
+Label rows are compared with the COCO annotations of the frame in order (the order
+coco_to_yolo_pose.py and the CVAT export write them); normalized YOLO coordinates are scaled
+back with the width/height of the COCO image.
+
+Directory listings and label files are read on a thread pool (--workers), so large trees on
+network drives are checked in seconds. The COCO file is opened through coco_index.py, so after
+the first run its keypoints load from the sidecar index instead of parsing the JSON. Exits with
+status 1 when problems are found, so it can guard a script.
+
+Usage:
+python check_dataset.py --coco annotations_v4/merged_coco.json --images data_v4/merged --yolo yolopose_v4/data
+python check_dataset.py --coco annotations_v4/merged_coco.json --yolo yolopose_v4/data --tolerance 0.5 --report check_v4.csv
+"""
+
+import argparse
+import csv
+import os
+import sys
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from coco_index import CocoIndex
+from file_transfer import DEFAULT_WORKERS
+from image_cache import IMAGE_EXTENSIONS
+
+NUM_KEYPOINTS = 17
+ISSUE_TYPES = ["missing_data_image", "extra_data_image", "missing_yolo_image", "missing_label", "orphan_label",
+               "not_in_coco", "duplicate", "bad_label", "object_count", "keypoint_mismatch", "coordinates"]
+
+LABEL_BATCH = 256
+
+def list_dir(directory):
+    files, subdirs = [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                subdirs.append(entry.path)
+            else:
+                files.append((entry.name, entry.path))
+    return files, subdirs
+
+def scan_tree(root, extensions, executor):
+    """{stem: [paths]} of the files under root with one of the extensions; one directory level per round."""
+    found = defaultdict(list)
+    level = [root]
+    while level:
+        next_level = []
+        for files, subdirs in executor.map(list_dir, level):
+            for name, path in files:
+                stem, dot, ext = name.rpartition('.')
+                if dot and '.' + ext.lower() in extensions:
+                    found[stem].append(path)
+            next_level.extend(subdirs)
+        level = next_level
+    return found
+
+def read_labels(paths):
+    texts = []
+    for path in paths:
+        with open(path, 'r') as f:
+            texts.append(f.read())
+    return texts
+
+def read_label_texts(yolo_labels, executor):
+    """{stem: label text}, read in batches so 100k small files don't mean 100k futures."""
+    stems = list(yolo_labels)
+    batches = [stems[i:i + LABEL_BATCH] for i in range(0, len(stems), LABEL_BATCH)]
+    texts = {}
+    for batch, batch_texts in zip(batches, executor.map(read_labels, [[yolo_labels[stem][0] for stem in batch]
+                                                                      for batch in batches])):
+        texts.update(zip(batch, batch_texts))
+    return texts
+
+def parse_labels(label_texts, num_keypoints=NUM_KEYPOINTS):
+    """
+    All label files as one (rows, 5 + K*3) array, converted in a single call.
+    Returns (rows, {stem: (start, stop)}, set of malformed stems).
+    """
+    width = 5 + num_keypoints * 3
+    tokens, spans, bad = [], {}, set()
+    for stem, text in label_texts.items():
+        values = text.split()
+        if len(values) % width:
+            bad.add(stem)
+            continue
+        spans[stem] = (len(tokens) // width, (len(tokens) + len(values)) // width)
+        tokens.extend(values)
+    try:
+        rows = np.array(tokens, dtype=np.float64).reshape(-1, width)
+    except ValueError:
+        # Some file has a token that isn't a number; find it the slow way
+        for stem in list(spans):
+            try:
+                np.array(label_texts[stem].split(), dtype=np.float64)
+            except ValueError:
+                bad.add(stem)
+        return parse_labels({stem: text for stem, text in label_texts.items() if stem not in bad}, num_keypoints)[:2] + (bad,)
+    return rows, spans, bad
+
+def compare_objects(coco_kpts, coco_labeled, yolo_rows, sizes, tolerance, num_keypoints=NUM_KEYPOINTS):
+    """
+    Compare P (COCO annotation, label row) pairs at once.
+    Returns (keypoint mismatch mask (P, K), distance (P, K) of keypoints labeled on both sides).
+    """
+    yolo = yolo_rows[:, 5:].reshape(-1, num_keypoints, 3) * np.concatenate([sizes, np.ones((len(sizes), 1))], axis=1)[:, None, :]
+    yolo_labeled = yolo[:, :, 2] > 0
+    both = coco_labeled & yolo_labeled
+    distance = np.where(both, np.linalg.norm(coco_kpts[:, :, :2] - yolo[:, :, :2], axis=2), 0.0)
+    return coco_labeled != yolo_labeled, distance
+
+def check_dataset(coco, data_images, yolo_images, yolo_labels, label_texts, tolerance, num_keypoints=NUM_KEYPOINTS):
+    """List of (issue, stem, detail) over the union of stems, in stem order. coco is a CocoIndex."""
+    coco_images = {os.path.splitext(img["file_name"])[0]: img for img in coco.images}
+    sizes_by_id = {img["id"]: (img["width"], img["height"]) for img in coco.images}
+    # Keypoints straight from the index arrays, no annotation dicts
+    all_image_ids = coco.annotation_image_ids.tolist()
+    known = np.flatnonzero((coco.keypoint_counts == num_keypoints)
+                           & np.array([image_id in sizes_by_id for image_id in all_image_ids], dtype=bool))
+    ann_image_ids = [all_image_ids[i] for i in known]
+    coco_kpts = coco.keypoints[known, :num_keypoints * 3].reshape(-1, num_keypoints, 3)
+    ann_sizes = np.array([sizes_by_id[image_id] for image_id in ann_image_ids], dtype=np.float64).reshape(-1, 2)
+    # yolo_annot_correction.py turns keypoints outside the image into 0 0 0 and drops objects left without any
+    inside = ((coco_kpts[:, :, 0] >= 0) & (coco_kpts[:, :, 0] <= ann_sizes[:, None, 0])
+              & (coco_kpts[:, :, 1] >= 0) & (coco_kpts[:, :, 1] <= ann_sizes[:, None, 1]))
+    coco_labeled = (coco_kpts[:, :, 2] > 0) & inside
+    kept = coco_labeled.any(axis=1)
+    anns_by_image = defaultdict(list)
+    for i in np.flatnonzero(kept).tolist():
+        anns_by_image[ann_image_ids[i]].append(i)
+    rows, spans, bad = parse_labels(label_texts, num_keypoints)
+
+    issues = []
+    pair_ann, pair_row, pair_stem = [], [], []
+    stems = set(coco_images) | set(yolo_images) | set(yolo_labels)
+    if data_images is not None:
+        stems |= set(data_images)
+    for stem in sorted(stems):
+        img = coco_images.get(stem)
+        for name, tree in (("data", data_images), ("yolo images", yolo_images), ("yolo labels", yolo_labels)):
+            if tree is not None and len(tree.get(stem, ())) > 1:
+                issues.append(("duplicate", stem, f"{name}: " + ", ".join(tree[stem])))
+        if data_images is not None:
+            if img is not None and stem not in data_images:
+                issues.append(("missing_data_image", stem, img["file_name"]))
+            elif img is None and stem in data_images:
+                issues.append(("extra_data_image", stem, data_images[stem][0]))
+        has_image, has_label = stem in yolo_images, stem in yolo_labels
+        if img is None:
+            if has_image or has_label:
+                issues.append(("not_in_coco", stem, (yolo_images.get(stem) or yolo_labels.get(stem))[0]))
+        elif not has_image:
+            issues.append(("missing_yolo_image", stem, img["file_name"]))
+        if has_image and not has_label:
+            issues.append(("missing_label", stem, yolo_images[stem][0]))
+        elif has_label and not has_image:
+            issues.append(("orphan_label", stem, yolo_labels[stem][0]))
+        if not has_label:
+            continue
+        if stem in bad:
+            issues.append(("bad_label", stem, yolo_labels[stem][0]))
+            continue
+        if img is not None:
+            ann_rows = anns_by_image.get(img["id"], [])
+            start, stop = spans[stem]
+            if len(ann_rows) != stop - start:
+                issues.append(("object_count", stem, f"COCO {len(ann_rows)}, label {stop - start}"))
+            count = min(len(ann_rows), stop - start)
+            pair_ann.extend(ann_rows[:count])
+            pair_row.extend(range(start, start + count))
+            pair_stem.extend([stem] * count)
+
+    # Keypoints of every paired object in one vectorized comparison
+    if pair_ann:
+        pair_ann = np.array(pair_ann)
+        mismatch, distance = compare_objects(coco_kpts[pair_ann], coco_labeled[pair_ann], rows[pair_row],
+                                             ann_sizes[pair_ann], tolerance, num_keypoints)
+        first_pair = {}
+        for i, stem in enumerate(pair_stem):
+            first_pair.setdefault(stem, i)
+        for i in np.flatnonzero(mismatch.any(axis=1)):
+            stem = pair_stem[i]
+            labeled = coco_labeled[pair_ann[i]]
+            issues.append(("keypoint_mismatch", stem,
+                           f"object {i - first_pair[stem]}: COCO {int(labeled.sum())} labeled, "
+                           f"label {int((labeled != mismatch[i]).sum())} (keypoints {np.flatnonzero(mismatch[i]).tolist()})"))
+        for i in np.flatnonzero(distance.max(axis=1) > tolerance):
+            worst = int(distance[i].argmax())
+            issues.append(("coordinates", pair_stem[i],
+                           f"object {i - first_pair[pair_stem[i]]}: keypoint {worst} is {distance[i, worst]:.2f} px off"))
+    issues.sort(key=lambda item: item[1])
+    return issues
+
+def main():
+    parser = argparse.ArgumentParser(description="Check COCO file, image folder and YOLO tree of a dataset version against each other")
+    parser.add_argument("--coco", required=True, help="Merged COCO file, e.g. annotations_v4/merged_coco.json")
+    parser.add_argument("--images", default=None, help="Image folder of the COCO file, e.g. data_v4/merged")
+    parser.add_argument("--yolo", required=True, help="YOLO tree with images/ and labels/, e.g. yolopose_v4/data")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="Allowed keypoint distance in pixels")
+    parser.add_argument("--num_keypoints", type=int, default=NUM_KEYPOINTS)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Threads for directory scans and label reads")
+    parser.add_argument("--report", default=None, help="Write every problem to this CSV")
+    parser.add_argument("--show", type=int, default=5, help="Examples printed per problem type")
+    args = parser.parse_args()
+
+    coco = CocoIndex(args.coco)
+    image_extensions = set(IMAGE_EXTENSIONS)
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        data_images = scan_tree(args.images, image_extensions, executor) if args.images else None
+        yolo_images = scan_tree(os.path.join(args.yolo, "images"), image_extensions, executor)
+        yolo_labels = scan_tree(os.path.join(args.yolo, "labels"), {".txt"}, executor)
+        label_texts = read_label_texts(yolo_labels, executor)
+
+    issues = check_dataset(coco, data_images, yolo_images, yolo_labels, label_texts, args.tolerance, args.num_keypoints)
+
+    print(f"COCO: {len(coco.images)} images / {len(coco.annotation_image_ids)} annotations, "
+          + (f"{args.images}: {sum(len(p) for p in data_images.values())} images, " if data_images is not None else "")
+          + f"{args.yolo}: {sum(len(p) for p in yolo_images.values())} images / "
+          f"{sum(len(p) for p in yolo_labels.values())} labels")
+    counts = Counter(issue for issue, _, _ in issues)
+    if not issues:
+        print("No problems found")
+    for issue_type in ISSUE_TYPES:
+        if counts[issue_type]:
+            print(f"{issue_type}: {counts[issue_type]}")
+            for _, stem, detail in [item for item in issues if item[0] == issue_type][:args.show]:
+                print(f"  {stem}: {detail}")
+
+    if args.report:
+        with open(args.report, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["issue", "stem", "detail"])
+            writer.writerows(issues)
+        print(f"Report written to: {args.report}")
+    sys.exit(1 if issues else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+coco_index.py
+
+Opens a COCO file once and keeps it open fast: the scripts used to json.load the whole file and
+build their own lookups (image_id_map, img_id_map, image_names); CocoIndex does both for all of
+them.
+
+The JSON is parsed with orjson when it is installed (pip install orjson, about 1.5x faster) and
+the json module otherwise. The result is saved next to it as a binary sidecar, e.g.
+annotations_v4/merged_coco.json.index, in sections that are only read when used (NumPy arrays in
+.npy format, everything else as JSON; nothing is pickled, so a shared sidecar can't run code):
+
+  meta                      everything except images and annotations (info, licenses, categories)
+  images                    the image list
+  annotation_image_ids      image id of every annotation (NumPy array)
+  keypoint_counts/keypoints keypoints of every annotation as one (annotations, K*3) array,
+                            so numeric tools never build the annotation dicts
+  annotation chunks         the annotation dicts, 4096 per chunk
+
+The sidecar belongs to the JSON whose sha256 it records. While the file's size and mtime are
+unchanged the JSON is not even read. A copied or touched but otherwise identical file is hashed
+once and the sidecar is reused; a changed file is parsed again and the sidecar rewritten. So is
+a sidecar that can't be read (corrupt, truncated or from an older version of this script).
+
+Usage:
+python coco_index.py --coco annotations_v4/merged_coco.json
+
+In Python / notebooks:
+    from coco_index import CocoIndex
+    coco = CocoIndex("annotations_v4/merged_coco.json")
+    coco.image_by_name("52723_8_10.jpg")        # image dict or None
+    coco.annotations_for(coco.image_by_name("52723_8_10.jpg")["id"])
+    coco.keypoints, coco.annotation_image_ids   # NumPy arrays, no dicts built
+    coco.data                                   # the whole COCO dict, like json.load
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import struct
+import time
+from collections import defaultdict
+from functools import cached_property
+
+import numpy as np
+
+from file_transfer import file_sha256
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+INDEX_MAGIC = b'COCOIDX2'
+# magic, JSON size, JSON mtime_ns, JSON sha256, offset and length of the JSON section table
+INDEX_HEADER = struct.Struct('<8sqq64sqq')
+CHUNK_SIZE = 4096
+
+def loads_json(raw):
+    """Parse JSON bytes with orjson if available (it rejects NaN, which json accepts), else json."""
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(raw)
+
+def load_json(path):
+    """Drop-in for json.load(open(path)) with the faster parser."""
+    with open(path, 'rb') as f:
+        return loads_json(f.read())
+
+def default_index_path(coco_file):
+    """annotations_v4/merged_coco.json -> annotations_v4/merged_coco.json.index"""
+    return coco_file + ".index"
+
+def encode_section(value, fast=False):
+    """
+    b'N' + .npy bytes for arrays (no pickled objects), b'J' + JSON for everything else.
+    fast uses orjson, which would write NaN as null: only for data known to have none.
+    """
+    if isinstance(value, np.ndarray):
+        buffer = io.BytesIO()
+        np.save(buffer, value, allow_pickle=False)
+        return b'N' + buffer.getvalue()
+    if fast and orjson is not None:
+        try:
+            return b'J' + orjson.dumps(value)
+        except orjson.JSONEncodeError:
+            pass
+    return b'J' + json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+def decode_section(blob):
+    if blob[:1] == b'N':
+        return np.load(io.BytesIO(blob[1:]), allow_pickle=False)
+    if blob[:1] == b'J':
+        return loads_json(blob[1:])
+    raise ValueError(f"unknown section type {blob[:1]!r}")
+
+def keypoint_arrays(annotations):
+    """(keypoint count per annotation, (annotations, max K*3) float64 zero-padded keypoints)."""
+    lengths = np.array([len(ann.get("keypoints") or ()) for ann in annotations], dtype=np.int64)
+    width = int(lengths.max()) if len(lengths) else 0
+    if len(lengths) and (lengths == width).all():
+        keypoints = np.array([ann["keypoints"] for ann in annotations], dtype=np.float64).reshape(len(annotations), width)
+    else:
+        keypoints = np.zeros((len(annotations), width), dtype=np.float64)
+        for i, ann in enumerate(annotations):
+            if lengths[i]:
+                keypoints[i, :lengths[i]] = ann["keypoints"]
+    return lengths // 3, keypoints
+
+class CocoIndex:
+    """
+    Lazily loaded COCO file. Attributes and lookups are built on first use.
+    The returned dicts are shared with the index: copy them before changing them.
+    """
+
+    def __init__(self, coco_file, index_file=None, cache=True):
+        self.coco_file = coco_file
+        self.index_file = (index_file or default_index_path(coco_file)) if cache else None
+        self._sections = None
+        self._chunks = {}
+        st = os.stat(coco_file)
+        if self.index_file and self._open_index(st):
+            return
+        with open(coco_file, 'rb') as f:
+            raw = f.read()
+        # NaN / Infinity (which json accepts) must not go through orjson when writing the sidecar
+        fast = b'NaN' not in raw and b'Infinity' not in raw
+        self._build(loads_json(raw), hashlib.sha256(raw).hexdigest(), st, fast)
+
+    # ---- sidecar ----
+
+    def _open_index(self, st):
+        """Use the sidecar if it belongs to this JSON; True on success."""
+        try:
+            with open(self.index_file, 'rb') as f:
+                header = f.read(INDEX_HEADER.size)
+                magic, size, mtime_ns, digest, table_offset, table_length = INDEX_HEADER.unpack(header)
+                if magic != INDEX_MAGIC:
+                    return False
+                f.seek(table_offset)
+                sections = loads_json(f.read(table_length))
+            # Every section must lie inside the file, so a truncated sidecar is rebuilt here and not on first use
+            if any(offset + length > table_offset for offset, length in sections.values()):
+                return False
+        except Exception:
+            # Unreadable, foreign or older sidecar: parse the JSON again and rewrite it
+            return False
+        if (size, mtime_ns) != (st.st_size, st.st_mtime_ns):
+            if size != st.st_size or file_sha256(self.coco_file).encode() != digest:
+                return False
+            # Same content, new mtime (copied, touched, checked out again): remember the new stat
+            try:
+                with open(self.index_file, 'r+b') as f:
+                    f.write(INDEX_HEADER.pack(INDEX_MAGIC, st.st_size, st.st_mtime_ns, digest, table_offset, table_length))
+            except OSError:
+                pass
+        self._sections = sections
+        return True
+
+    def _read(self, name):
+        offset, length = self._sections[name]
+        with open(self.index_file, 'rb') as f:
+            f.seek(offset)
+            return decode_section(f.read(length))
+
+    def _build(self, coco, digest, st, fast=False):
+        annotations = coco.get("annotations", [])
+        self.__dict__.update(
+            meta={key: value for key, value in coco.items() if key not in ("images", "annotations")},
+            images=coco.get("images", []),
+            annotations=annotations,
+            annotation_image_ids=np.array([ann["image_id"] for ann in annotations], dtype=np.int64))
+        self.keypoint_counts, self.keypoints = keypoint_arrays(annotations)
+        if not self.index_file:
+            return
+        sections = {name: getattr(self, name) for name in
+                    ("meta", "images", "annotation_image_ids", "keypoint_counts", "keypoints")}
+        for i in range(0, len(annotations), CHUNK_SIZE):
+            sections[f"chunk_{i // CHUNK_SIZE}"] = annotations[i:i + CHUNK_SIZE]
+        tmp_file = f"{self.index_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'wb') as f:
+                f.seek(INDEX_HEADER.size)
+                table = {}
+                for name, value in sections.items():
+                    blob = encode_section(value, fast)
+                    table[name] = (f.tell(), len(blob))
+                    f.write(blob)
+                # Section table last, its position in the header
+                table_offset, table_blob = f.tell(), json.dumps(table).encode('utf-8')
+                f.write(table_blob)
+                f.seek(0)
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, st.st_size, st.st_mtime_ns, digest.encode(),
+                                          table_offset, len(table_blob)))
+            os.replace(tmp_file, self.index_file)
+        except OSError as e:
+            print(f"Warning: could not write {self.index_file} ({e}), continuing without it")
+            return
+        self._sections = table
+
+    # ---- sections ----
+
+    @cached_property
+    def meta(self):
+        return self._read("meta")
+
+    @cached_property
+    def images(self):
+        return self._read("images")
+
+    @cached_property
+    def annotation_image_ids(self):
+        return self._read("annotation_image_ids")
+
+    @cached_property
+    def keypoint_counts(self):
+        return self._read("keypoint_counts")
+
+    @cached_property
+    def keypoints(self):
+        return self._read("keypoints")
+
+    @cached_property
+    def annotations(self):
+        return [ann for i in range(self._chunk_count) for ann in self._chunk(i)]
+
+    @property
+    def _chunk_count(self):
+        return -(-len(self.annotation_image_ids) // CHUNK_SIZE)
+
+    def _chunk(self, i):
+        if "annotations" in self.__dict__:
+            return self.annotations[i * CHUNK_SIZE:(i + 1) * CHUNK_SIZE]
+        if i not in self._chunks:
+            self._chunks[i] = self._read(f"chunk_{i}")
+        return self._chunks[i]
+
+    @property
+    def categories(self):
+        return self.meta.get("categories", [])
+
+    @property
+    def data(self):
+        """The whole COCO dict, same keys and order as json.load would give."""
+        return dict(self.meta, images=self.images, annotations=self.annotations)
+
+    # ---- lookups ----
+
+    @cached_property
+    def _images_by_id(self):
+        return {img["id"]: img for img in self.images}
+
+    @cached_property
+    def _images_by_name(self):
+        return {img["file_name"]: img for img in self.images}
+
+    @cached_property
+    def _annotation_rows(self):
+        """{image id: [annotation positions]}"""
+        rows = defaultdict(list)
+        for i, image_id in enumerate(self.annotation_image_ids.tolist()):
+            rows[image_id].append(i)
+        return rows
+
+    @property
+    def file_names(self):
+        return [img["file_name"] for img in self.images]
+
+    def image(self, image_id):
+        return self._images_by_id.get(image_id)
+
+    def image_by_name(self, file_name):
+        return self._images_by_name.get(file_name)
+
+    def annotation_rows(self, image_id):
+        """Positions of an image's annotations in annotations / keypoints."""
+        return self._annotation_rows.get(image_id, [])
+
+    def annotations_for(self, image_id):
+        """Annotation dicts of one image; only the chunks holding them are loaded."""
+        return [self._chunk(i // CHUNK_SIZE)[i % CHUNK_SIZE] for i in self.annotation_rows(image_id)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / refresh the binary index of COCO files")
+    parser.add_argument("--coco", nargs='+', required=True, help="COCO files, e.g. annotations_v4/merged_coco.json")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore an existing index")
+    args = parser.parse_args()
+
+    for coco_file in args.coco:
+        if args.rebuild and os.path.exists(default_index_path(coco_file)):
+            os.remove(default_index_path(coco_file))
+        start = time.perf_counter()
+        coco = CocoIndex(coco_file)
+        opened = time.perf_counter() - start
+        print(f"{coco_file}: {len(coco.images)} images, {len(coco.annotation_image_ids)} annotations, "
+              f"opened in {opened * 1000:.0f} ms -> {coco.index_file}")
+    if orjson is None:
+        print("orjson is not installed; pip install orjson makes the first parse faster")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+coco_to_yolo_pose.py
+
+Converts a merged COCO keypoint file (e.g. annotations_v4/merged_coco.json) straight into the
+Ultralytics YOLO pose label format, replacing the CVAT round-trip (create task -> import COCO ->
+export ultralytics_yolo_pose_1.0 -> copy images and labels into both-img-labels).
+
+For every image one <stem>.txt is written with one line per annotation:
+  class cx cy w h x1 y1 v1 ... x17 y17 v17
+where the bbox centre/size and keypoints are divided by the image's width/height,
+coordinates are written with 6 decimals and class/visibility as integers. This is the same
+text the CVAT export produces, so the output can be diffed against an old export.
+Images without annotations get an empty label file (background images), like CVAT does.
+
+Normalization runs in batched NumPy. Large sets are split into chunks and converted on a
+process pool (--processes, default one per CPU); --workers is only the number of threads that
+copy or link the images.
+
+Usage:
+python coco_to_yolo_pose.py --coco annotations_v4/merged_coco.json --images data_v4/merged --out yolopose_v4/ultralytics_yolo_pose_1.0_902/both-img-labels
+
+Then continue with split_img_txt_yolo.py as before. --link-mode hardlink avoids copying the images.
+"""
+
+import argparse
+import json
+import os
+import shutil
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from file_transfer import add_transfer_arguments, build_dir_index, transfer_files
+
+NUM_KEYPOINTS = 17
+CHUNK_SIZE = 2000
+# Below this many images a process pool costs more than it saves
+POOL_MIN_IMAGES = 5000
+
+def line_format(num_keypoints):
+    return "%d" + " %.6f" * 4 + " %.6f %.6f %d" * num_keypoints
+
+def convert_chunk(chunk, out_dir, num_keypoints=NUM_KEYPOINTS):
+    """
+    Write the label files of one chunk of images.
+    chunk is a list of (stem, width, height, class_ids, bboxes, keypoints) with
+    bboxes as (n, 4) COCO [x, y, w, h] and keypoints as (n, K*3) in pixels.
+    """
+    fmt = line_format(num_keypoints)
+    rows_per_image = [len(item[3]) for item in chunk]
+    if sum(rows_per_image):
+        class_ids = np.concatenate([np.asarray(item[3], dtype=np.float64) for item in chunk])
+        bboxes = np.concatenate([np.asarray(item[4], dtype=np.float64).reshape(-1, 4) for item in chunk])
+        kpts = np.concatenate([np.asarray(item[5], dtype=np.float64).reshape(-1, num_keypoints, 3) for item in chunk])
+        sizes = np.repeat(np.array([(item[1], item[2]) for item in chunk], dtype=np.float64), rows_per_image, axis=0)
+
+        # CVAT derives the box from the visible keypoints (falling back to the COCO bbox when
+        # none are visible) as x, y, w, h and converts it back to corners before normalizing.
+        # The exact same float operations are needed for byte-identical 6-decimal output.
+        visible = kpts[:, :, 2] > 0
+        has_visible = visible.any(axis=1)
+        x0 = np.where(has_visible, np.where(visible, kpts[:, :, 0], np.inf).min(axis=1), bboxes[:, 0])
+        y0 = np.where(has_visible, np.where(visible, kpts[:, :, 1], np.inf).min(axis=1), bboxes[:, 1])
+        x1 = np.where(has_visible, np.where(visible, kpts[:, :, 0], -np.inf).max(axis=1), bboxes[:, 0] + bboxes[:, 2])
+        y1 = np.where(has_visible, np.where(visible, kpts[:, :, 1], -np.inf).max(axis=1), bboxes[:, 1] + bboxes[:, 3])
+        x1 = x0 + (x1 - x0)
+        y1 = y0 + (y1 - y0)
+
+        rows = np.empty((len(bboxes), 5 + num_keypoints * 3), dtype=np.float64)
+        rows[:, 0] = class_ids
+        rows[:, 1] = (x0 + x1) / 2 / sizes[:, 0]
+        rows[:, 2] = (y0 + y1) / 2 / sizes[:, 1]
+        rows[:, 3] = (x1 - x0) / sizes[:, 0]
+        rows[:, 4] = (y1 - y0) / sizes[:, 1]
+        kpts[:, :, 0] /= sizes[:, None, 0]
+        kpts[:, :, 1] /= sizes[:, None, 1]
+        rows[:, 5:] = kpts.reshape(len(kpts), -1)
+    else:
+        rows = np.empty((0, 5 + num_keypoints * 3))
+
+    start = 0
+    for item, count in zip(chunk, rows_per_image):
+        lines = [fmt % tuple(row) for row in rows[start:start + count]]
+        start += count
+        with open(os.path.join(out_dir, item[0] + ".txt"), 'w') as f:
+            f.write(''.join(line + '\n' for line in lines))
+    return len(chunk), int(rows.shape[0])
+
+def build_chunks(coco, category_name, chunk_size=CHUNK_SIZE, num_keypoints=NUM_KEYPOINTS):
+    """Group annotations per image and cut the images into conversion chunks."""
+    categories = sorted(coco.get("categories", []), key=lambda c: c["id"])
+    class_ids = {c["id"]: i for i, c in enumerate(categories)}
+    pose_categories = {c["id"] for c in categories if category_name is None or c["name"] == category_name}
+    if not pose_categories:
+        raise ValueError(f"No category named '{category_name}' in the COCO file")
+
+    anns_by_image = defaultdict(list)
+    for ann in coco["annotations"]:
+        if ann["category_id"] in pose_categories and len(ann.get("keypoints", [])) == num_keypoints * 3:
+            anns_by_image[ann["image_id"]].append(ann)
+
+    chunks = [[]]
+    for img in coco["images"]:
+        anns = anns_by_image.get(img["id"], [])
+        stem = os.path.splitext(img["file_name"])[0]
+        chunks[-1].append((
+            stem, img["width"], img["height"],
+            [class_ids[ann["category_id"]] for ann in anns],
+            [ann["bbox"] for ann in anns],
+            [ann["keypoints"] for ann in anns],
+        ))
+        if len(chunks[-1]) >= chunk_size:
+            chunks.append([])
+    return [chunk for chunk in chunks if chunk], [c["name"] for c in categories]
+
+def convert_coco_to_yolo_pose(coco_file, out_dir, category_name="human", processes=None,
+                              num_keypoints=NUM_KEYPOINTS):
+    with open(coco_file, 'r') as f:
+        coco = json.load(f)
+    os.makedirs(out_dir, exist_ok=True)
+
+    chunks, names = build_chunks(coco, category_name, num_keypoints=num_keypoints)
+    n_images = sum(len(chunk) for chunk in chunks)
+
+    if n_images >= POOL_MIN_IMAGES and processes != 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(convert_chunk, chunks, [out_dir] * len(chunks),
+                                        [num_keypoints] * len(chunks)))
+    else:
+        results = [convert_chunk(chunk, out_dir, num_keypoints) for chunk in chunks]
+
+    n_objects = sum(objects for _, objects in results)
+    print(f"Wrote {n_images} label files / {n_objects} objects to {out_dir} (classes: {names})")
+    return coco
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert COCO keypoints to Ultralytics YOLO pose labels")
+    parser.add_argument("--coco", required=True, help="Merged COCO file, e.g. annotations_v4/merged_coco.json")
+    parser.add_argument("--out", required=True, help="Output folder (both-img-labels layout)")
+    parser.add_argument("--images", default=None,
+                        help="Folder with the images (e.g. data_v4/merged); they are placed next to the labels")
+    parser.add_argument("--category", default="human", help="Name of the keypoint category to export")
+    parser.add_argument("--num_keypoints", type=int, default=NUM_KEYPOINTS)
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                        help="Processes converting large sets (default: one per CPU)")
+    add_transfer_arguments(parser)
+    args = parser.parse_args()
+
+    coco = convert_coco_to_yolo_pose(args.coco, args.out, args.category, args.processes, args.num_keypoints)
+
+    if args.images:
+        image_index = build_dir_index([args.images])
+        pairs = []
+        for img in coco["images"]:
+            if img["file_name"] in image_index:
+                pairs.append((image_index[img["file_name"]], os.path.join(args.out, img["file_name"])))
+            else:
+                print(f"Warning: Image file {img['file_name']} not found in {args.images}")
+        transfer_files(pairs, args.link_mode, shutil.copy2, args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+dedup_frames.py
+
+Drops near-duplicate frames from a merged COCO file. Consecutive frames of the same clip
+(e.g. 52723_8_19.jpg, 52723_8_20.jpg, 52723_8_21.jpg) are often almost identical and cost
+full epoch time without adding signal.
+
+Every image gets a 64-bit perceptual difference hash (dHash). Frames are compared only within
+their video group (same grouping as split_train_val_test.get_video_id_from_filename), in frame
+order: a frame is dropped when an already kept frame of the same video is within
+--max_distance bits (Hamming distance). Kept hashes of each video live in a BK-tree, so a lookup
+only visits a small part of the video's frames instead of comparing against all of them.
+
+Writes the pruned COCO file (dropped images and their annotations removed, IDs unchanged)
+and a CSV report listing every dropped frame, the kept frame it duplicates and the distance.
+
+Usage:
+python dedup_frames.py --coco annotations_v4/merged_coco.json --images data_v4/merged --out annotations_v4/merged_dedup_coco.json --max_distance 4
+"""
+
+import argparse
+import csv
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from split_train_val_test import frame_number, get_video_id_from_filename
+
+def dhash(image_path, hash_size=8):
+    """64-bit difference hash: is each pixel brighter than its right neighbour on a 9x8 thumbnail."""
+    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError(f"could not read {image_path}")
+    small = cv2.resize(img, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes with Hamming distance."""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        node = [value, item, {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            d = hamming(value, current[0])
+            child = current[2].get(d)
+            if child is None:
+                current[2][d] = node
+                return
+            current = child
+
+    def find_within(self, value, max_distance):
+        """Closest (distance, item) with distance <= max_distance, or None."""
+        if self.root is None:
+            return None
+        best = None
+        pending = [self.root]
+        while pending:
+            node = pending.pop()
+            d = hamming(value, node[0])
+            if d <= max_distance and (best is None or d < best[0]):
+                best = (d, node[1])
+            # Triangle inequality: only children at distance d +- max_distance can match
+            for child_d, child in node[2].items():
+                if d - max_distance <= child_d <= d + max_distance:
+                    pending.append(child)
+        return best
+
+def find_duplicates(images, image_dir, max_distance, workers=8):
+    """Return {image_id: (kept_file_name, distance)} for every frame to drop."""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        hashes = list(executor.map(lambda img: dhash(os.path.join(image_dir, img["file_name"])), images))
+
+    videos = defaultdict(list)
+    for img, h in zip(images, hashes):
+        videos[get_video_id_from_filename(img["file_name"])].append((frame_number(img["file_name"]), img, h))
+
+    dropped = {}
+    for frames in videos.values():
+        tree = BKTree()
+        for _, img, h in sorted(frames, key=lambda frame: (frame[0], frame[1]["file_name"])):
+            match = tree.find_within(h, max_distance)
+            if match is None:
+                tree.add(h, img["file_name"])
+            else:
+                dropped[img["id"]] = (match[1], match[0])
+    return dropped, len(videos)
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop near-duplicate frames within each video")
+    parser.add_argument("--coco", required=True, help="Merged COCO file, e.g. annotations_v4/merged_coco.json")
+    parser.add_argument("--images", required=True, help="Folder with the images, e.g. data_v4/merged")
+    parser.add_argument("--out", required=True, help="Pruned COCO file to write")
+    parser.add_argument("--report", default=None, help="CSV report of dropped frames (default: <out>.dropped.csv)")
+    parser.add_argument("--max_distance", type=int, default=4,
+                        help="Max Hamming distance (of 64 bits) between hashes to count as a duplicate")
+    parser.add_argument("--workers", type=int, default=8, help="Hashing threads")
+    args = parser.parse_args()
+
+    with open(args.coco, 'r') as f:
+        coco = json.load(f)
+
+    dropped, n_videos = find_duplicates(coco["images"], args.images, args.max_distance, args.workers)
+
+    pruned = dict(coco)
+    pruned["images"] = [img for img in coco["images"] if img["id"] not in dropped]
+    pruned["annotations"] = [ann for ann in coco["annotations"] if ann["image_id"] not in dropped]
+    with open(args.out, 'w') as f:
+        json.dump(pruned, f)
+
+    report_file = args.report or os.path.splitext(args.out)[0] + ".dropped.csv"
+    with open(report_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["file_name", "video_id", "duplicate_of", "distance"])
+        for img in coco["images"]:
+            if img["id"] in dropped:
+                kept, distance = dropped[img["id"]]
+                writer.writerow([img["file_name"], get_video_id_from_filename(img["file_name"]), kept, distance])
+
+    print(f"Checked {len(coco['images'])} images in {n_videos} videos (max distance {args.max_distance})")
+    print(f"Dropped {len(dropped)} near-duplicate frames, report: {report_file}")
+    print(f"Pruned annotations written to: {args.out}")
+    print(f"Total images: {len(pruned['images'])}, total annotations: {len(pruned['annotations'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+eval_keypoints.py
+
+Evaluates keypoint predictions against a ground-truth COCO file (e.g. test_coco.json from
+split_train_val_test.py) with the COCO keypoint metrics: AP, AP50, AP75, AR, AR50, AR75 over
+OKS thresholds 0.50:0.05:0.95, using the COCO person keypoint sigmas, the same matching
+(greedy by score, max 20 detections per image) and the 101-point interpolated precision, so
+the numbers line up with pycocotools (area range "all").
+
+The OKS of every prediction / ground-truth pair of the whole set is computed in one vectorized
+NumPy pass (pairs x 17 keypoints) instead of per-pair Python loops; only the greedy matching
+runs per image, vectorized over the 10 thresholds.
+
+On top of AP/AR:
+  per keypoint   pixel error, error relative to the person scale (sqrt of the ground-truth area),
+                 keypoint similarity (the per-keypoint OKS term) and the share of labeled keypoints
+                 the prediction left out (0 0 0), for the pairs matched at OKS 0.5; shoulders, hips
+                 and knees (what matters for lumbar errors) are also summarized as groups
+  per class      AP/AR on the frames of each class (--classes correct=export.json lumbar=export.json)
+
+Predictions: a COCO keypoint file (infer_onnx.py output; images matched to the ground truth by
+file name) or a COCO results list ([{"image_id", "keypoints", "score"}, ...] with ground-truth
+image ids). Annotations need a "score". Run infer_onnx.py with --kpt_conf 0 for evaluation,
+otherwise keypoints below its threshold are written as 0 0 0 and count as misses here.
+
+Usage:
+python infer_onnx.py --weights runs/pose/train22/weights/best.pt --images yolopose_v4/data/images/test --ref_coco annotations_v4/split/test_coco.json --kpt_conf 0 --out predictions_test.json
+python eval_keypoints.py --gt annotations_v4/split/test_coco.json --pred predictions_test.json
+python eval_keypoints.py --gt annotations_v4/split/test_coco.json --pred predictions_test.json --classes correct=annotations_v4/correct-phase-I-578Done-Mar14.json lumbar=annotations_v4/lumbar-phase-I-322Done-Mar14.json --csv eval_test.csv
+"""
+
+import argparse
+import csv
+import json
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from keypoint_store import class_by_file_name
+
+# COCO person keypoint sigmas (nose, eyes, ears, shoulders, elbows, wrists, hips, knees, ankles)
+COCO_SIGMAS = np.array([.26, .25, .25, .35, .35, .79, .79, .72, .72, .62, .62, 1.07, 1.07, .87, .87, .89, .89]) / 10.0
+OKS_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+RECALL_THRESHOLDS = np.linspace(0.0, 1.00, 101)
+MAX_DETS = 20
+# Keypoint groups reported separately (indices of the COCO 17-keypoint layout)
+KEYPOINT_GROUPS = {"shoulders": [5, 6], "hips": [11, 12], "knees": [13, 14]}
+
+def load_predictions(pred_file, gt):
+    """Prediction annotations with ground-truth image ids; predictions of unknown images are dropped."""
+    with open(pred_file, 'r') as f:
+        pred = json.load(f)
+    if isinstance(pred, list):
+        return pred
+    gt_ids = {img["file_name"]: img["id"] for img in gt["images"]}
+    pred_ids = {img["id"]: gt_ids.get(img["file_name"]) for img in pred["images"]}
+    return [dict(ann, image_id=pred_ids[ann["image_id"]]) for ann in pred["annotations"]
+            if pred_ids.get(ann["image_id"]) is not None]
+
+def group_by_image(annotations, image_ids):
+    per_image = defaultdict(list)
+    for i, ann in enumerate(annotations):
+        if ann["image_id"] in image_ids:
+            per_image[ann["image_id"]].append(i)
+    return per_image
+
+def prepare_gt(annotations, image_ids, num_keypoints):
+    """Arrays of all ground-truth people and {image_id: row indices}, matchable ground truth first."""
+    keypoints = np.array([ann["keypoints"] for ann in annotations], dtype=np.float64).reshape(-1, num_keypoints, 3)
+    labeled = (keypoints[:, :, 2] > 0).sum(axis=1)
+    crowd = np.array([bool(ann.get("iscrowd", 0)) for ann in annotations], dtype=bool)
+    # pycocotools ignores people by their num_keypoints field
+    num_labeled = np.array([ann.get("num_keypoints", n) for ann, n in zip(annotations, labeled)])
+    arrays = {
+        "keypoints": keypoints,
+        "bbox": np.array([ann["bbox"] for ann in annotations], dtype=np.float64).reshape(-1, 4),
+        "area": np.array([ann["area"] for ann in annotations], dtype=np.float64),
+        "crowd": crowd,
+        "ignore": crowd | (num_labeled == 0),
+    }
+    rows = {image_id: np.array(sorted(indices, key=lambda i: arrays["ignore"][i]))
+            for image_id, indices in group_by_image(annotations, image_ids).items()}
+    return arrays, rows
+
+def prepare_pred(annotations, image_ids, num_keypoints):
+    """Arrays of all predicted people and {image_id: row indices}, highest score first, at most MAX_DETS."""
+    arrays = {
+        "keypoints": np.array([ann["keypoints"] for ann in annotations], dtype=np.float64).reshape(-1, num_keypoints, 3),
+        "score": np.array([ann["score"] for ann in annotations], dtype=np.float64),
+    }
+    scores = arrays["score"]
+    rows = {image_id: np.array(sorted(indices, key=lambda i: -scores[i])[:MAX_DETS])
+            for image_id, indices in group_by_image(annotations, image_ids).items()}
+    return arrays, rows
+
+def compute_oks_pairs(pred_kpts, gt_kpts, gt_bbox, gt_area, sigmas):
+    """
+    OKS of P (prediction, ground truth) pairs, all arrays stacked per pair.
+    Returns (oks (P,), per-keypoint similarity (P, K)).
+    """
+    variances = (sigmas * 2) ** 2
+    visible = gt_kpts[:, :, 2] > 0
+    dx = pred_kpts[:, :, 0] - gt_kpts[:, :, 0]
+    dy = pred_kpts[:, :, 1] - gt_kpts[:, :, 1]
+    # Ground truth without labeled keypoints: distance to a box twice the size of the bbox (pycocotools)
+    x0 = gt_bbox[:, 0:1] - gt_bbox[:, 2:3]
+    x1 = gt_bbox[:, 0:1] + gt_bbox[:, 2:3] * 2
+    y0 = gt_bbox[:, 1:2] - gt_bbox[:, 3:4]
+    y1 = gt_bbox[:, 1:2] + gt_bbox[:, 3:4] * 2
+    unlabeled = ~visible.any(axis=1)
+    if unlabeled.any():
+        zero = np.zeros_like(dx[unlabeled])
+        px, py = pred_kpts[unlabeled, :, 0], pred_kpts[unlabeled, :, 1]
+        dx[unlabeled] = np.maximum(zero, x0[unlabeled] - px) + np.maximum(zero, px - x1[unlabeled])
+        dy[unlabeled] = np.maximum(zero, y0[unlabeled] - py) + np.maximum(zero, py - y1[unlabeled])
+    e = (dx ** 2 + dy ** 2) / variances / (gt_area[:, None] + np.spacing(1)) / 2
+    similarity = np.exp(-e)
+    counted = visible | unlabeled[:, None]
+    oks = (similarity * counted).sum(axis=1) / counted.sum(axis=1)
+    return oks, similarity
+
+def match_image(oks, gt_ignore, gt_crowd):
+    """
+    Greedy COCO matching of one image for all OKS thresholds at once.
+    oks (D, G), predictions sorted by score. Returns (matched gt index (T, D), -1 = none; ignored (T, D)).
+    """
+    num_t, (num_d, num_g) = len(OKS_THRESHOLDS), oks.shape
+    matches = np.full((num_t, num_d), -1)
+    ignored = np.zeros((num_t, num_d), dtype=bool)
+    if num_g == 0:
+        return matches, ignored
+    thresholds = np.minimum(OKS_THRESHOLDS, 1 - 1e-10)[:, None]
+    if num_g == 1 and not gt_crowd[0]:
+        # One person per frame (the usual case): the best-scored prediction above each threshold takes it
+        above = oks[:, 0][None, :] >= thresholds
+        found = np.flatnonzero(above.any(axis=1))
+        first = above.argmax(axis=1)[found]
+        matches[found, first] = 0
+        ignored[found, first] = gt_ignore[0]
+        return matches, ignored
+    gt_taken = np.zeros((num_t, num_g), dtype=bool)
+    for d in range(num_d):
+        eligible = (oks[d][None, :] >= thresholds) & ~(gt_taken & ~gt_crowd[None, :])
+        # A matchable ground truth always wins over an ignored one
+        eligible_matchable = eligible & ~gt_ignore[None, :]
+        eligible = np.where(eligible_matchable.any(axis=1, keepdims=True), eligible_matchable, eligible)
+        candidates = np.where(eligible, oks[d][None, :], -np.inf)
+        # Ties go to the last ground truth, as in pycocotools
+        best = num_g - 1 - np.argmax(candidates[:, ::-1], axis=1)
+        found = eligible.any(axis=1)
+        matches[found, d] = best[found]
+        ignored[found, d] = gt_ignore[best[found]]
+        gt_taken[np.flatnonzero(found), best[found]] = True
+    return matches, ignored
+
+def accumulate(results, image_ids):
+    """COCO AP/AR over the given images from per-image match results."""
+    scores, tps, ignored, num_gt = [], [], [], 0
+    for image_id in image_ids:
+        result = results.get(image_id)
+        if result is None:
+            continue
+        num_gt += result["num_gt"]
+        if len(result["scores"]):
+            scores.append(result["scores"])
+            tps.append(result["matches"] >= 0)
+            ignored.append(result["ignored"])
+    stats = {"AP": -1.0, "AP50": -1.0, "AP75": -1.0, "AR": -1.0, "AR50": -1.0, "AR75": -1.0, "gt": num_gt}
+    if num_gt == 0:
+        return stats
+    if not scores:
+        return dict(stats, AP=0.0, AP50=0.0, AP75=0.0, AR=0.0, AR50=0.0, AR75=0.0)
+    scores = np.concatenate(scores)
+    order = np.argsort(-scores, kind='mergesort')
+    tps = np.concatenate(tps, axis=1)[:, order]
+    ignored = np.concatenate(ignored, axis=1)[:, order]
+    tp_sum = np.cumsum(tps & ~ignored, axis=1).astype(np.float64)
+    fp_sum = np.cumsum(~tps & ~ignored, axis=1).astype(np.float64)
+    recall = tp_sum / num_gt
+    precision = tp_sum / (fp_sum + tp_sum + np.spacing(1))
+    # Precision envelope (monotonically decreasing), then sampled at the 101 recall points
+    precision = np.maximum.accumulate(precision[:, ::-1], axis=1)[:, ::-1]
+    ap = np.zeros(len(OKS_THRESHOLDS))
+    for t in range(len(OKS_THRESHOLDS)):
+        idx = np.searchsorted(recall[t], RECALL_THRESHOLDS, side='left')
+        valid = idx < recall.shape[1]
+        ap[t] = precision[t][idx[valid]].sum() / len(RECALL_THRESHOLDS)
+    ar = recall[:, -1]
+    return dict(stats, AP=ap.mean(), AP50=ap[0], AP75=ap[5], AR=ar.mean(), AR50=ar[0], AR75=ar[5])
+
+def evaluate(gt, predictions, sigmas=COCO_SIGMAS):
+    """Per-image match results and per-keypoint errors of the pairs matched at OKS 0.5."""
+    num_keypoints = len(sigmas)
+    image_ids = {img["id"] for img in gt["images"]}
+    gt_arrays, gt_rows = prepare_gt(gt["annotations"], image_ids, num_keypoints)
+    pred_arrays, pred_rows = prepare_pred(predictions, image_ids, num_keypoints)
+
+    # Every (prediction, ground truth) pair of the same image, stacked for one OKS pass
+    pair_pred, pair_gt, offsets = [], [], {}
+    for image_id, d_rows in pred_rows.items():
+        if image_id in gt_rows:
+            offsets[image_id] = len(pair_pred)
+            g_rows = gt_rows[image_id].tolist()
+            for d in d_rows.tolist():
+                pair_pred.extend([d] * len(g_rows))
+                pair_gt.extend(g_rows)
+    pair_pred, pair_gt = np.array(pair_pred, dtype=np.int64), np.array(pair_gt, dtype=np.int64)
+    oks, _ = compute_oks_pairs(pred_arrays["keypoints"][pair_pred], gt_arrays["keypoints"][pair_gt],
+                               gt_arrays["bbox"][pair_gt], gt_arrays["area"][pair_gt], sigmas)
+
+    results = {}
+    matched_pred, matched_gt = [], []
+    empty = np.zeros((len(OKS_THRESHOLDS), 0), dtype=bool)
+    for image_id in sorted(image_ids):
+        g_rows = gt_rows.get(image_id, np.zeros(0, dtype=np.int64))
+        num_gt = int((~gt_arrays["ignore"][g_rows]).sum())
+        d_rows = pred_rows.get(image_id)
+        if d_rows is None:
+            results[image_id] = {"num_gt": num_gt, "scores": np.zeros(0), "matches": empty.astype(int), "ignored": empty}
+            continue
+        if len(g_rows):
+            start = offsets[image_id]
+            image_oks = oks[start:start + len(d_rows) * len(g_rows)].reshape(len(d_rows), len(g_rows))
+            matches, ignored = match_image(image_oks, gt_arrays["ignore"][g_rows], gt_arrays["crowd"][g_rows])
+            matched = (matches[0] >= 0) & ~ignored[0]
+            matched_pred.extend(d_rows[matched].tolist())
+            matched_gt.extend(g_rows[matches[0][matched]].tolist())
+        else:
+            matches = np.full((len(OKS_THRESHOLDS), len(d_rows)), -1)
+            ignored = np.zeros_like(matches, dtype=bool)
+        results[image_id] = {"num_gt": num_gt, "scores": pred_arrays["score"][d_rows], "matches": matches,
+                             "ignored": ignored}
+
+    errors = keypoint_errors(pred_arrays["keypoints"][matched_pred], gt_arrays["keypoints"][matched_gt],
+                             gt_arrays["area"][matched_gt], sigmas)
+    return results, errors
+
+def keypoint_errors(pred_kpts, gt_kpts, gt_area, sigmas):
+    """Per-keypoint error arrays of matched pairs, NaN where the keypoint is not labeled."""
+    labeled = gt_kpts[:, :, 2] > 0
+    missing = (pred_kpts[:, :, 0] == 0) & (pred_kpts[:, :, 1] == 0)
+    distance = np.linalg.norm(pred_kpts[:, :, :2] - gt_kpts[:, :, :2], axis=2)
+    scale = np.sqrt(np.maximum(gt_area, 1.0))[:, None]
+    similarity = np.exp(-distance ** 2 / ((sigmas * 2) ** 2) / (gt_area[:, None] + np.spacing(1)) / 2)
+    found = labeled & ~missing
+    return {
+        "labeled": labeled.sum(axis=0),
+        "missing": (labeled & missing).sum(axis=0),
+        "pixel_error": np.where(found, distance, np.nan),
+        "relative_error": np.where(found, distance / scale, np.nan),
+        "similarity": np.where(labeled, similarity, np.nan),
+    }
+
+def keypoint_rows(errors, keypoint_names):
+    rows = []
+    groups = [(name, [i]) for i, name in enumerate(keypoint_names)] + list(KEYPOINT_GROUPS.items())
+    for name, indices in groups:
+        labeled = int(errors["labeled"][indices].sum())
+        if labeled == 0:
+            rows.append({"keypoint": name, "labeled": 0})
+            continue
+        pixel = errors["pixel_error"][:, indices]
+        found = ~np.isnan(pixel)
+        rows.append({
+            "keypoint": name,
+            "labeled": labeled,
+            "missing_pct": 100.0 * errors["missing"][indices].sum() / labeled,
+            "mean_px": float(np.nanmean(pixel)) if found.any() else float('nan'),
+            "median_px": float(np.nanmedian(pixel)) if found.any() else float('nan'),
+            "mean_rel": float(np.nanmean(errors["relative_error"][:, indices])) if found.any() else float('nan'),
+            "similarity": float(np.nanmean(errors["similarity"][:, indices])),
+        })
+    return rows
+
+def format_stats(name, stats):
+    return (f"{name:<12} {stats['AP']:>6.3f} {stats['AP50']:>6.3f} {stats['AP75']:>6.3f} "
+            f"{stats['AR']:>6.3f} {stats['AR50']:>6.3f} {stats['AR75']:>6.3f} {stats['gt']:>6}")
+
+def main():
+    parser = argparse.ArgumentParser(description="COCO OKS keypoint AP/AR with per-keypoint and per-class breakdown")
+    parser.add_argument("--gt", required=True, help="Ground-truth COCO file, e.g. test_coco.json")
+    parser.add_argument("--pred", required=True, help="Predictions: COCO file (infer_onnx.py) or COCO results list")
+    parser.add_argument("--classes", nargs='*', default=[],
+                        help="name=export.json per class; a frame gets the class of the export that contains it")
+    parser.add_argument("--csv", default=None, help="Write the per-keypoint table to this CSV")
+    args = parser.parse_args()
+
+    with open(args.gt, 'r') as f:
+        gt = json.load(f)
+    predictions = load_predictions(args.pred, gt)
+    category = gt["categories"][0] if gt.get("categories") else {}
+    keypoint_names = category.get("keypoints") or [str(i) for i in range(len(COCO_SIGMAS))]
+    if len(keypoint_names) != len(COCO_SIGMAS):
+        parser.error(f"{args.gt} has {len(keypoint_names)} keypoints; the COCO sigmas are defined for {len(COCO_SIGMAS)}")
+
+    start = time.perf_counter()
+    results, errors = evaluate(gt, predictions)
+    all_ids = [img["id"] for img in gt["images"]]
+    summary = [("all", accumulate(results, all_ids))]
+    if args.classes:
+        class_files = []
+        for item in args.classes:
+            name, sep, path = item.partition('=')
+            if not sep:
+                parser.error(f"--classes expects name=file, got '{item}'")
+            class_files.append((name, path))
+        file_classes = class_by_file_name(class_files)
+        for i, (name, _) in enumerate(class_files):
+            ids = [img["id"] for img in gt["images"] if file_classes.get(img["file_name"]) == i]
+            summary.append((name, accumulate(results, ids)))
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(gt['images'])} images, {len(gt['annotations'])} ground-truth and {len(predictions)} predicted people "
+          f"(evaluated in {elapsed * 1000:.1f} ms)")
+    print(f"{'':<12} {'AP':>6} {'AP50':>6} {'AP75':>6} {'AR':>6} {'AR50':>6} {'AR75':>6} {'gt':>6}")
+    for name, stats in summary:
+        print(format_stats(name, stats))
+
+    rows = keypoint_rows(errors, keypoint_names)
+    print(f"\nPer keypoint ({len(errors['pixel_error'])} people matched at OKS 0.5):")
+    print(f"{'keypoint':<16} {'labeled':>7} {'missing%':>8} {'mean px':>8} {'median px':>9} {'rel err':>8} {'OKS term':>8}")
+    for i, row in enumerate(rows):
+        if i == len(keypoint_names):
+            print("-" * 70)
+        if row["labeled"] == 0:
+            print(f"{row['keypoint']:<16} {0:>7}")
+            continue
+        print(f"{row['keypoint']:<16} {row['labeled']:>7} {row['missing_pct']:>8.1f} {row['mean_px']:>8.1f} "
+              f"{row['median_px']:>9.1f} {row['mean_rel']:>8.3f} {row['similarity']:>8.3f}")
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=["keypoint", "labeled", "missing_pct", "mean_px", "median_px",
+                                                   "mean_rel", "similarity"])
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({key: round(value, 4) if isinstance(value, float) else value for key, value in row.items()})
+        print(f"Per-keypoint table written to: {args.csv}")
+
+if __name__ == "__main__":
+    main()
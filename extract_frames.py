@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+extract_frames.py
+
+Extracts frames from the source videos straight into a data_vN/<task> folder, named like the
+rest of the dataset: <subject>_<clip>_<frame>.jpg (e.g. 52723_8.mp4, frame 10 -> 52723_8_10.jpg).
+The video file name without extension is taken as <subject>_<clip>.
+
+Which frames:
+  --frames 10 12 19-21      the same frame numbers from every video
+  --frames_file wanted.txt  image names, one per line (e.g. 52723_8_10.jpg); each video gets its own frames
+  --stride 5                every 5th frame (optionally within --start / --end)
+
+Only the wanted frames are decoded: the reader seeks to a frame when it is more than --seek_gap
+frames ahead and otherwise just grabs (demuxes without converting) the frames in between, which
+is cheaper than a seek for nearby frames. Reading runs on one thread per video (--readers) and
+JPEG encoding + writing on a separate pool (--encoders), connected by a bounded queue, so decoding
+the next frame never waits for the disk.
+
+Existing images are kept unless --overwrite is given.
+
+Usage:
+python extract_frames.py --videos videos/52723_8.mp4 --frames 10 12 19-21 --out data_v5/img-correct-phase-II
+python extract_frames.py --videos videos/ --frames_file wanted_frames.txt --out data_v5/img-lumbar-phase-II
+python extract_frames.py --videos videos/ --stride 5 --start 0 --end 300 --out data_v5/img-correct-phase-II --quality 95
+"""
+
+import argparse
+import os
+import queue
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v')
+# A seek jumps to the previous keyframe and decodes forward; closer than this, grabbing is cheaper
+DEFAULT_SEEK_GAP = 30
+
+def parse_frame_spec(items):
+    """["10", "12", "19-21"] -> [10, 12, 19, 20, 21]"""
+    frames = set()
+    for item in items:
+        for part in item.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if '-' in part:
+                first, last = part.split('-', 1)
+                frames.update(range(int(first), int(last) + 1))
+            else:
+                frames.add(int(part))
+    return sorted(frames)
+
+def read_frames_file(frames_file):
+    """Image names (one per line) -> {video stem: [frame numbers]}"""
+    wanted = defaultdict(set)
+    with open(frames_file, 'r') as f:
+        for line in f:
+            name = os.path.splitext(os.path.basename(line.strip()))[0]
+            if not name:
+                continue
+            stem, _, frame = name.rpartition('_')
+            if not stem or not frame.isdigit():
+                print(f"Warning: skipping '{line.strip()}', expected <subject>_<clip>_<frame>.jpg")
+                continue
+            wanted[stem].add(int(frame))
+    return {stem: sorted(frames) for stem, frames in wanted.items()}
+
+def find_videos(paths):
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            videos.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                          if name.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            videos.append(path)
+    return videos
+
+def read_wanted_frames(video_path, frames, seek_gap, put):
+    """Decode only the given (sorted) frame numbers of a video; put(frame_number, image) for each."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"could not open {video_path}")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+    position = 0    # number of the frame the next read() returns
+    missing = []
+    try:
+        for frame_number in frames:
+            if total is not None and frame_number >= total:
+                missing.append(frame_number)
+                continue
+            if frame_number < position or frame_number - position > seek_gap:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+                position = frame_number
+            while position < frame_number:
+                if not cap.grab():
+                    break
+                position += 1
+            ok, image = cap.read() if position == frame_number else (False, None)
+            if not ok:
+                missing.append(frame_number)
+                continue
+            position += 1
+            put(frame_number, image)
+    finally:
+        cap.release()
+    return missing
+
+def extract_frames(jobs, out_dir, seek_gap=DEFAULT_SEEK_GAP, readers=2, encoders=4, quality=95, overwrite=False):
+    """
+    jobs: list of (video_path, sorted frame numbers). Writes <video stem>_<frame>.jpg into out_dir.
+    Returns (written, skipped_existing, {video: missing frame numbers}).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    frames_queue = queue.Queue(maxsize=encoders * 4)
+    counts = {"written": 0, "skipped": 0}
+    counts_lock = threading.Lock()
+    errors = []
+
+    def encode_and_write():
+        encode_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        while True:
+            item = frames_queue.get()
+            if item is None:
+                return
+            out_file, image = item
+            try:
+                ok, buffer = cv2.imencode('.jpg', image, encode_params)
+                if not ok:
+                    raise ValueError(f"could not encode {out_file}")
+                tmp_file = out_file + ".tmp"
+                with open(tmp_file, 'wb') as f:
+                    f.write(buffer.tobytes())
+                os.replace(tmp_file, out_file)
+                with counts_lock:
+                    counts["written"] += 1
+            except Exception as e:
+                errors.append(e)
+
+    writers = [threading.Thread(target=encode_and_write, daemon=True) for _ in range(max(1, encoders))]
+    for writer in writers:
+        writer.start()
+
+    def read_video(job):
+        video_path, frames = job
+        stem = os.path.splitext(os.path.basename(video_path))[0]
+        todo = []
+        for frame_number in frames:
+            if not overwrite and os.path.exists(os.path.join(out_dir, f"{stem}_{frame_number}.jpg")):
+                with counts_lock:
+                    counts["skipped"] += 1
+            else:
+                todo.append(frame_number)
+        if not todo:
+            return video_path, []
+        put = lambda frame_number, image: frames_queue.put((os.path.join(out_dir, f"{stem}_{frame_number}.jpg"), image))
+        return video_path, read_wanted_frames(video_path, todo, seek_gap, put)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, readers)) as executor:
+            missing = dict(executor.map(read_video, jobs))
+    finally:
+        for _ in writers:
+            frames_queue.put(None)
+        for writer in writers:
+            writer.join()
+    if errors:
+        raise errors[0]
+    return counts["written"], counts["skipped"], {video: frames for video, frames in missing.items() if frames}
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract selected video frames as <subject>_<clip>_<frame>.jpg")
+    parser.add_argument("--videos", nargs='+', required=True, help="Video files or folders with videos")
+    parser.add_argument("--out", required=True, help="Output folder, e.g. data_v5/img-correct-phase-II")
+    which = parser.add_mutually_exclusive_group(required=True)
+    which.add_argument("--frames", nargs='+', help="Frame numbers / ranges for every video, e.g. 10 12 19-21")
+    which.add_argument("--frames_file", help="Text file with wanted image names, e.g. 52723_8_10.jpg per line")
+    which.add_argument("--stride", type=int, help="Take every N-th frame")
+    parser.add_argument("--start", type=int, default=0, help="First frame for --stride")
+    parser.add_argument("--end", type=int, default=None, help="Stop before this frame for --stride (default: video end)")
+    parser.add_argument("--seek_gap", type=int, default=DEFAULT_SEEK_GAP,
+                        help="Seek when the next wanted frame is more than this many frames ahead, else grab forward")
+    parser.add_argument("--readers", type=int, default=2, help="Videos decoded at the same time")
+    parser.add_argument("--encoders", type=int, default=4, help="JPEG encode/write threads")
+    parser.add_argument("--quality", type=int, default=95, help="JPEG quality")
+    parser.add_argument("--overwrite", action="store_true", help="Re-extract frames that already exist")
+    args = parser.parse_args()
+
+    videos = find_videos(args.videos)
+    jobs = []
+    if args.frames_file:
+        wanted = read_frames_file(args.frames_file)
+        by_stem = {os.path.splitext(os.path.basename(video))[0]: video for video in videos}
+        for stem, frames in sorted(wanted.items()):
+            if stem in by_stem:
+                jobs.append((by_stem[stem], frames))
+            else:
+                print(f"Warning: no video for {stem} ({len(frames)} frames wanted)")
+    else:
+        for video in videos:
+            if args.frames:
+                frames = parse_frame_spec(args.frames)
+            else:
+                end = args.end
+                if end is None:
+                    cap = cv2.VideoCapture(video)
+                    end = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+                    cap.release()
+                frames = list(range(args.start, end, args.stride))
+            jobs.append((video, frames))
+
+    written, skipped, missing = extract_frames(jobs, args.out, args.seek_gap, args.readers, args.encoders,
+                                               args.quality, args.overwrite)
+    for video, frames in missing.items():
+        print(f"Warning: {video}: {len(frames)} frames could not be read (e.g. {frames[:5]})")
+    print(f"Videos: {len(jobs)}, frames written: {written}, already present: {skipped}")
+    print(f"Frames written to: {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+file_transfer.py
+
+Shared helpers for materializing dataset files (images and YOLO labels) into another folder,
+used by select_and_copy_images.py and split_img_txt_yolo.py.
+
+Every dataset version used to be stored two or three times on disk (data_vN/<task>,
+data_vN/merged, yolopose_vN/data/images/{train,val,test}). Instead of a full byte copy,
+files can be materialized with --link-mode:
+
+  copy      full byte copy (default, same behaviour as before)
+  hardlink  another directory entry for the same file; no extra space, same filesystem only
+  reflink   copy-on-write clone (btrfs, XFS, bcachefs on Linux); no extra space until edited
+  symlink   symbolic link back to the source file
+
+If the filesystem (or OS) can't do the requested mode, the file is copied instead and a
+single warning is printed per destination folder.
+
+Bulk transfers go through transfer_files(): source folders are indexed once with one
+os.scandir() per directory (instead of an os.path.exists() probe per file), files are
+transferred on a bounded thread pool (--workers), and progress is reported on one
+aggregated line instead of one print per file. This matters most on network drives,
+where each metadata round trip is expensive.
+
+NOTE: with hardlink/symlink the destination shares its content with the source, so a tool
+that rewrites a file in place also changes the source. Tools that replace files atomically
+(write a temp file, then rename) only change the destination.
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LINK_MODES = ('copy', 'hardlink', 'reflink', 'symlink')
+
+# ioctl number of FICLONE (linux/fs.h)
+FICLONE = 0x40049409
+
+# Network drives are latency bound, so use more threads than cores (same rule as ThreadPoolExecutor)
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+PROGRESS_INTERVAL = 0.5
+
+# (link_mode, destination folder) pairs where linking already failed once
+_unsupported = set()
+_unsupported_lock = threading.Lock()
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Hex sha256 of a file's content, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def add_transfer_arguments(parser):
+    parser.add_argument("--link-mode", choices=LINK_MODES, default='copy',
+                        help="How to materialize files in the destination: full copy (default), "
+                             "hardlink, reflink (copy-on-write clone) or symlink. "
+                             "Falls back to copy when the filesystem can't do it.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Number of parallel file transfers (default: {DEFAULT_WORKERS})")
+
+def build_dir_index(dirs, recursive=True):
+    """
+    Map file name -> full path for every file under dirs, using one os.scandir() per directory.
+    If a name appears more than once, the last one found wins (like copying them in order would).
+    """
+    index = {}
+    pending = list(reversed(dirs))
+    while pending:
+        directory = pending.pop()
+        with os.scandir(directory) as entries:
+            subdirs = []
+            for entry in entries:
+                if entry.is_dir():
+                    subdirs.append(entry.path)
+                else:
+                    index[entry.name] = entry.path
+        if recursive:
+            pending.extend(reversed(sorted(subdirs)))
+    return index
+
+def _reflink(src, dst):
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "reflink is only supported on Linux here")
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    # A clone is a separate inode: keep the times but not the mode (image_store.py blobs are read-only)
+    st = os.stat(src)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+def _symlink_target(src, dst):
+    # Relative links keep working when the whole Fine-Tune folder is moved
+    try:
+        return os.path.relpath(src, os.path.dirname(os.path.abspath(dst)))
+    except ValueError:
+        # Different drives on Windows
+        return os.path.abspath(src)
+
+def link_or_copy(src, dst, link_mode='copy', copy_function=shutil.copy2):
+    """
+    Materialize src at dst using link_mode, falling back to copy_function.
+    Returns the mode that was actually used ('copy' after a fallback).
+    """
+    # dst may be the source itself (e.g. a source folder that contains the target folder);
+    # removing it below would delete the only copy. A previous link to src is fine to replace.
+    dst_entry = os.path.join(os.path.realpath(os.path.dirname(os.path.abspath(dst))), os.path.basename(dst))
+    if os.path.lexists(dst) and os.path.normcase(os.path.realpath(src)) == os.path.normcase(dst_entry):
+        raise shutil.SameFileError(f"{src} and {dst} are the same file")
+
+    # Never write through an old link: a previous run may have linked dst to src
+    try:
+        os.remove(dst)
+    except FileNotFoundError:
+        pass
+
+    dst_dir = os.path.dirname(os.path.abspath(dst))
+    if link_mode == 'copy' or (link_mode, dst_dir) in _unsupported:
+        copy_function(src, dst)
+        return 'copy'
+
+    try:
+        if link_mode == 'hardlink':
+            os.link(src, dst)
+        elif link_mode == 'symlink':
+            os.symlink(_symlink_target(src, dst), dst)
+        elif link_mode == 'reflink':
+            _reflink(src, dst)
+        else:
+            raise ValueError(f"Unknown link mode: {link_mode}")
+        return link_mode
+    except OSError as e:
+        if os.path.lexists(dst):
+            os.remove(dst)
+        with _unsupported_lock:
+            first_failure = (link_mode, dst_dir) not in _unsupported
+            _unsupported.add((link_mode, dst_dir))
+        if first_failure:
+            print(f"Warning: {link_mode} not possible into {dst_dir} ({e.strerror or e}); copying instead.")
+        copy_function(src, dst)
+        return 'copy'
+
+class TransferProgress:
+    """Single, periodically rewritten progress line: done/total, files/s and elapsed time."""
+
+    def __init__(self, total, label="Transferred"):
+        self.total = total
+        self.label = label
+        self.done = 0
+        self.start = time.perf_counter()
+        self.last_print = self.start
+
+    def update(self, count=1):
+        self.done += count
+        now = time.perf_counter()
+        if now - self.last_print >= PROGRESS_INTERVAL:
+            self.last_print = now
+            print(f"\r{self.line(now)}", end='', flush=True)
+
+    def close(self):
+        print(f"\r{self.line(time.perf_counter())}")
+
+    def line(self, now):
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        return f"{self.label} {self.done}/{self.total} files ({rate:.0f} files/s, {elapsed:.1f}s)"
+
+def transfer_files(pairs, link_mode='copy', copy_function=shutil.copy2, workers=DEFAULT_WORKERS):
+    """
+    Materialize every (src, dst) pair with link_or_copy on a bounded thread pool.
+    At most a few tasks per worker are queued at a time, so memory stays flat for 100k+ files.
+    Returns a Counter of the modes actually used.
+    """
+    pairs = list(pairs)
+    modes_used = Counter()
+    progress = TransferProgress(len(pairs))
+    max_in_flight = max(1, workers) * 4
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        in_flight = set()
+        for src, dst in pairs:
+            if len(in_flight) >= max_in_flight:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    modes_used[future.result()] += 1
+                progress.update(len(finished))
+            in_flight.add(executor.submit(link_or_copy, src, dst, link_mode, copy_function))
+        for future in in_flight:
+            modes_used[future.result()] += 1
+            progress.update()
+    progress.close()
+    return modes_used
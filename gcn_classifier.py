@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+gcn_classifier.py
+
+Skeleton graph convolutional network that classifies frames as correct form or lumbar error
+from their 17 COCO keypoints (README planned work item 1). Input is a keypoint store built
+with keypoint_store.py, so training and inference never parse JSON.
+
+Graph: the 17 COCO keypoints connected by COCO_SKELETON below (the standard COCO person
+skeleton; the "skeleton" list of our CVAT categories is empty). The normalized adjacency
+D^-1/2 (A + I) D^-1/2 is a 17x17 sparse matrix, and a whole batch goes through one sparse
+matmul per layer by folding the batch into the feature columns.
+
+Node features: x, y relative to the box centre divided by the longer box side, and a
+visibility flag (keypoints with v = 0 are zeroed). With --window T the features of the
+previous T - 1 frames of the same video (in frame order) are stacked onto every node, so the
+model sees a short motion history; the first frames of a video repeat their earliest frame.
+
+Training splits by video (all frames of one video in train or val, like split_train_val_test.py)
+and keeps the weights with the best validation accuracy.
+
+Usage:
+python keypoint_store.py build --coco annotations_v4/merged_coco.json --classes correct=annotations_v4/correct-phase-I-578Done-Mar14.json lumbar=annotations_v4/lumbar-phase-I-322Done-Mar14.json --out annotations_v4/keypoints.store
+python gcn_classifier.py train --store annotations_v4/keypoints.store --out runs/gcn/gcn.pt --epochs 200
+python gcn_classifier.py train --store annotations_v4/keypoints.store --out runs/gcn/gcn_w5.pt --window 5
+python gcn_classifier.py predict --store predictions.store --model runs/gcn/gcn.pt --out predictions_classes.csv
+
+Predictions of the pose model (infer_onnx.py COCO output) become a store with
+keypoint_store.py build --coco predictions.json --out predictions.store.
+"""
+
+import argparse
+import csv
+import os
+import random
+import time
+
+import numpy as np
+import torch
+from torch import nn
+
+from keypoint_store import KeypointStore
+
+# Standard COCO person skeleton, 1-based keypoint indices as in a COCO "skeleton" list
+COCO_SKELETON = [[16, 14], [14, 12], [17, 15], [15, 13], [12, 13], [6, 12], [7, 13], [6, 7], [6, 8], [7, 9],
+                 [8, 10], [9, 11], [2, 3], [1, 2], [1, 3], [2, 4], [3, 5], [4, 6], [5, 7]]
+
+def normalized_adjacency(num_nodes, edges):
+    """Sparse D^-1/2 (A + I) D^-1/2 for an undirected graph given as 1-based edges."""
+    pairs = [(a - 1, b - 1) for a, b in edges] + [(b - 1, a - 1) for a, b in edges]
+    pairs += [(i, i) for i in range(num_nodes)]
+    rows = torch.tensor([a for a, _ in pairs])
+    cols = torch.tensor([b for _, b in pairs])
+    degree = torch.bincount(rows, minlength=num_nodes).float()
+    values = degree[rows].rsqrt() * degree[cols].rsqrt()
+    return torch.sparse_coo_tensor(torch.stack([rows, cols]), values, (num_nodes, num_nodes),
+                                   check_invariants=True).coalesce()
+
+class GraphConv(nn.Module):
+    def __init__(self, in_features, out_features):
+        super().__init__()
+        self.linear = nn.Linear(in_features, out_features)
+
+    def forward(self, x, adjacency):
+        # x: (batch, nodes, features). Fold the batch into the columns for a single sparse matmul.
+        batch, nodes, _ = x.shape
+        h = self.linear(x)
+        h = h.transpose(0, 1).reshape(nodes, -1)
+        h = torch.sparse.mm(adjacency, h)
+        return h.reshape(nodes, batch, -1).transpose(0, 1)
+
+class SkeletonGCN(nn.Module):
+    def __init__(self, in_features, num_classes, hidden=64, layers=3, dropout=0.2,
+                 num_nodes=17, edges=COCO_SKELETON):
+        super().__init__()
+        # Rebuilt from the edges on load, so it is not part of the saved weights
+        self.register_buffer("adjacency", normalized_adjacency(num_nodes, edges), persistent=False)
+        sizes = [in_features] + [hidden] * layers
+        self.convs = nn.ModuleList(GraphConv(a, b) for a, b in zip(sizes[:-1], sizes[1:]))
+        self.norms = nn.ModuleList(nn.LayerNorm(hidden) for _ in range(layers))
+        self.dropout = nn.Dropout(dropout)
+        self.head = nn.Linear(hidden, num_classes)
+
+    def forward(self, x):
+        for conv, norm in zip(self.convs, self.norms):
+            x = self.dropout(torch.relu(norm(conv(x, self.adjacency))))
+        return self.head(x.mean(dim=1))
+
+def frame_features(keypoints, bbox):
+    """(N, K, 3) keypoints + (N, 4) boxes -> (N, K, 3) centred, scale-free x, y and visibility."""
+    keypoints = np.asarray(keypoints, dtype=np.float32)
+    bbox = np.asarray(bbox, dtype=np.float32)
+    centre = bbox[:, None, :2] + bbox[:, None, 2:] / 2
+    scale = np.maximum(bbox[:, 2:].max(axis=1), 1.0)[:, None, None]
+    visible = (keypoints[:, :, 2:3] > 0).astype(np.float32)
+    xy = (keypoints[:, :, :2] - centre) / scale * visible
+    return np.concatenate([xy, visible], axis=2)
+
+def windowed_features(store, window):
+    """(N, K, 3 * window) features; rows of a video are already in frame order in the store."""
+    features = frame_features(store.keypoints, store.bbox)
+    if window <= 1:
+        return features
+    stacked = np.empty(features.shape[:2] + (3 * window,), dtype=np.float32)
+    for v in range(len(store.videos)):
+        rows = store.video_rows(v)
+        start, stop = rows.start, rows.stop
+        for t in range(window):
+            # Row i gets frame i - (window - 1 - t) of its own video, clamped to the first frame
+            source = np.maximum(np.arange(start, stop) - (window - 1 - t), start)
+            stacked[start:stop, :, 3 * t:3 * t + 3] = features[source]
+    return stacked
+
+def split_by_video(video_ids, val_ratio, seed):
+    videos = sorted(set(int(v) for v in video_ids))
+    random.Random(seed).shuffle(videos)
+    val_videos = set(videos[:max(1, int(round(len(videos) * val_ratio)))])
+    is_val = np.array([int(v) in val_videos for v in video_ids])
+    return np.flatnonzero(~is_val), np.flatnonzero(is_val)
+
+def evaluate(model, features, labels, batch_size=4096):
+    model.eval()
+    with torch.no_grad():
+        logits = torch.cat([model(features[i:i + batch_size]) for i in range(0, len(features), batch_size)])
+    predictions = logits.argmax(dim=1)
+    return float((predictions == labels).float().mean()) if len(labels) else 0.0, predictions
+
+def train(args):
+    torch.manual_seed(args.seed)
+    store = KeypointStore(args.store)
+    if len(store.classes) < 2:
+        raise ValueError(f"{args.store} has no classes; build it with --classes correct=... lumbar=...")
+    labels_np = np.asarray(store.labels, dtype=np.int64)
+    known = labels_np >= 0
+    features_np = windowed_features(store, args.window)
+    train_rows, val_rows = split_by_video(np.asarray(store.video_ids), args.val_ratio, args.seed)
+    train_rows, val_rows = train_rows[known[train_rows]], val_rows[known[val_rows]]
+
+    features = torch.from_numpy(features_np)
+    labels = torch.from_numpy(labels_np)
+    model = SkeletonGCN(features.shape[2], len(store.classes), args.hidden, args.layers, args.dropout,
+                        store.num_keypoints)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr, weight_decay=1e-4)
+    # Balance the classes (579 correct vs 323 lumbar in v4)
+    counts = np.bincount(labels_np[train_rows], minlength=len(store.classes)).astype(np.float32)
+    loss_fn = nn.CrossEntropyLoss(weight=torch.from_numpy(counts.sum() / np.maximum(counts, 1) / len(counts)))
+
+    print(f"Train {len(train_rows)} / val {len(val_rows)} frames, window {args.window}, "
+          f"classes {store.classes}, features {tuple(features.shape[1:])}")
+    best_acc, best_state = -1.0, None
+    start = time.perf_counter()
+    for epoch in range(1, args.epochs + 1):
+        model.train()
+        order = torch.from_numpy(train_rows)[torch.randperm(len(train_rows))]
+        for i in range(0, len(order), args.batch):
+            rows = order[i:i + args.batch]
+            loss = loss_fn(model(features[rows]), labels[rows])
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+        val_acc, _ = evaluate(model, features[val_rows], labels[val_rows])
+        if val_acc > best_acc:
+            best_acc = val_acc
+            best_state = {k: v.clone() for k, v in model.state_dict().items()}
+        if epoch == 1 or epoch % 20 == 0 or epoch == args.epochs:
+            print(f"epoch {epoch}/{args.epochs}  loss {loss.item():.4f}  val acc {val_acc:.3f}  best {best_acc:.3f}")
+
+    model.load_state_dict(best_state)
+    _, predictions = evaluate(model, features[val_rows], labels[val_rows])
+    confusion = np.zeros((len(store.classes), len(store.classes)), dtype=np.int64)
+    np.add.at(confusion, (labels_np[val_rows], predictions.numpy()), 1)
+    print(f"Trained in {time.perf_counter() - start:.1f} s, best val accuracy {best_acc:.3f}")
+    print("Val confusion (rows = true " + " / ".join(store.classes) + "):")
+    for name, row in zip(store.classes, confusion):
+        print(f"  {name:>10}: {row.tolist()}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    torch.save({"state_dict": model.state_dict(),
+                "config": {"in_features": features.shape[2], "classes": store.classes, "hidden": args.hidden,
+                           "layers": args.layers, "dropout": args.dropout, "window": args.window,
+                           "num_keypoints": store.num_keypoints, "edges": COCO_SKELETON},
+                "val_accuracy": best_acc}, args.out)
+    print(f"Model written to: {args.out}")
+
+def load_model(model_file):
+    checkpoint = torch.load(model_file, map_location="cpu")
+    config = checkpoint["config"]
+    model = SkeletonGCN(config["in_features"], len(config["classes"]), config["hidden"], config["layers"],
+                        config["dropout"], config["num_keypoints"], config["edges"])
+    model.load_state_dict(checkpoint["state_dict"])
+    model.eval()
+    return model, config
+
+def predict(args):
+    model, config = load_model(args.model)
+    store = KeypointStore(args.store)
+    features = torch.from_numpy(windowed_features(store, config["window"]))
+
+    start = time.perf_counter()
+    with torch.no_grad():
+        probabilities = torch.cat([torch.softmax(model(features[i:i + args.batch]), dim=1)
+                                   for i in range(0, len(features), args.batch)]).numpy()
+    elapsed = time.perf_counter() - start
+    predictions = probabilities.argmax(axis=1)
+
+    with open(args.out, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["file_name", "video_id", "frame", "prediction"] + [f"p_{name}" for name in config["classes"]])
+        for i, file_name in enumerate(store.file_names):
+            writer.writerow([file_name, store.videos[int(store.video_ids[i])], int(store.frames[i]),
+                             config["classes"][predictions[i]]] + [round(float(p), 4) for p in probabilities[i]])
+
+    print(f"Classified {len(features)} frames in {elapsed * 1000:.1f} ms ({len(features) / max(elapsed, 1e-9):.0f} frames/s)")
+    if len(store.classes) and store.classes == config["classes"]:
+        labels = np.asarray(store.labels)
+        known = labels >= 0
+        if known.any():
+            print(f"Accuracy against the store's classes: {(predictions[known] == labels[known]).mean():.3f}")
+    print(f"Predictions written to: {args.out}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Skeleton GCN classifier (correct form vs lumbar error)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="Train on a keypoint store with classes")
+    train_parser.add_argument("--store", required=True, help="Keypoint store from keypoint_store.py build --classes ...")
+    train_parser.add_argument("--out", required=True, help="Model file to write, e.g. runs/gcn/gcn.pt")
+    train_parser.add_argument("--window", type=int, default=1, help="Frames per sample (1 = single frame)")
+    train_parser.add_argument("--epochs", type=int, default=200)
+    train_parser.add_argument("--batch", type=int, default=128)
+    train_parser.add_argument("--lr", type=float, default=3e-3)
+    train_parser.add_argument("--hidden", type=int, default=64)
+    train_parser.add_argument("--layers", type=int, default=3)
+    train_parser.add_argument("--dropout", type=float, default=0.2)
+    train_parser.add_argument("--val_ratio", type=float, default=0.2, help="Share of videos held out for validation")
+    train_parser.add_argument("--seed", type=int, default=42)
+
+    predict_parser = subparsers.add_parser("predict", help="Classify every skeleton of a keypoint store")
+    predict_parser.add_argument("--store", required=True)
+    predict_parser.add_argument("--model", required=True)
+    predict_parser.add_argument("--out", required=True, help="CSV to write")
+    predict_parser.add_argument("--batch", type=int, default=4096)
+
+    args = parser.parse_args()
+    if args.command == "train":
+        train(args)
+    else:
+        predict(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+image_store.py
+
+Content-addressed image store shared by all dataset versions. data_v1, data_v3 and data_v4 (and
+the yolopose_vN trees made from them) hold largely the same frames; the store keeps every
+distinct file once, named by its sha256, and a small manifest per version that maps the
+version's relative paths to those hashes:
+
+  image_store/
+    objects/ab/ab12...ef          one blob per distinct file content (read-only)
+    manifests/data_v4.json        {"files": {"img-correct-.../52723_8_10.jpg": [sha256, size, mtime_ns], ...}}
+
+Disk usage grows with the number of unique frames, not with the number of versions. A version is
+materialized with checkout, which links the blobs into a folder (--link-mode hardlink / reflink /
+symlink, falling back to a copy like select_and_copy_images.py), so creating data_vN or
+data_vN/merged takes seconds instead of copying every frame again. select_and_copy_images.py can
+take its images straight from a store version (--store / --store_version).
+
+Blobs are copies (or reflink clones) of the added files with their own inode, never links to
+--src, and are made read-only (not on Windows). With hardlink checkouts the checked-out file
+*is* the blob, so a tool that edited an image in place would fail instead of silently changing
+every version; tools that replace files (temp file + rename) are fine. Copied and reflinked
+checkouts are separate files and come out writable.
+
+Re-adding a folder under the same version name only hashes files whose size or mtime changed.
+
+Usage:
+python image_store.py add --store image_store --version data_v4 --src data_v4 --exclude merged
+python image_store.py subset --store image_store --from data_v4 --version data_v4_merged --coco annotations_v4/merged_coco.json
+python image_store.py checkout --store image_store --version data_v4_merged --out data_v4/merged --link-mode hardlink
+python image_store.py list --store image_store
+python image_store.py verify --store image_store --version data_v4
+python image_store.py gc --store image_store
+"""
+
+import argparse
+import json
+import os
+import shutil
+import stat
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from coco_index import CocoIndex
+from file_transfer import DEFAULT_WORKERS, TransferProgress, add_transfer_arguments, file_sha256, link_or_copy, transfer_files
+
+MANIFEST_VERSION = 1
+# Blobs always get their own inode; only checkout links
+ADD_LINK_MODES = ('copy', 'reflink')
+BATCH_SIZE = 256
+
+def copy_blob(src, dst):
+    """shutil.copy2 without the mode: a copied checkout is an ordinary writable file, not a read-only blob."""
+    shutil.copyfile(src, dst)
+    st = os.stat(src)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return dst
+
+class ImageStore:
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.manifests_dir = os.path.join(root, "manifests")
+
+    def blob_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def put(self, path, digest, link_mode='copy'):
+        """Store the file at path under its digest; returns True if the blob is new."""
+        if link_mode not in ADD_LINK_MODES:
+            # A blob linked to the source would change (or vanish) with it while its digest stays the same
+            raise ValueError(f"Blobs are stored with {' or '.join(ADD_LINK_MODES)}, not {link_mode}")
+        blob = self.blob_path(digest)
+        if os.path.exists(blob):
+            return False
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        tmp_file = f"{blob}.{uuid.uuid4().hex}.tmp"
+        link_or_copy(path, tmp_file, link_mode, shutil.copy2)
+        if os.name != 'nt':
+            # On Windows a read-only file can't be deleted through any of its links (hardlink checkouts)
+            os.chmod(tmp_file, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(tmp_file, blob)
+        return True
+
+    def manifest_file(self, version):
+        return os.path.join(self.manifests_dir, version + ".json")
+
+    def versions(self):
+        if not os.path.isdir(self.manifests_dir):
+            return []
+        return sorted(name[:-len(".json")] for name in os.listdir(self.manifests_dir) if name.endswith(".json"))
+
+    def read_manifest(self, version):
+        manifest_file = self.manifest_file(version)
+        if not os.path.exists(manifest_file):
+            raise ValueError(f"No version '{version}' in {self.root} (known: {', '.join(self.versions()) or 'none'})")
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"{manifest_file}: unsupported manifest version {manifest.get('version')}")
+        return manifest
+
+    def write_manifest(self, version, files, source):
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        manifest_file = self.manifest_file(version)
+        tmp_file = manifest_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({"version": MANIFEST_VERSION, "name": version, "source": source,
+                       "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                       "files": dict(sorted(files.items()))}, f, indent=1)
+        os.replace(tmp_file, manifest_file)
+
+    def index(self, version):
+        """{file name: blob path} of a version, the same shape as file_transfer.build_dir_index()."""
+        return {os.path.basename(rel): self.blob_path(entry[0]) for rel, entry in self.read_manifest(version)["files"].items()}
+
+def list_files(src, exclude=()):
+    """Every file under src (all of them, also when names repeat in different sub-folders), sorted."""
+    paths, pending = [], [src]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not (os.path.dirname(entry.path) == src and entry.name in exclude):
+                        pending.append(entry.path)
+                else:
+                    paths.append(entry.path)
+    return sorted(paths)
+
+def add_folder(store, version, src, exclude=(), link_mode='copy', workers=8):
+    """Hash every file under src into the store and write the version's manifest."""
+    paths = list_files(src, exclude)
+    previous = {}
+    if os.path.exists(store.manifest_file(version)):
+        previous = store.read_manifest(version)["files"]
+
+    def add_batch(batch):
+        results = []
+        for path in batch:
+            rel = os.path.relpath(path, src).replace(os.sep, '/')
+            st = os.stat(path)
+            known = previous.get(rel)
+            if known and known[1] == st.st_size and known[2] == st.st_mtime_ns and os.path.exists(store.blob_path(known[0])):
+                results.append((rel, known, False))
+                continue
+            digest = file_sha256(path)
+            results.append((rel, [digest, st.st_size, st.st_mtime_ns], store.put(path, digest, link_mode)))
+        return results
+
+    files, new_blobs = {}, 0
+    progress = TransferProgress(len(paths), label="Added")
+    batches = [paths[i:i + BATCH_SIZE] for i in range(0, len(paths), BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for results in executor.map(add_batch, batches):
+            for rel, entry, is_new in results:
+                files[rel] = entry
+                new_blobs += is_new
+            progress.update(len(results))
+    progress.close()
+    store.write_manifest(version, files, os.path.abspath(src))
+    return len(files), new_blobs
+
+def checkout(store, version, out_dir, link_mode='copy', workers=8):
+    files = store.read_manifest(version)["files"]
+    pairs = [(store.blob_path(entry[0]), os.path.join(out_dir, *rel.split('/'))) for rel, entry in files.items()]
+    for directory in sorted({os.path.dirname(dst) for _, dst in pairs}):
+        os.makedirs(directory, exist_ok=True)
+    return transfer_files(pairs, link_mode, copy_blob, workers)
+
+def referenced_blobs(store):
+    return {entry[0] for version in store.versions() for entry in store.read_manifest(version)["files"].values()}
+
+def stored_blobs(store):
+    """{digest: path} of every blob in the store."""
+    blobs = {}
+    if os.path.isdir(store.objects_dir):
+        for prefix in os.scandir(store.objects_dir):
+            if prefix.is_dir():
+                blobs.update((entry.name, entry.path) for entry in os.scandir(prefix.path)
+                             if not entry.name.endswith(".tmp"))
+    return blobs
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicated image store with one manifest per dataset version")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add = subparsers.add_parser("add", help="Add a folder as a version")
+    add.add_argument("--store", required=True)
+    add.add_argument("--version", required=True, help="Version name, e.g. data_v4")
+    add.add_argument("--src", required=True, help="Folder to add, e.g. data_v4")
+    add.add_argument("--exclude", nargs='*', default=[], help="Sub-folders of --src to leave out, e.g. merged")
+    add.add_argument("--link-mode", choices=ADD_LINK_MODES, default='copy',
+                     help="copy (default) or reflink (copy-on-write clone, falls back to copy); blobs are never linked to --src")
+    add.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                     help=f"Number of files hashed and stored in parallel (default: {DEFAULT_WORKERS})")
+
+    subset = subparsers.add_parser("subset", help="New version with the files of a COCO file, without copying anything")
+    subset.add_argument("--store", required=True)
+    subset.add_argument("--from", dest="from_version", required=True, help="Existing version, e.g. data_v4")
+    subset.add_argument("--version", required=True, help="New version name, e.g. data_v4_merged")
+    subset.add_argument("--coco", required=True, help="COCO file whose images make up the new version")
+
+    out = subparsers.add_parser("checkout", help="Materialize a version as a folder")
+    out.add_argument("--store", required=True)
+    out.add_argument("--version", required=True)
+    out.add_argument("--out", required=True, help="Folder to create, e.g. data_v4/merged")
+    add_transfer_arguments(out)
+
+    for name, help_text in (("list", "Versions and disk usage"), ("verify", "Re-hash the blobs of a version"),
+                            ("gc", "Delete blobs no version uses")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--store", required=True)
+        if name == "verify":
+            sub.add_argument("--version", required=True)
+            sub.add_argument("--workers", type=int, default=8)
+
+    args = parser.parse_args()
+    store = ImageStore(args.store)
+
+    if args.command == "add":
+        count, new_blobs = add_folder(store, args.version, args.src, args.exclude, args.link_mode, args.workers)
+        print(f"Version {args.version}: {count} files, {new_blobs} new blobs, {count - new_blobs} already stored or unchanged")
+
+    elif args.command == "subset":
+        wanted = set(CocoIndex(args.coco).file_names)
+        files = {}
+        for rel, entry in store.read_manifest(args.from_version)["files"].items():
+            name = rel.rsplit('/', 1)[-1]
+            if name in wanted:
+                files[name] = entry
+        store.write_manifest(args.version, files, f"{args.from_version} & {os.path.basename(args.coco)}")
+        missing = wanted - set(files)
+        print(f"Version {args.version}: {len(files)} files from {args.from_version}"
+              + (f" ({len(missing)} images of the COCO file not in {args.from_version}, e.g. {sorted(missing)[:3]})" if missing else ""))
+
+    elif args.command == "checkout":
+        modes_used = checkout(store, args.version, args.out, args.link_mode, args.workers)
+        print(', '.join(f"{count} files via {mode}" for mode, count in modes_used.items()) or "No files")
+
+    elif args.command == "list":
+        blobs = stored_blobs(store)
+        blob_bytes = sum(os.path.getsize(path) for path in blobs.values())
+        logical = 0
+        for version in store.versions():
+            manifest = store.read_manifest(version)
+            size = sum(entry[1] for entry in manifest["files"].values())
+            logical += size
+            print(f"{version:<24} {len(manifest['files']):>7} files {size / 1e6:>9.1f} MB  ({manifest['created']}, {manifest['source']})")
+        print(f"Store: {len(blobs)} blobs, {blob_bytes / 1e6:.1f} MB for {logical / 1e6:.1f} MB of versions"
+              + (f" ({logical / blob_bytes:.1f}x deduplicated)" if blob_bytes else ""))
+
+    elif args.command == "verify":
+        files = store.read_manifest(args.version)["files"]
+
+        def check(item):
+            rel, entry = item
+            blob = store.blob_path(entry[0])
+            if not os.path.exists(blob):
+                return rel, "missing"
+            return rel, None if file_sha256(blob) == entry[0] else "hash mismatch"
+
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            problems = [(rel, problem) for rel, problem in executor.map(check, files.items()) if problem]
+        for rel, problem in problems[:20]:
+            print(f"  {rel}: {problem}")
+        print(f"Version {args.version}: {len(files) - len(problems)}/{len(files)} files OK")
+
+    else:
+        used = referenced_blobs(store)
+        removed = 0
+        for name, path in stored_blobs(store).items():
+            if name not in used:
+                os.chmod(path, stat.S_IWRITE | stat.S_IREAD)
+                os.remove(path)
+                removed += 1
+        print(f"Removed {removed} unused blobs, {len(used)} in use")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+infer_onnx.py
+
+CPU inference for a fine-tuned pose model: exports best.pt to ONNX (dynamic batch size, once;
+re-exported when best.pt is newer) and runs it with ONNX Runtime over an image folder, e.g. the
+test split yolopose_v4/data/images/test.
+
+Images are decoded and letterboxed on a thread pool (same letterbox as image_cache.py /
+Ultralytics) and fed to the model in dynamic micro-batches: the runner takes every image that
+is ready, up to --max_batch, and waits at most --max_wait_ms for more before running a
+smaller batch. Results are streamed to a COCO keypoint JSON with the same layout as
+merged_coco.json (licenses, info, categories, images, annotations), so it can be merged,
+compared or evaluated like a CVAT export. Each annotation also carries "score" and the
+per-keypoint confidences in "keypoint_scores"; keypoints below --kpt_conf are written as 0 0 0
+(not labeled).
+
+With --ref_coco the image ids and categories are taken from that COCO file (e.g. the test split's
+test_coco.json), so predictions line up with the ground truth.
+
+Reports frames per second, the per batch inference time and the latency per image (p50/p95).
+The latency runs from the moment the runner takes an image until its result is written, so it
+includes waiting for the micro-batch to fill, inference and postprocessing; a decode backlog
+only shows up in frames per second.
+
+Usage:
+python infer_onnx.py --weights runs/pose/train21-mar14-RTX2060-yolo11m/weights/best.pt --images yolopose_v4/data/images/test --out predictions_test.json
+python infer_onnx.py --weights best.onnx --images data_v4/merged --out preds.json --max_batch 16 --max_wait_ms 10 --threads 4
+"""
+
+import argparse
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from image_cache import IMAGE_EXTENSIONS, letterbox_image
+
+KEYPOINT_NAMES = ['Nose', 'Left Eye', 'Right Eye', 'Left Ear', 'Right Ear', 'Left Shoulder', 'Right Shoulder',
+                  'Left Elbow', 'Right Elbow', 'Left Wrist', 'Right Wrist', 'Left Hip', 'Right Hip',
+                  'Left Knee', 'Right Knee', 'Left Ankle', 'Right Ankle']
+HUMAN_CATEGORY = {"id": 1, "name": "human", "supercategory": "", "keypoints": KEYPOINT_NAMES, "skeleton": []}
+
+def export_onnx(weights, imgsz):
+    """Path of the ONNX model for weights, exporting best.pt when the .onnx is missing or older."""
+    if weights.endswith(".onnx"):
+        return weights
+    onnx_file = os.path.splitext(weights)[0] + ".onnx"
+    if os.path.exists(onnx_file) and os.path.getmtime(onnx_file) >= os.path.getmtime(weights):
+        return onnx_file
+    from ultralytics import YOLO
+    print(f"Exporting {weights} to ONNX (imgsz {imgsz}, dynamic batch)")
+    return YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True)
+
+def create_session(onnx_file, threads):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(onnx_file, sess_options=options, providers=["CPUExecutionProvider"])
+
+def preprocess(path, imgsz):
+    with open(path, 'rb') as f:
+        data = f.read()
+    img, orig_hw, r, pad = letterbox_image(data, imgsz)
+    # BGR HWC uint8 -> RGB CHW float32 0..1, as Ultralytics feeds the model
+    tensor = np.ascontiguousarray(img[:, :, ::-1].transpose(2, 0, 1), dtype=np.float32) / 255.0
+    return tensor, orig_hw, r, pad
+
+def postprocess(pred, orig_hw, r, pad, num_keypoints, conf, iou, max_det):
+    """
+    One image's raw output (4 + classes + K*3, anchors) -> list of
+    (class_index, score, [x, y, w, h], keypoints (K, 3)) in original image pixels.
+    """
+    nc = pred.shape[0] - 4 - num_keypoints * 3
+    pred = pred.T
+    class_scores = pred[:, 4:4 + nc]
+    scores = class_scores.max(axis=1)
+    keep = scores > conf
+    if not keep.any():
+        return []
+    pred, scores, classes = pred[keep], scores[keep], class_scores[keep].argmax(axis=1)
+
+    left, top = pad
+    h, w = orig_hw
+    x0 = np.clip((pred[:, 0] - pred[:, 2] / 2 - left) / r, 0, w)
+    y0 = np.clip((pred[:, 1] - pred[:, 3] / 2 - top) / r, 0, h)
+    x1 = np.clip((pred[:, 0] + pred[:, 2] / 2 - left) / r, 0, w)
+    y1 = np.clip((pred[:, 1] + pred[:, 3] / 2 - top) / r, 0, h)
+    boxes = np.stack([x0, y0, x1 - x0, y1 - y0], axis=1)
+    kpts = pred[:, 4 + nc:].reshape(-1, num_keypoints, 3).copy()
+    kpts[:, :, 0] = np.clip((kpts[:, :, 0] - left) / r, 0, w)
+    kpts[:, :, 1] = np.clip((kpts[:, :, 1] - top) / r, 0, h)
+
+    indices = cv2.dnn.NMSBoxes(boxes.tolist(), scores.tolist(), conf, iou)
+    indices = np.array(indices).reshape(-1)[:max_det]
+    return [(int(classes[i]), float(scores[i]), boxes[i], kpts[i]) for i in indices]
+
+def detection_to_annotation(detection, ann_id, image_id, category_ids, kpt_conf):
+    class_index, score, (x, y, bw, bh), kpts = detection
+    keypoints = []
+    for kx, ky, kc in kpts:
+        keypoints.extend([round(float(kx), 2), round(float(ky), 2), 2] if kc >= kpt_conf else [0, 0, 0])
+    return {
+        "id": ann_id,
+        "image_id": image_id,
+        "category_id": category_ids[class_index],
+        "segmentation": [],
+        "area": round(float(bw * bh), 4),
+        "bbox": [round(float(v), 2) for v in (x, y, bw, bh)],
+        "iscrowd": 0,
+        "num_keypoints": int((kpts[:, 2] >= kpt_conf).sum()),
+        "keypoints": keypoints,
+        "score": round(score, 5),
+        "keypoint_scores": [round(float(kc), 4) for kc in kpts[:, 2]],
+    }
+
+def percentile_ms(values, q):
+    return 1000 * float(np.percentile(values, q)) if values else 0.0
+
+def iter_batches(image_paths, imgsz=640, max_batch=8, max_wait_ms=5.0, workers=4):
+    """
+    Yield dynamic micro-batches of preprocessed images, in order, as lists of
+    (path, tensor, orig_hw, r, pad, picked_up) where picked_up is when the batcher took the image.
+    """
+    ready = queue.Queue(maxsize=max_batch * 4)
+    producer_errors = []
+
+    def produce():
+        # Decode in order on a thread pool, keeping only a bounded window of images in flight
+        window = max_batch * 4
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                pending = deque()
+                for path in image_paths:
+                    pending.append((path, executor.submit(preprocess, path, imgsz)))
+                    if len(pending) >= window:
+                        path_done, future = pending.popleft()
+                        ready.put((path_done, future.result()))
+                while pending:
+                    path_done, future = pending.popleft()
+                    ready.put((path_done, future.result()))
+        except Exception as e:
+            producer_errors.append(e)
+        finally:
+            ready.put(None)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    finished = False
+    while not finished:
+        item = ready.get()
+        if item is None:
+            break
+        batch = [(item[0], *item[1], time.perf_counter())]
+        deadline = batch[0][-1] + max_wait_ms / 1000
+        while len(batch) < max_batch:
+            try:
+                item = ready.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if item is None:
+                finished = True
+                break
+            batch.append((item[0], *item[1], time.perf_counter()))
+        yield batch
+
+    producer.join()
+    if producer_errors:
+        raise producer_errors[0]
+
+def run_inference(session, image_paths, image_ids, categories, out_file, imgsz=640, max_batch=8,
+                  max_wait_ms=5.0, conf=0.25, iou=0.7, kpt_conf=0.5, max_det=1, num_keypoints=17, workers=4):
+    input_name = session.get_inputs()[0].name
+    category_ids = [c["id"] for c in categories]
+    start = time.perf_counter()
+
+    image_latencies, batch_times, batch_sizes = [], [], []
+    ann_id = 0
+    spool = tempfile.TemporaryFile('w+')
+    try:
+        with open(out_file + ".tmp", 'w') as out:
+            out.write('{"licenses": [{"name": "", "id": 0, "url": ""}], "info": {"description": "infer_onnx.py predictions"}, ')
+            out.write('"categories": ' + json.dumps(categories) + ', "images": [')
+            first_image = first_ann = True
+            for batch in iter_batches(image_paths, imgsz, max_batch, max_wait_ms, workers):
+                t0 = time.perf_counter()
+                outputs = session.run(None, {input_name: np.stack([entry[1] for entry in batch])})[0]
+                batch_times.append(time.perf_counter() - t0)
+                batch_sizes.append(len(batch))
+
+                for (path, _, orig_hw, r, pad, picked_up), pred in zip(batch, outputs):
+                    file_name = os.path.basename(path)
+                    image = {"id": image_ids[file_name], "width": orig_hw[1], "height": orig_hw[0], "file_name": file_name,
+                             "license": 0, "flickr_url": "", "coco_url": "", "date_captured": 0}
+                    out.write(('' if first_image else ', ') + json.dumps(image))
+                    first_image = False
+                    for detection in postprocess(pred, orig_hw, r, pad, num_keypoints, conf, iou, max_det):
+                        ann_id += 1
+                        annotation = detection_to_annotation(detection, ann_id, image["id"], category_ids, kpt_conf)
+                        spool.write(('' if first_ann else ', ') + json.dumps(annotation))
+                        first_ann = False
+                    image_latencies.append(time.perf_counter() - picked_up)
+
+            out.write('], "annotations": [')
+            spool.seek(0)
+            shutil.copyfileobj(spool, out)
+            out.write(']}')
+    except BaseException:
+        if os.path.exists(out_file + ".tmp"):
+            os.remove(out_file + ".tmp")
+        raise
+    finally:
+        spool.close()
+    os.replace(out_file + ".tmp", out_file)
+
+    elapsed = time.perf_counter() - start
+    n = len(image_latencies)
+    print(f"{n} images, {ann_id} detections in {elapsed:.2f} s -> {n / elapsed:.1f} frames/s "
+          f"(mean batch {np.mean(batch_sizes) if batch_sizes else 0:.1f})")
+    print(f"Latency per image: p50 {percentile_ms(image_latencies, 50):.1f} ms, p95 {percentile_ms(image_latencies, 95):.1f} ms")
+    print(f"Inference per batch: p50 {percentile_ms(batch_times, 50):.1f} ms, p95 {percentile_ms(batch_times, 95):.1f} ms")
+    print(f"Predictions written to: {out_file}")
+    return {"images": n, "detections": ann_id, "fps": n / elapsed if elapsed else 0.0,
+            "latency_p50_ms": percentile_ms(image_latencies, 50), "latency_p95_ms": percentile_ms(image_latencies, 95)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a pose model to ONNX and run batched CPU inference")
+    parser.add_argument("--weights", required=True, help="best.pt (exported to ONNX next to it) or an .onnx file")
+    parser.add_argument("--images", required=True, help="Image folder, e.g. yolopose_v4/data/images/test")
+    parser.add_argument("--out", required=True, help="COCO keypoint JSON to write")
+    parser.add_argument("--ref_coco", default=None, help="COCO file to take image ids and categories from")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--max_batch", type=int, default=8, help="Largest micro-batch")
+    parser.add_argument("--max_wait_ms", type=float, default=5.0, help="Longest wait for a micro-batch to fill")
+    parser.add_argument("--conf", type=float, default=0.25, help="Detection confidence threshold")
+    parser.add_argument("--iou", type=float, default=0.7, help="NMS IoU threshold")
+    parser.add_argument("--kpt_conf", type=float, default=0.5, help="Keypoints below this confidence are written as not labeled")
+    parser.add_argument("--max_det", type=int, default=1, help="Detections kept per image (one person per frame)")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads (0 = all cores)")
+    parser.add_argument("--workers", type=int, default=4, help="Image decode threads")
+    args = parser.parse_args()
+
+    image_paths = sorted(os.path.join(args.images, name) for name in os.listdir(args.images)
+                         if name.lower().endswith(IMAGE_EXTENSIONS))
+    categories = [HUMAN_CATEGORY]
+    image_ids = {}
+    if args.ref_coco:
+        with open(args.ref_coco, 'r') as f:
+            ref = json.load(f)
+        categories = ref["categories"]
+        image_ids = {img["file_name"]: img["id"] for img in ref["images"]}
+    next_id = max(image_ids.values(), default=0)
+    for path in image_paths:
+        if os.path.basename(path) not in image_ids:
+            next_id += 1
+            image_ids[os.path.basename(path)] = next_id
+
+    session = create_session(export_onnx(args.weights, args.imgsz), args.threads)
+    num_keypoints = len(categories[0].get("keypoints", KEYPOINT_NAMES))
+    run_inference(session, image_paths, image_ids, categories, args.out, args.imgsz, args.max_batch,
+                  args.max_wait_ms, args.conf, args.iou, args.kpt_conf, args.max_det, num_keypoints, args.workers)
+
+if __name__ == "__main__":
+    main()
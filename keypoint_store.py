@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+keypoint_store.py
+
+Converts the keypoint annotations of a COCO file (e.g. annotations_v4/merged_coco.json) into
+a folder of memory-mappable NumPy arrays, one row per annotation, so the skeletons of a whole
+dataset load in milliseconds instead of re-parsing the JSON:
+
+  keypoints.npy     float32 (N, 17, 3)  x, y, v in pixels, as in the COCO file
+  bbox.npy          float32 (N, 4)      COCO bbox x, y, w, h
+  video.npy         int32 (N)           index into index.json "videos" (e.g. "52723_8")
+  frame.npy         int32 (N)           frame number from the file name (52723_8_10.jpg -> 10), -1 if none
+  label.npy         int8 (N)            index into index.json "classes" (e.g. correct / lumbar), -1 if unknown
+  image_id.npy      int32 (N)           image id in the COCO file
+  video_offsets.npy int64 (videos + 1)  rows of video i are [video_offsets[i], video_offsets[i + 1])
+  index.json        version, keypoint names, class names, video ids, file name of every row,
+                    image width/height of every row and the sha256 of the COCO file
+
+Rows are sorted by video and frame number, so every video is one contiguous, time-ordered block
+(what a temporal model wants). The class of a frame is the name of the source export that contains
+its file name (--classes correct=annotations_v4/correct-...json lumbar=annotations_v4/lumbar-...json);
+merged_coco.json itself doesn't record it.
+
+Usage:
+python keypoint_store.py build --coco annotations_v4/merged_coco.json --classes correct=annotations_v4/correct-phase-I-578Done-Mar14.json lumbar=annotations_v4/lumbar-phase-I-322Done-Mar14.json --out annotations_v4/keypoints.store
+python keypoint_store.py info --store annotations_v4/keypoints.store
+
+In Python / notebooks:
+    from keypoint_store import KeypointStore
+    store = KeypointStore("annotations_v4/keypoints.store")
+    store.keypoints              # (N, 17, 3) float32 memmap
+    store.video("52723_8")       # (frames, 17, 3) of one video, in frame order
+    store.labels == store.classes.index("lumbar")
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from file_transfer import file_sha256
+from split_train_val_test import frame_number, get_video_id_from_filename
+
+STORE_VERSION = 1
+NUM_KEYPOINTS = 17
+ARRAYS = ["keypoints", "bbox", "video", "frame", "label", "image_id"]
+
+def class_by_file_name(class_files):
+    """[(class name, COCO export)] -> {file name: class index}"""
+    classes = {}
+    for i, (_, coco_file) in enumerate(class_files):
+        with open(coco_file, 'r') as f:
+            data = json.load(f)
+        for img in data["images"]:
+            classes.setdefault(img["file_name"], i)
+    return classes
+
+def build_store(coco_file, store_dir, class_files=(), num_keypoints=NUM_KEYPOINTS):
+    with open(coco_file, 'r') as f:
+        coco = json.load(f)
+    images = {img["id"]: img for img in coco["images"]}
+    categories = coco.get("categories", [])
+    keypoint_names = categories[0].get("keypoints", []) if categories else []
+    class_names = [name for name, _ in class_files]
+    file_classes = class_by_file_name(class_files)
+
+    anns = [ann for ann in coco["annotations"]
+            if ann["image_id"] in images and len(ann.get("keypoints", [])) == num_keypoints * 3]
+    file_names = [images[ann["image_id"]]["file_name"] for ann in anns]
+    video_names = [get_video_id_from_filename(name) for name in file_names]
+    frames = np.array([frame_number(name) for name in file_names], dtype=np.int32)
+
+    videos = sorted(set(video_names))
+    video_index = {video: i for i, video in enumerate(videos)}
+    video = np.array([video_index[name] for name in video_names], dtype=np.int32)
+    # Contiguous, time-ordered videos; file name breaks ties between unnumbered frames
+    order = sorted(range(len(anns)), key=lambda i: (video[i], frames[i], file_names[i]))
+
+    arrays = {
+        "keypoints": np.array([anns[i]["keypoints"] for i in order], dtype=np.float32).reshape(-1, num_keypoints, 3),
+        "bbox": np.array([anns[i]["bbox"] for i in order], dtype=np.float32).reshape(-1, 4),
+        "video": video[order],
+        "frame": frames[order],
+        "label": np.array([file_classes.get(file_names[i], -1) for i in order], dtype=np.int8),
+        "image_id": np.array([anns[i]["image_id"] for i in order], dtype=np.int32),
+    }
+    video_offsets = np.zeros(len(videos) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(arrays["video"], minlength=len(videos)), out=video_offsets[1:])
+
+    os.makedirs(store_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(store_dir, name + ".npy"), array)
+    np.save(os.path.join(store_dir, "video_offsets.npy"), video_offsets)
+    with open(os.path.join(store_dir, "index.json"), 'w') as f:
+        json.dump({
+            "version": STORE_VERSION,
+            "num_keypoints": num_keypoints,
+            "keypoint_names": keypoint_names,
+            "classes": class_names,
+            "videos": videos,
+            "file_names": [file_names[i] for i in order],
+            "image_sizes": [[images[anns[i]["image_id"]]["width"], images[anns[i]["image_id"]]["height"]] for i in order],
+            "coco_file": os.path.basename(coco_file),
+            "coco_sha256": file_sha256(coco_file),
+        }, f)
+
+    unknown = int((arrays["label"] == -1).sum())
+    print(f"Stored {len(order)} skeletons from {len(videos)} videos in {store_dir}"
+          + (f" ({unknown} without a class)" if class_names and unknown else ""))
+
+class KeypointStore:
+    """Read-only, memory-mapped view of a keypoint store."""
+
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, "index.json"), 'r') as f:
+            index = json.load(f)
+        if index.get("version") != STORE_VERSION:
+            raise ValueError(f"{store_dir}: unsupported keypoint store version {index.get('version')}")
+        self.store_dir = store_dir
+        self.num_keypoints = index["num_keypoints"]
+        self.keypoint_names = index["keypoint_names"]
+        self.classes = index["classes"]
+        self.videos = index["videos"]
+        self.file_names = index["file_names"]
+        self.image_sizes = index["image_sizes"]
+        self.keypoints = np.load(os.path.join(store_dir, "keypoints.npy"), mmap_mode='r')
+        self.bbox = np.load(os.path.join(store_dir, "bbox.npy"), mmap_mode='r')
+        self.video_ids = np.load(os.path.join(store_dir, "video.npy"), mmap_mode='r')
+        self.frames = np.load(os.path.join(store_dir, "frame.npy"), mmap_mode='r')
+        self.labels = np.load(os.path.join(store_dir, "label.npy"), mmap_mode='r')
+        self.image_ids = np.load(os.path.join(store_dir, "image_id.npy"), mmap_mode='r')
+        self.video_offsets = np.load(os.path.join(store_dir, "video_offsets.npy"))
+        self.video_positions = {video: i for i, video in enumerate(self.videos)}
+
+    def __len__(self):
+        return len(self.file_names)
+
+    def video_rows(self, video):
+        """Row slice of one video (name like "52723_8" or index)."""
+        i = self.video_positions[video] if isinstance(video, str) else video
+        return slice(int(self.video_offsets[i]), int(self.video_offsets[i + 1]))
+
+    def video(self, video):
+        """(frames, K, 3) keypoints of one video in frame order."""
+        return self.keypoints[self.video_rows(video)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / inspect a memory-mapped keypoint store from a COCO file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Convert a COCO keypoint file into a store")
+    build.add_argument("--coco", required=True, help="COCO file, e.g. annotations_v4/merged_coco.json")
+    build.add_argument("--out", required=True, help="Store folder to create, e.g. annotations_v4/keypoints.store")
+    build.add_argument("--classes", nargs='*', default=[],
+                       help="name=export.json per class; a frame gets the class of the export that contains it")
+    build.add_argument("--num_keypoints", type=int, default=NUM_KEYPOINTS)
+
+    info = subparsers.add_parser("info", help="Print a summary of a store")
+    info.add_argument("--store", required=True)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        class_files = []
+        for item in args.classes:
+            name, sep, path = item.partition('=')
+            if not sep:
+                parser.error(f"--classes expects name=file, got '{item}'")
+            class_files.append((name, path))
+        build_store(args.coco, args.out, class_files, args.num_keypoints)
+    else:
+        store = KeypointStore(args.store)
+        print(f"{args.store}: {len(store)} skeletons, {len(store.videos)} videos, {store.num_keypoints} keypoints")
+        for i, name in enumerate(store.classes):
+            labels = np.asarray(store.labels)
+            videos = len(np.unique(np.asarray(store.video_ids)[labels == i]))
+            print(f"  {name}: {int((labels == i).sum())} skeletons in {videos} videos")
+
+if __name__ == "__main__":
+    main()
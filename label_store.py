@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+label_store.py
+
+Packs a YOLO pose label tree (e.g. yolopose_v4/data/labels with train/val/test folders of
+<stem>.txt files) into one compact store that can be memory-mapped, and unpacks it again.
+
+The store is a folder with three files:
+  labels.npy   float32 array (objects, 5 + K*3): class, bbox (x, y, w, h), K keypoints (x, y, v)
+  offsets.npy  int64 array (images + 1): objects of image i are labels[offsets[i]:offsets[i + 1]]
+  index.json   format version, keypoint count and the label path of each image relative to the
+               tree root without ".txt" (e.g. "train/52723_8_10"), in the same order as offsets,
+               plus the original text of the files that unpacking wouldn't reproduce exactly
+
+Images are stored sorted by relative path, so every split is one contiguous block: looking up
+one image is a dict lookup plus a slice, and scanning a split is a single sequential read of
+the memory-mapped array instead of thousands of open() calls.
+
+Unpacking writes the numbers the way the CVAT ultralytics_yolo_pose_1.0 export does (class and
+visibility as integers, coordinates with 6 decimals). Files written differently, e.g. the "0.0 0.0 0"
+keypoints of yolo_annot_correction.py, keep their original text in index.json, so every tree
+round-trips byte for byte and an export tree adds nothing to the index.
+
+Usage:
+python label_store.py pack --labels yolopose_v4/data/labels --out yolopose_v4/data/labels.store
+python label_store.py unpack --store yolopose_v4/data/labels.store --out yolopose_v4/data/labels
+python label_store.py info --store yolopose_v4/data/labels.store
+
+In Python / notebooks:
+    from label_store import LabelStore
+    store = LabelStore("yolopose_v4/data/labels.store")
+    store["52723_8_10"]        # (objects, 56) float32 view
+    store.split("train")       # all train objects as one contiguous block
+"""
+
+import argparse
+import bisect
+import json
+import os
+
+import numpy as np
+
+STORE_VERSION = 1
+NUM_KEYPOINTS = 17
+
+def find_label_files(labels_root):
+    """Relative paths (without .txt) of all label files under labels_root, sorted."""
+    keys = []
+    pending = [labels_root]
+    while pending:
+        directory = pending.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    pending.append(entry.path)
+                elif entry.name.endswith(".txt"):
+                    rel = os.path.relpath(entry.path, labels_root)[:-len(".txt")]
+                    keys.append(rel.replace(os.sep, "/"))
+    return sorted(keys)
+
+def pack_labels(labels_root, store_dir, num_keypoints=NUM_KEYPOINTS):
+    width = 5 + num_keypoints * 3
+    keys = find_label_files(labels_root)
+
+    # Collect every token first, then convert them to float32 in one call
+    tokens = []
+    texts = []
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    for i, key in enumerate(keys):
+        with open(os.path.join(labels_root, key + ".txt"), 'r', newline='') as f:
+            texts.append(f.read())
+        values = texts[-1].split()
+        if len(values) % width:
+            raise ValueError(f"{key}.txt: {len(values)} values is not a multiple of {width} "
+                             f"(5 + {num_keypoints} keypoints * 3)")
+        tokens.extend(values)
+        offsets[i + 1] = offsets[i] + len(values) // width
+
+    labels = np.array(tokens, dtype=np.float32).reshape(-1, width)
+
+    # Only files the export format doesn't reproduce need their text
+    original_texts = {}
+    for i, key in enumerate(keys):
+        if format_label_text(labels[offsets[i]:offsets[i + 1]], num_keypoints) != texts[i]:
+            original_texts[key] = texts[i]
+
+    os.makedirs(store_dir, exist_ok=True)
+    np.save(os.path.join(store_dir, "labels.npy"), labels)
+    np.save(os.path.join(store_dir, "offsets.npy"), offsets)
+    with open(os.path.join(store_dir, "index.json"), 'w') as f:
+        json.dump({"version": STORE_VERSION, "num_keypoints": num_keypoints, "keys": keys,
+                   "texts": original_texts}, f)
+
+    print(f"Packed {len(keys)} label files / {len(labels)} objects from {labels_root} into {store_dir}"
+          + (f" ({len(original_texts)} not in the export format, kept as text)" if original_texts else ""))
+
+class LabelStore:
+    """Read-only, memory-mapped view of a packed label store."""
+
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, "index.json"), 'r') as f:
+            index = json.load(f)
+        if index.get("version") != STORE_VERSION:
+            raise ValueError(f"{store_dir}: unsupported label store version {index.get('version')}")
+
+        self.store_dir = store_dir
+        self.num_keypoints = index["num_keypoints"]
+        self.keys = index["keys"]
+        # Stores packed before the texts were kept have none
+        self.texts = index.get("texts", {})
+        self.labels = np.load(os.path.join(store_dir, "labels.npy"), mmap_mode='r')
+        self.offsets = np.load(os.path.join(store_dir, "offsets.npy"))
+
+        # Both "train/52723_8_10" and the bare stem "52723_8_10" can be used for lookups
+        self.positions = {}
+        for i, key in enumerate(self.keys):
+            self.positions[key] = i
+            self.positions.setdefault(key.rsplit("/", 1)[-1], i)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def __getitem__(self, key):
+        i = self.positions[key]
+        return self.labels[self.offsets[i]:self.offsets[i + 1]]
+
+    def split(self, name):
+        """All objects of one split folder (e.g. "train") as one contiguous block."""
+        # Keys are sorted, so "train/..." is the range ["train/", "train0")
+        name = name.rstrip("/")
+        first = bisect.bisect_left(self.keys, name + "/")
+        end = bisect.bisect_left(self.keys, name + "0")
+        return self.labels[self.offsets[first]:self.offsets[end]]
+
+def format_label_line(row, num_keypoints=NUM_KEYPOINTS):
+    """Format one object the way the Ultralytics YOLO pose export writes it."""
+    parts = [str(int(row[0]))]
+    parts.extend(f"{value:.6f}" for value in row[1:5])
+    for x, y, v in row[5:].reshape(num_keypoints, 3):
+        parts.extend((f"{x:.6f}", f"{y:.6f}", str(int(v))))
+    return ' '.join(parts)
+
+def format_label_text(rows, num_keypoints=NUM_KEYPOINTS):
+    return ''.join(format_label_line(row, num_keypoints) + '\n' for row in rows)
+
+def unpack_labels(store_dir, labels_root):
+    store = LabelStore(store_dir)
+    for i, key in enumerate(store.keys):
+        out_file = os.path.join(labels_root, *key.split("/")) + ".txt"
+        os.makedirs(os.path.dirname(out_file), exist_ok=True)
+        text = store.texts.get(key)
+        if text is None:
+            text = format_label_text(store.labels[store.offsets[i]:store.offsets[i + 1]], store.num_keypoints)
+        with open(out_file, 'w', newline='') as f:
+            f.write(text)
+    print(f"Unpacked {len(store)} label files / {len(store.labels)} objects from {store_dir} into {labels_root}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack/unpack YOLO pose label trees")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pack = subparsers.add_parser("pack", help="Pack a label tree into a store")
+    pack.add_argument("--labels", required=True, help="Label tree root, e.g. yolopose_v4/data/labels")
+    pack.add_argument("--out", required=True, help="Store folder to create, e.g. yolopose_v4/data/labels.store")
+    pack.add_argument("--num_keypoints", type=int, default=NUM_KEYPOINTS)
+
+    unpack = subparsers.add_parser("unpack", help="Write a store back out as YOLO .txt files")
+    unpack.add_argument("--store", required=True)
+    unpack.add_argument("--out", required=True, help="Label tree root to write")
+
+    info = subparsers.add_parser("info", help="Print a summary of a store")
+    info.add_argument("--store", required=True)
+
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        pack_labels(args.labels, args.out, args.num_keypoints)
+    elif args.command == "unpack":
+        unpack_labels(args.store, args.out)
+    else:
+        store = LabelStore(args.store)
+        splits = sorted({key.split("/")[0] for key in store.keys if "/" in key})
+        print(f"{args.store}: {len(store)} images, {len(store.labels)} objects, {store.num_keypoints} keypoints")
+        for name in splits:
+            print(f"  {name}: {len(store.split(name))} objects")
+
+if __name__ == "__main__":
+    main()
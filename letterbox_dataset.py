@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+letterbox_dataset.py
+
+Ultralytics dataset and trainer that read the training images from an image_cache.py cache
+instead of decoding JPEGs every epoch. Used by train.py --letterbox_cache.
+
+Only the train split comes from the cache; validation uses the normal Ultralytics dataset, so
+metrics are computed exactly as before. Training labels are still read and checked by
+Ultralytics and then mapped onto the letterboxed image with the scale and padding stored in
+the cache. The gray padding is therefore part of every training image, which the mosaic and
+random affine augmentations handle like any other border. A frame missing from the cache, or
+one whose size changed since the cache was built, stops the run with a hint to rebuild it.
+
+The classes are in their own module (and not in train.py) so dataloader workers can import
+them on Windows, where the dataset is pickled into each worker.
+"""
+
+import os
+
+import numpy as np
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolo.pose import PoseTrainer
+from ultralytics.utils.torch_utils import unwrap_model
+
+from image_cache import LetterboxCache, letterbox_labels
+
+class LetterboxPoseDataset(YOLODataset):
+    def __init__(self, *args, cache_dir, **kwargs):
+        self.cache_dir = cache_dir
+        self._cache = None
+        super().__init__(*args, **kwargs)
+
+    @property
+    def cache_view(self):
+        # Opened lazily in every process; the memory maps are never pickled into the workers
+        if self._cache is None:
+            self._cache = LetterboxCache(self.cache_dir)
+        return self._cache
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_cache"] = None
+        return state
+
+    def cache_position(self, im_file):
+        stem = os.path.splitext(os.path.basename(im_file))[0]
+        position = self.cache_view.positions.get(stem)
+        if position is None:
+            raise ValueError(f"{im_file} is not in {self.cache_dir}; rebuild it with image_cache.py")
+        return position
+
+    def get_labels(self):
+        labels = super().get_labels()
+        cache = self.cache_view
+        for label in labels:
+            entry = cache.entries[self.cache_position(label["im_file"])]
+            if tuple(entry["orig_hw"]) != tuple(label["shape"]):
+                raise ValueError(f"{label['im_file']} is {label['shape']} but {entry['orig_hw']} in {self.cache_dir}; "
+                                 "rebuild it with image_cache.py")
+            keypoints = label["keypoints"]
+            count, num_keypoints = keypoints.shape[:2]
+            rows = np.concatenate([label["cls"].reshape(count, 1), label["bboxes"], keypoints.reshape(count, -1)], axis=1)
+            rows = letterbox_labels(rows, entry["orig_hw"], entry["scale"], entry["pad"], cache.imgsz, num_keypoints)
+            label["bboxes"] = rows[:, 1:5].astype(np.float32)
+            label["keypoints"] = rows[:, 5:].reshape(count, num_keypoints, 3).astype(np.float32)
+            label["shape"] = (cache.imgsz, cache.imgsz)
+        return labels
+
+    def load_image(self, i, rect_mode=True, resize_short=False):
+        im = np.array(self.cache_view.images[self.cache_position(self.im_files[i])])
+        if self.augment:
+            # Mosaic picks its extra images from this buffer
+            self.buffer.append(i)
+            if len(self.buffer) > self.max_buffer_length:
+                self.buffer.pop(0)
+        return im, im.shape[:2], im.shape[:2]
+
+class LetterboxPoseTrainer(PoseTrainer):
+    """PoseTrainer whose train split comes from cache_root/train (set cache_root before training)."""
+
+    cache_root = None
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        if mode != "train":
+            return super().build_dataset(img_path, mode, batch)
+        cache_dir = os.path.join(self.cache_root, "train")
+        imgsz = LetterboxCache(cache_dir).imgsz
+        if imgsz != self.args.imgsz:
+            raise ValueError(f"{cache_dir} was built for imgsz {imgsz}, training uses {self.args.imgsz}")
+        cfg = self.args
+        return LetterboxPoseDataset(
+            img_path=img_path, imgsz=cfg.imgsz, batch_size=batch, augment=True, hyp=cfg, rect=cfg.rect,
+            cache=None, single_cls=cfg.single_cls or False, stride=max(int(unwrap_model(self.model).stride.max()), 32),
+            pad=0.0, prefix="train: ", task=cfg.task, classes=cfg.classes, data=self.data,
+            fraction=cfg.fraction, cache_dir=cache_dir)
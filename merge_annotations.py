@@ -21,11 +21,36 @@ You’ll get an updated set of train/val/test JSONs that keep frames from each v
   python merge_annotations.py \
     --ann_files annotations_v1/Correct_n2_3_7_100.json annotations_v1/lumbar_3_7_dell_111.json \
     --out annotations_v1/merged_coco.json
+
+For very large exports add --stream. Each input is then parsed incrementally and the
+merged JSON is written as it goes, so memory stays bounded by the image ID maps instead
+of the full files. The output is byte-identical to the default mode.
+
+  python merge_annotations.py --stream \
+    --ann_files annotations_v4/correct-phase-I-578Done-Mar14.json annotations_v4/lumbar-phase-I-322Done-Mar14.json \
+    --out annotations_v4/merged_coco.json
+
+Add --incremental to keep a content-hashed manifest (merged_coco.manifest.json) next to the
+output. Reruns then only parse inputs that are new or changed; unchanged inputs are copied
+from the previous merged file. The result is still identical to a full merge.
+
+  python merge_annotations.py --incremental \
+    --ann_files annotations_v4/correct-phase-I-578Done-Mar14.json annotations_v4/lumbar-phase-I-322Done-Mar14.json \
+    --out annotations_v4/merged_coco.json
 """
 
 import json
 import argparse
 import copy
+import hashlib
+import os
+
+from coco_index import load_json
+from file_transfer import file_sha256
+
+MANIFEST_VERSION = 1
+STREAM_CHUNK_SIZE = 1 << 16
+JSON_WHITESPACE = ' \t\r\n'
 
 def merge_coco_annotations(ann_files, out_file):
     """
@@ -50,8 +75,7 @@ def merge_coco_annotations(ann_files, out_file):
     categories_copied = False
 
     for ann_file in ann_files:
-        with open(ann_file, 'r') as f:
-            data = json.load(f)
+        data = load_json(ann_file)
 
         # Copy categories from the first file only (assuming they match across files)
         if not categories_copied:
@@ -122,14 +146,391 @@ def merge_coco_annotations(ann_files, out_file):
     print(f"Total images (with annotations): {len(merged['images'])}")
     print(f"Total annotations: {len(merged['annotations'])}")
 
+class JsonStream:
+    """
+    Minimal incremental reader for one JSON document.
+    Keeps only a sliding window of the file in memory and decodes one value at a time,
+    so large top-level arrays can be walked element by element.
+    """
+
+    def __init__(self, f, chunk_size=STREAM_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        # Drop the part of the window that has already been consumed
+        if self.pos > self.chunk_size:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character ('' at end of file)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in JSON_WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed JSON in {self.f.name}: expected '{char}', found '{found}'")
+        self.pos += 1
+
+    def decode(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        decoder = json.JSONDecoder()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number ending exactly at the window edge might continue in the next chunk
+            if end >= len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def iter_array(self):
+        """Yield the elements of the array starting at the current position."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            if self.peek() == ']':
+                self.pos += 1
+                return
+            self.expect(',')
+
+def iter_coco_array(ann_file, key):
+    """
+    Yield the elements of one top-level array (e.g. "images") of a COCO file
+    without loading the whole file. Other large arrays are skipped element by element.
+    """
+    with open(ann_file, 'r') as f:
+        stream = JsonStream(f)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            name = stream.decode()
+            stream.expect(':')
+            if stream.peek() == '[':
+                items = stream.iter_array()
+                if name == key:
+                    yield from items
+                    return
+                for _ in items:
+                    pass
+            else:
+                stream.decode()
+            if stream.peek() == '}':
+                return
+            stream.expect(',')
+
+def write_json_array(f, items):
+    """Write items as a JSON array, formatted exactly like json.dump would."""
+    f.write('[')
+    first = True
+    for item in items:
+        if not first:
+            f.write(', ')
+        f.write(json.dumps(item))
+        first = False
+    f.write(']')
+
+def plan_ann_file(ann_file, first_image_id):
+    """
+    First streaming pass over one input: assign new image IDs starting at first_image_id
+    and find which of them are referenced by at least one annotation.
+    """
+    image_id_map = {}
+    next_image_id = first_image_id
+    for img in iter_coco_array(ann_file, "images"):
+        image_id_map[img["id"]] = next_image_id
+        next_image_id += 1
+
+    annotated_image_ids = set()
+    annotation_count = 0
+    for ann in iter_coco_array(ann_file, "annotations"):
+        if ann["image_id"] in image_id_map:
+            annotated_image_ids.add(image_id_map[ann["image_id"]])
+            annotation_count += 1
+
+    return {
+        "file": ann_file,
+        "first_image_id": first_image_id,
+        "image_count": next_image_id - first_image_id,
+        "image_id_map": image_id_map,
+        "annotated_image_ids": annotated_image_ids,
+        "annotation_count": annotation_count,
+    }
+
+def iter_annotated_images(plan):
+    """Yield the images of a planned input that have annotations, with their new IDs."""
+    for offset, img in enumerate(iter_coco_array(plan["file"], "images")):
+        new_img_id = plan["first_image_id"] + offset
+        if new_img_id in plan["annotated_image_ids"]:
+            img["id"] = new_img_id
+            yield img
+
+def iter_remapped_annotations(plan, first_ann_id):
+    """Yield the annotations of a planned input with new IDs and image references."""
+    image_id_map = plan["image_id_map"]
+    new_ann_id = first_ann_id
+    for ann in iter_coco_array(plan["file"], "annotations"):
+        if ann["image_id"] not in image_id_map:
+            # Image wasn't added for some reason, skip
+            continue
+        ann["id"] = new_ann_id
+        ann["image_id"] = image_id_map[ann["image_id"]]
+        new_ann_id += 1
+        yield ann
+
+def merge_coco_annotations_streaming(ann_files, out_file):
+    """
+    Streaming variant of merge_coco_annotations.
+    Produces the same output, but never holds a whole input file or the merged dict in memory.
+
+    Each input is read in three incremental passes:
+      1) collect image IDs and the image IDs referenced by annotations,
+      2) write the annotated images with offset IDs,
+      3) write the annotations with offset IDs.
+    Only integer ID maps are kept between passes.
+    """
+
+    # 1) Assign new IDs exactly like the in-memory merge does
+    plans = []
+    current_image_id = 0
+    for ann_file in ann_files:
+        plan = plan_ann_file(ann_file, current_image_id + 1)
+        current_image_id += plan["image_count"]
+        plans.append(plan)
+
+    categories = list(iter_coco_array(ann_files[0], "categories")) if ann_files else []
+
+    def annotated_images():
+        for plan in plans:
+            yield from iter_annotated_images(plan)
+
+    def remapped_annotations():
+        current_ann_id = 0
+        for plan in plans:
+            yield from iter_remapped_annotations(plan, current_ann_id + 1)
+            current_ann_id += plan["annotation_count"]
+
+    # 2) + 3) Write the merged file as we go, matching json.dump's layout
+    with open(out_file, 'w') as f:
+        f.write('{"licenses": [], "info": {}, "categories": ')
+        f.write(json.dumps(categories))
+        f.write(', "images": ')
+        write_json_array(f, annotated_images())
+        f.write(', "annotations": ')
+        write_json_array(f, remapped_annotations())
+        f.write('}')
+
+    print(f"Merged annotations written to: {out_file}")
+    print(f"Total images (with annotations): {sum(len(p['annotated_image_ids']) for p in plans)}")
+    print(f"Total annotations: {sum(p['annotation_count'] for p in plans)}")
+
+# ----------------------------------------------------------
+# Incremental merge: reuse unchanged inputs from a manifest
+# ----------------------------------------------------------
+
+def default_manifest_path(out_file):
+    """annotations_v4/merged_coco.json -> annotations_v4/merged_coco.manifest.json"""
+    return os.path.splitext(out_file)[0] + ".manifest.json"
+
+def load_merge_manifest(manifest_file, out_file):
+    """
+    Return the manifest written by the last incremental merge, or None if it can't be trusted
+    (missing, different format version, or the merged file was changed since).
+    """
+    if not os.path.exists(manifest_file) or not os.path.exists(out_file):
+        return None
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    if manifest.get("output_sha256") != file_sha256(out_file):
+        return None
+    return manifest
+
+class HashingWriter:
+    """Binary file wrapper that tracks the byte offset and sha256 of everything written."""
+
+    def __init__(self, f):
+        self.f = f
+        self.offset = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.f.write(data)
+        self.sha256.update(data)
+        self.offset += len(data)
+
+def merge_coco_annotations_incremental(ann_files, out_file, manifest_file=None):
+    """
+    Incremental variant of merge_coco_annotations.
+
+    A manifest next to the merged file records, for each input, its sha256, the image and
+    annotation ID ranges it was given, how many images/annotations it contributed and where
+    those bytes live inside the merged file. On a rerun, an input whose hash and starting IDs
+    are unchanged is copied byte-for-byte from the previous output instead of being parsed;
+    new or changed inputs (and anything whose IDs shifted) are merged with the streaming passes.
+    The result is identical to a full merge.
+    """
+    manifest_file = manifest_file or default_manifest_path(out_file)
+    previous = load_merge_manifest(manifest_file, out_file)
+    cached_inputs = {}
+    if previous is not None:
+        for entry in previous["inputs"]:
+            cached_inputs[(entry["sha256"], entry["first_image_id"], entry["first_ann_id"])] = entry
+
+    # 1) Decide per input whether the previous output can be reused
+    entries = []
+    current_image_id = 0
+    current_ann_id = 0
+    for ann_file in ann_files:
+        digest = file_sha256(ann_file)
+        cached = cached_inputs.get((digest, current_image_id + 1, current_ann_id + 1))
+        if cached is not None:
+            entry = dict(cached, file=ann_file)
+            plan = None
+        else:
+            plan = plan_ann_file(ann_file, current_image_id + 1)
+            entry = {
+                "file": ann_file,
+                "sha256": digest,
+                "first_image_id": current_image_id + 1,
+                "image_count": plan["image_count"],
+                "first_ann_id": current_ann_id + 1,
+                "annotation_count": plan["annotation_count"],
+                "images_kept": len(plan["annotated_image_ids"]),
+            }
+        current_image_id += entry["image_count"]
+        current_ann_id += entry["annotation_count"]
+        entries.append((entry, plan))
+
+    reused = sum(1 for _, plan in entries if plan is None)
+    reuse_categories = (previous is not None and entries and entries[0][1] is None
+                        and previous.get("categories_sha256") == entries[0][0]["sha256"])
+
+    # 2) Write the merged file, copying reused byte ranges from the previous output
+    tmp_file = out_file + ".tmp"
+    old_f = open(out_file, 'rb') if reused or reuse_categories else None
+    try:
+        with open(tmp_file, 'wb') as raw:
+            out = HashingWriter(raw)
+
+            def copy_segment(segment):
+                old_f.seek(segment[0])
+                remaining = segment[1] - segment[0]
+                while remaining > 0:
+                    chunk = old_f.read(min(remaining, 1 << 20))
+                    if not chunk:
+                        raise ValueError(f"{out_file} is shorter than its manifest says")
+                    out.write(chunk)
+                    remaining -= len(chunk)
+
+            def write_items(items, wrote_any):
+                """Write items after an optional ', ', return the byte segment of the items."""
+                start = None
+                for item in items:
+                    if wrote_any or start is not None:
+                        out.write(b', ')
+                    if start is None:
+                        start = out.offset
+                    out.write(json.dumps(item).encode('utf-8'))
+                return [start, out.offset] if start is not None else [out.offset, out.offset]
+
+            out.write(b'{"licenses": [], "info": {}, "categories": ')
+            categories_start = out.offset
+            if reuse_categories:
+                copy_segment(previous["categories_segment"])
+            else:
+                categories = list(iter_coco_array(ann_files[0], "categories")) if ann_files else []
+                out.write(json.dumps(categories).encode('utf-8'))
+            categories_segment = [categories_start, out.offset]
+
+            for key, segment_key in (("images", "images_segment"), ("annotations", "annotations_segment")):
+                out.write(f', "{key}": ['.encode('utf-8'))
+                wrote_any = False
+                for entry, plan in entries:
+                    if plan is None:
+                        segment = entry[segment_key]
+                        if segment[1] > segment[0]:
+                            if wrote_any:
+                                out.write(b', ')
+                            start = out.offset
+                            copy_segment(segment)
+                            entry[segment_key] = [start, out.offset]
+                        else:
+                            entry[segment_key] = [out.offset, out.offset]
+                    elif key == "images":
+                        entry[segment_key] = write_items(iter_annotated_images(plan), wrote_any)
+                    else:
+                        entry[segment_key] = write_items(
+                            iter_remapped_annotations(plan, entry["first_ann_id"]), wrote_any)
+                    wrote_any = wrote_any or entry[segment_key][1] > entry[segment_key][0]
+                out.write(b']')
+            out.write(b'}')
+    finally:
+        if old_f is not None:
+            old_f.close()
+    os.replace(tmp_file, out_file)
+
+    # 3) Record what each input contributed for the next run
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "output_sha256": out.sha256.hexdigest(),
+        "categories_sha256": entries[0][0]["sha256"] if entries else None,
+        "categories_segment": categories_segment,
+        "inputs": [entry for entry, _ in entries],
+    }
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"Merged annotations written to: {out_file}")
+    print(f"Reused cached results for {reused} of {len(entries)} input file(s) (manifest: {manifest_file})")
+    print(f"Total images (with annotations): {sum(entry['images_kept'] for entry, _ in entries)}")
+    print(f"Total annotations: {sum(entry['annotation_count'] for entry, _ in entries)}")
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--ann_files", nargs='+', required=True,
                         help="List of COCO annotation JSON files to merge")
     parser.add_argument("--out", required=True, help="Output merged JSON file")
+    parser.add_argument("--stream", action="store_true",
+                        help="Parse inputs incrementally and write the output as it goes (bounded memory)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse unchanged inputs recorded in the manifest next to --out; only new or changed files are parsed")
+    parser.add_argument("--manifest", default=None,
+                        help="Manifest path for --incremental (default: <out without .json>.manifest.json)")
     args = parser.parse_args()
 
-    merge_coco_annotations(args.ann_files, args.out)
+    if args.incremental:
+        merge_coco_annotations_incremental(args.ann_files, args.out, args.manifest)
+    elif args.stream:
+        merge_coco_annotations_streaming(args.ann_files, args.out)
+    else:
+        merge_coco_annotations(args.ann_files, args.out)
 
 if __name__ == "__main__":
     main()
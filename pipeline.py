@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+pipeline.py
+
+Runs the whole dataset refresh from one config per dataset version (see yolopose_v4/pipeline.yaml):
+
+  merge    merge_annotations.py --incremental   annotations_vN/*.json -> annotations_vN/merged_coco.json
+  select   select_and_copy_images.py            data_vN/<task folders> -> data_vN/merged
+  convert  coco_to_yolo_pose.py                 merged_coco.json + data_vN/merged -> yolo_export
+  split    split_img_txt_yolo.py                yolo_export -> yolopose_vN/data/{images,labels}
+  correct  yolo_annot_correction.py             yolopose_vN/data/labels/{train,val,test}
+
+Like make, a stage only runs when its command or one of its inputs changed since its last
+successful run, or when one of its outputs is missing. Input and output hashes are stored in
+<config>.state.json next to the config (files are hashed by content, folders by the names,
+sizes and modification times of the files inside). A folder output is emptied before its
+stage reruns, so no stale files survive a re-split.
+
+Folders the pipeline didn't create are never deleted. yolo_export should be a new folder, not
+the CVAT export: convert stops when it already holds files it didn't write. Likewise, when
+yolopose_vN/data holds a split made by hand the split stage stops instead of mixing the two
+(frames would end up in two splits); --force split replaces it.
+
+Several configs run concurrently (one thread per dataset version, stages of one version in order).
+
+Usage:
+python pipeline.py --configs yolopose_v4/pipeline.yaml
+python pipeline.py --configs yolopose_v3/pipeline.yaml yolopose_v4/pipeline.yaml
+python pipeline.py --configs yolopose_v4/pipeline.yaml --dry-run      # only show what would run
+python pipeline.py --configs yolopose_v4/pipeline.yaml --force split  # rerun split and everything after it
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from file_transfer import file_sha256
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_VERSION = 1
+STAGE_NAMES = ["merge", "select", "convert", "split", "correct"]
+
+def script(name):
+    return os.path.join(SCRIPT_DIR, name)
+
+def build_stages(cfg):
+    """Stage list for one dataset version: dicts with name, command, inputs, outputs (and clean_outputs)."""
+    python = sys.executable
+    link_mode = cfg.get("link_mode", "copy")
+    merged_coco = cfg["merged_coco"]
+    merged_images = cfg["merged_images"]
+    yolo_export = cfg["yolo_export"]
+    images_dir = os.path.join(cfg["data_dir"], "images")
+    labels_dir = os.path.join(cfg["data_dir"], "labels")
+    split_labels = [os.path.join(labels_dir, split) for split in ("train", "val", "test")]
+
+    split_command = [python, script("split_img_txt_yolo.py"), "--folder_path", yolo_export,
+                     "--out_dir", cfg["data_dir"], "--link-mode", link_mode]
+    if cfg.get("split_seed") is not None:
+        split_command += ["--seed", str(cfg["split_seed"])]
+
+    return [
+        {"name": "merge",
+         "command": [python, script("merge_annotations.py"), "--incremental",
+                     "--ann_files", *cfg["ann_files"], "--out", merged_coco],
+         "inputs": list(cfg["ann_files"]),
+         "outputs": [merged_coco]},
+        {"name": "select",
+         "command": [python, script("select_and_copy_images.py"), "--json_file", merged_coco,
+                     "--source_dirs", *cfg["source_dirs"], "--target_dir", merged_images,
+                     "--link-mode", link_mode],
+         "inputs": [merged_coco, *cfg["source_dirs"]],
+         "outputs": [merged_images]},
+        {"name": "convert",
+         "command": [python, script("coco_to_yolo_pose.py"), "--coco", merged_coco,
+                     "--images", merged_images, "--out", yolo_export, "--link-mode", link_mode],
+         "inputs": [merged_coco, merged_images],
+         "outputs": [yolo_export],
+         "clean_outputs": True},
+        {"name": "split",
+         "command": split_command,
+         "inputs": [yolo_export],
+         "outputs": [images_dir, labels_dir],
+         "clean_outputs": True},
+        {"name": "correct",
+         "command": [python, script("yolo_annot_correction.py"), "--labels", *split_labels],
+         "inputs": [labels_dir],
+         "outputs": [labels_dir]},
+    ]
+
+def path_signature(path):
+    """sha256 of a file's content, or of the (name, size, mtime) list of a folder's files."""
+    if os.path.isfile(path):
+        return file_sha256(path)
+    if not os.path.isdir(path):
+        return None
+
+    entries = []
+    pending = [path]
+    while pending:
+        directory = pending.pop()
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir():
+                    pending.append(entry.path)
+                else:
+                    stat = entry.stat()
+                    entries.append(f"{os.path.relpath(entry.path, path)}\0{stat.st_size}\0{stat.st_mtime_ns}")
+    h = hashlib.sha256()
+    for line in sorted(entries):
+        h.update(line.encode('utf-8') + b'\n')
+    return "dir:" + h.hexdigest()
+
+def signatures(paths):
+    return {path: path_signature(path) for path in paths}
+
+def state_path(config_file):
+    return os.path.splitext(config_file)[0] + ".state.json"
+
+def load_state(config_file):
+    path = state_path(config_file)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        state = json.load(f)
+    return state.get("stages", {}) if state.get("version") == STATE_VERSION else {}
+
+def save_state(config_file, stages_state):
+    with open(state_path(config_file), 'w') as f:
+        json.dump({"version": STATE_VERSION, "stages": stages_state}, f, indent=2)
+
+def command_key(command):
+    """The command without interpreter and script location, so moving the repo doesn't force a rerun."""
+    return [os.path.basename(command[1])] + command[2:]
+
+def out_of_date_reason(stage, previous):
+    """Why the stage has to run, or None when it is up to date."""
+    if previous is None:
+        return "never ran"
+    if previous.get("command") != command_key(stage["command"]):
+        return "command changed"
+    missing = [path for path in stage["outputs"] if not os.path.exists(path)]
+    if missing:
+        return f"missing output {missing[0]}"
+    current = signatures(stage["inputs"])
+    changed = [path for path, sig in current.items() if previous.get("inputs", {}).get(path) != sig]
+    if changed:
+        return f"input changed: {changed[0]}"
+    return None
+
+def run_pipeline(config_file, force_from=None, dry_run=False):
+    """Run the out-of-date stages of one config in order. Returns True on success."""
+    with open(config_file, 'r') as f:
+        cfg = yaml.safe_load(f)
+    label = cfg.get("version", os.path.basename(os.path.dirname(config_file)) or config_file)
+    stages = build_stages(cfg)
+    state = load_state(config_file)
+
+    forced = False
+    upstream_ran = False
+    for stage in stages:
+        forced = forced or stage["name"] == force_from
+        previous = state.get(stage["name"])
+        if forced:
+            reason = "forced"
+        elif upstream_ran and dry_run:
+            reason = "upstream stage would run"
+        else:
+            reason = out_of_date_reason(stage, previous)
+
+        if reason is None:
+            print(f"[{label}:{stage['name']}] up to date")
+            continue
+
+        # Folders from outside the pipeline (e.g. a split made by hand) are only replaced with --force
+        foreign = [path for path in stage["outputs"] if previous is None and not forced and stage.get("clean_outputs")
+                   and path not in stage["inputs"] and os.path.isdir(path) and os.listdir(path)]
+        if foreign:
+            print(f"[{label}:{stage['name']}] {foreign[0]} was not made by the pipeline; move it away, point the "
+                  f"config at a new folder or rerun with --force {stage['name']} to replace it")
+            if dry_run:
+                continue
+            save_state(config_file, state)
+            return False
+
+        print(f"[{label}:{stage['name']}] running ({reason})")
+        upstream_ran = True
+        if dry_run:
+            continue
+
+        # Start folder outputs from scratch: ones this pipeline created before, and the outputs of
+        # stages that must not mix with older files (split) when forced
+        if previous is not None or (forced and stage.get("clean_outputs")):
+            for path in stage["outputs"]:
+                if os.path.isdir(path) and path not in stage["inputs"]:
+                    shutil.rmtree(path)
+
+        result = subprocess.run(stage["command"], capture_output=True, text=True)
+        # Keep only the final state of \r progress lines
+        lines = [line.split('\r')[-1] for line in (result.stdout + result.stderr).splitlines()]
+        for line in lines:
+            if line.strip():
+                print(f"[{label}:{stage['name']}] {line}")
+        if result.returncode != 0:
+            print(f"[{label}:{stage['name']}] failed with exit code {result.returncode}")
+            save_state(config_file, state)
+            return False
+
+        # Inputs are hashed after the run so in-place stages (correct) are up to date next time
+        state[stage["name"]] = {
+            "command": command_key(stage["command"]),
+            "inputs": signatures(stage["inputs"]),
+            "outputs": signatures(stage["outputs"]),
+        }
+        save_state(config_file, state)
+
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the dataset refresh pipeline, skipping up-to-date stages")
+    parser.add_argument("--configs", nargs='+', required=True,
+                        help="Pipeline configs, one per dataset version (e.g. yolopose_v4/pipeline.yaml)")
+    parser.add_argument("--force", choices=STAGE_NAMES, default=None,
+                        help="Rerun this stage and every stage after it")
+    parser.add_argument("--dry-run", action="store_true", help="Only print which stages would run")
+    args = parser.parse_args()
+
+    with ThreadPoolExecutor(max_workers=len(args.configs)) as executor:
+        results = list(executor.map(lambda config: run_pipeline(config, args.force, args.dry_run), args.configs))
+
+    if not all(results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+pseudo_label.py
+
+Pseudo-labels the frames that were never annotated: every image in the task folders of
+data_vN (e.g. data_v4/img-correct-phase-I-578Done-Mar14, 579 frames, of which only the annotated
+ones are in merged_coco.json) that is not in the merged COCO file is run through the fine-tuned
+model (ONNX Runtime on CPU in micro-batches, see infer_onnx.py).
+
+Detections are kept when the person score is at least --conf and at least --min_keypoints
+keypoints reach their confidence threshold (--kpt_conf: one value, or 17 values in keypoint
+order, e.g. stricter for the wrists). Keypoints below their threshold are written as 0 0 0 (not
+labeled). The output is a COCO keypoint file with the categories of the merged file, so it can
+be passed to merge_annotations.py next to the CVAT exports:
+
+  python merge_annotations.py --ann_files annotations_v4/correct-phase-I-578Done-Mar14.json annotations_v4/lumbar-phase-I-322Done-Mar14.json annotations_v4/pseudo_coco.json --out annotations_v4/merged_with_pseudo_coco.json
+
+Every annotation also carries "score" and "keypoint_scores", so pseudo labels stay recognizable.
+
+Predictions are cached per model and image content (sha256) in --cache (default
+predictions_cache.json next to the output). A rerun only predicts new or changed frames, and
+changing the thresholds doesn't need any inference at all. A new checkpoint gets its own entries.
+
+Usage:
+python pseudo_label.py --weights runs/pose/train22/weights/best.pt --data_dir data_v4 --coco annotations_v4/merged_coco.json --out annotations_v4/pseudo_coco.json
+python pseudo_label.py --weights best.onnx --data_dir data_v4 --coco annotations_v4/merged_coco.json --out annotations_v4/pseudo_coco.json --kpt_conf 0.6 --min_keypoints 12
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from file_transfer import build_dir_index, file_sha256
+from image_cache import IMAGE_EXTENSIONS
+from infer_onnx import create_session, export_onnx, iter_batches, postprocess
+
+CACHE_VERSION = 1
+NUM_KEYPOINTS = 17
+# Everything above this score is cached, so later runs can use any --conf without new inference
+CANDIDATE_CONF = 0.001
+
+def model_key(weights, imgsz):
+    """Cache namespace of one checkpoint at one input size."""
+    return f"{file_sha256(weights)[:16]}@{imgsz}"
+
+class PredictionCache:
+    """
+    Persistent per-image predictions in one JSON file:
+      files    path -> [size, mtime_ns, sha256], so unchanged images are not hashed again
+      models   model key -> image sha256 -> {"width", "height", "detections": [...]}
+    """
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.files = {}
+        self.models = {}
+        if os.path.exists(cache_file):
+            with open(cache_file, 'r') as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                self.files = data["files"]
+                self.models = data["models"]
+
+    def image_hash(self, path):
+        stat = os.stat(path)
+        known = self.files.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        digest = file_sha256(path)
+        self.files[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def image_hashes(self, paths, workers=8):
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            return dict(zip(paths, executor.map(self.image_hash, paths)))
+
+    def get(self, model, image_hash):
+        return self.models.get(model, {}).get(image_hash)
+
+    def put(self, model, image_hash, record):
+        self.models.setdefault(model, {})[image_hash] = record
+
+    def save(self):
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({"version": CACHE_VERSION, "files": self.files, "models": self.models}, f)
+        os.replace(tmp_file, self.cache_file)
+
+def detection_record(detection):
+    _, score, bbox, kpts = detection
+    return {"score": round(score, 5),
+            "bbox": [round(float(v), 2) for v in bbox],
+            "keypoints": [[round(float(x), 2), round(float(y), 2), round(float(c), 4)] for x, y, c in kpts]}
+
+def unflip_predictions(outputs, input_width, flip_idx, num_keypoints=NUM_KEYPOINTS):
+    """Raw outputs of horizontally mirrored inputs -> outputs in the original (letterboxed) frame."""
+    outputs = outputs.copy()
+    nc = outputs.shape[1] - 4 - num_keypoints * 3
+    outputs[:, 0] = input_width - outputs[:, 0]
+    kpts = outputs[:, 4 + nc:].reshape(len(outputs), num_keypoints, 3, -1)
+    kpts[:, :, 0] = input_width - kpts[:, :, 0]
+    # A mirrored left shoulder is the right shoulder
+    outputs[:, 4 + nc:] = kpts[:, flip_idx].reshape(len(outputs), num_keypoints * 3, -1)
+    return outputs
+
+def predict_with_cache(session, cache, model, image_paths, imgsz=640, max_batch=8, max_wait_ms=5.0, workers=4,
+                       conf=0.25, iou=0.7, max_det=1, num_keypoints=NUM_KEYPOINTS, flip_idx=None):
+    """
+    {path: cached record} for every image, running the model only on images missing from the cache.
+    With flip_idx the model sees mirrored images and the predictions are mapped back (cached
+    under model + ":flip").
+    """
+    if flip_idx is not None:
+        model += ":flip"
+    hashes = cache.image_hashes(image_paths, workers)
+    todo = [path for path in image_paths if cache.get(model, hashes[path]) is None]
+    if todo:
+        input_name = session.get_inputs()[0].name
+        done = 0
+        for batch in iter_batches(todo, imgsz, max_batch, max_wait_ms, workers):
+            inputs = np.stack([entry[1] for entry in batch])
+            if flip_idx is None:
+                outputs = session.run(None, {input_name: inputs})[0]
+            else:
+                mirrored = np.ascontiguousarray(inputs[:, :, :, ::-1])
+                outputs = unflip_predictions(session.run(None, {input_name: mirrored})[0], inputs.shape[3],
+                                             flip_idx, num_keypoints)
+            for (path, _, orig_hw, r, pad, _), pred in zip(batch, outputs):
+                detections = postprocess(pred, orig_hw, r, pad, num_keypoints, conf, iou, max_det)
+                cache.put(model, hashes[path], {"width": orig_hw[1], "height": orig_hw[0],
+                                                "detections": [detection_record(d) for d in detections]})
+            done += len(batch)
+            print(f"\rPredicted {done}/{len(todo)}", end='', flush=True)
+        print()
+        cache.save()
+    return len(todo), {path: cache.get(model, hashes[path]) for path in image_paths}
+
+def find_unannotated_frames(data_dir, coco, exclude=("merged",)):
+    """Paths of the images in the task folders of data_dir that are not in the COCO file."""
+    task_dirs = [os.path.join(data_dir, name) for name in sorted(os.listdir(data_dir))
+                 if os.path.isdir(os.path.join(data_dir, name)) and name not in exclude]
+    annotated = {img["file_name"] for img in coco["images"]}
+    index = build_dir_index(task_dirs)
+    image_paths = [index[name] for name in sorted(index)
+                   if name.lower().endswith(IMAGE_EXTENSIONS) and name not in annotated]
+    return image_paths, task_dirs
+
+def pseudo_annotation(detection, ann_id, image_id, category_id, kpt_thresholds):
+    kpts = np.array(detection["keypoints"], dtype=np.float64)
+    kept = kpts[:, 2] >= kpt_thresholds
+    keypoints = []
+    for (x, y, _), keep in zip(kpts, kept):
+        keypoints.extend([x, y, 2] if keep else [0, 0, 0])
+    x, y, w, h = detection["bbox"]
+    return {
+        "id": ann_id,
+        "image_id": image_id,
+        "category_id": category_id,
+        "segmentation": [],
+        "area": round(w * h, 4),
+        "bbox": [x, y, w, h],
+        "iscrowd": 0,
+        "num_keypoints": int(kept.sum()),
+        "keypoints": keypoints,
+        "score": detection["score"],
+        "keypoint_scores": [float(c) for c in kpts[:, 2]],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Pseudo-label unannotated frames into a mergeable COCO file")
+    parser.add_argument("--weights", required=True, help="best.pt (exported to ONNX next to it) or an .onnx file")
+    parser.add_argument("--data_dir", required=True, help="Dataset image folder with one folder per CVAT task, e.g. data_v4")
+    parser.add_argument("--coco", required=True, help="Merged COCO file with the frames that are already annotated")
+    parser.add_argument("--out", required=True, help="COCO file to write, e.g. annotations_v4/pseudo_coco.json")
+    parser.add_argument("--exclude", nargs='*', default=["merged"], help="Folders of --data_dir to skip")
+    parser.add_argument("--cache", default=None, help="Prediction cache file (default: predictions_cache.json next to --out)")
+    parser.add_argument("--conf", type=float, default=0.5, help="Minimum person score")
+    parser.add_argument("--kpt_conf", type=float, nargs='+', default=[0.5],
+                        help="Keypoint confidence threshold, one value or one per keypoint")
+    parser.add_argument("--min_keypoints", type=int, default=10, help="Minimum keypoints above threshold to keep a person")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--max_batch", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads (0 = all cores)")
+    parser.add_argument("--workers", type=int, default=4, help="Image decode / hash threads")
+    args = parser.parse_args()
+
+    with open(args.coco, 'r') as f:
+        coco = json.load(f)
+    category = coco["categories"][0]
+    num_keypoints = len(category.get("keypoints", [])) or NUM_KEYPOINTS
+    if len(args.kpt_conf) not in (1, num_keypoints):
+        parser.error(f"--kpt_conf takes 1 or {num_keypoints} values")
+    kpt_thresholds = np.array(args.kpt_conf if len(args.kpt_conf) > 1 else args.kpt_conf * num_keypoints)
+
+    image_paths, task_dirs = find_unannotated_frames(args.data_dir, coco, args.exclude)
+    print(f"{len(image_paths)} unannotated frames in {len(task_dirs)} task folders")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    cache = PredictionCache(args.cache or os.path.join(os.path.dirname(os.path.abspath(args.out)), "predictions_cache.json"))
+    weights = export_onnx(args.weights, args.imgsz)
+    predicted, records = predict_with_cache(create_session(weights, args.threads), cache,
+                                            model_key(args.weights, args.imgsz), image_paths,
+                                            args.imgsz, args.max_batch, workers=args.workers, conf=CANDIDATE_CONF,
+                                            num_keypoints=num_keypoints)
+    print(f"Predicted {predicted} frames, {len(image_paths) - predicted} from cache ({cache.cache_file})")
+
+    images, annotations = [], []
+    for path in image_paths:
+        record = records[path]
+        image_id = len(images) + 1
+        kept = []
+        for detection in record["detections"]:
+            if detection["score"] < args.conf:
+                continue
+            annotation = pseudo_annotation(detection, len(annotations) + len(kept) + 1, image_id,
+                                           category["id"], kpt_thresholds)
+            if annotation["num_keypoints"] >= args.min_keypoints:
+                kept.append(annotation)
+        if kept:
+            images.append({"id": image_id, "width": record["width"], "height": record["height"],
+                           "file_name": os.path.basename(path), "license": 0, "flickr_url": "", "coco_url": "",
+                           "date_captured": 0})
+            annotations.extend(kept)
+
+    pseudo = {"licenses": coco.get("licenses", []), "info": {"description": "pseudo_label.py"},
+              "categories": coco["categories"], "images": images, "annotations": annotations}
+    with open(args.out, 'w') as f:
+        json.dump(pseudo, f)
+
+    print(f"Pseudo-labeled {len(images)} of {len(image_paths)} frames "
+          f"({len(image_paths) - len(images)} below --conf {args.conf} / --min_keypoints {args.min_keypoints})")
+    print(f"Pseudo annotations written to: {args.out}")
+
+if __name__ == "__main__":
+    main()
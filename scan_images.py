@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+scan_images.py
+
+Checks the image files of a dataset before training does: Ultralytics only finds corrupt or
+truncated JPEGs while building labels/*.cache, and the width/height of the COCO file (e.g.
+361x533) are never compared with the files themselves.
+
+For every image only the header is read to get the format and size (JPEG: the SOF segment and
+the EXIF orientation, PNG: the IHDR chunk) and the last bytes are checked for the end marker
+(JPEG FFD9, PNG IEND), which catches truncated files without decoding them. --decode also
+decodes every file with OpenCV and compares the decoded size. Files are scanned on a thread
+pool (--workers).
+
+With --coco every image entry is looked up by file name in --images and its width/height is
+compared with the file. Reported problems:
+  missing        in the COCO file but not found in --images
+  size           width/height differ from the file
+  exif_rotated   the file has an EXIF orientation of 90/270 degrees, so Ultralytics (which applies
+                 it) sees width and height swapped
+  truncated      no end-of-image marker
+  unreadable     not a JPEG/PNG or a broken header
+  decode_failed  OpenCV could not decode it, or decoded a different size (--decode)
+
+Results are cached per file in --cache (size + mtime_ns; decode results also under the file's
+sha256, so linked or copied frames are decoded once), so scanning an unchanged tree again only
+stats the files. Exits with status 1 when problems are found.
+
+Usage:
+python scan_images.py --images data_v4/merged --coco annotations_v4/merged_coco.json
+python scan_images.py --images yolopose_v4/data/images --decode --report scan_v4.csv
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import struct
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from coco_index import CocoIndex
+from file_transfer import DEFAULT_WORKERS, build_dir_index
+from image_cache import IMAGE_EXTENSIONS
+
+CACHE_VERSION = 1
+BATCH_SIZE = 128
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Start-of-frame markers that carry the image size (not DHT C4, JPG C8, DAC CC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+ISSUE_TYPES = ["missing", "size", "exif_rotated", "truncated", "unreadable", "decode_failed"]
+
+def exif_orientation(app1):
+    """Orientation tag (1-8) of an APP1 Exif payload, or 1."""
+    if not app1.startswith(b'Exif\x00\x00') or len(app1) < 14:
+        return 1
+    tiff = app1[6:]
+    endian = '<' if tiff[:2] == b'II' else '>'
+    ifd_offset = struct.unpack(endian + 'I', tiff[4:8])[0]
+    if ifd_offset + 2 > len(tiff):
+        return 1
+    count = struct.unpack(endian + 'H', tiff[ifd_offset:ifd_offset + 2])[0]
+    for i in range(count):
+        entry = tiff[ifd_offset + 2 + i * 12:ifd_offset + 14 + i * 12]
+        if len(entry) < 12:
+            break
+        tag, _, _ = struct.unpack(endian + 'HHI', entry[:8])
+        if tag == 0x0112:
+            return struct.unpack(endian + 'H', entry[8:10])[0]
+    return 1
+
+def read_jpeg_header(f):
+    """(width, height, orientation) from the segments before the image data."""
+    orientation = 1
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        while len(marker) == 2 and marker[0] == 0xFF and marker[1] == 0xFF:
+            # Fill bytes before a marker
+            marker = marker[1:] + f.read(1)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            raise ValueError("broken JPEG marker")
+        code = marker[1]
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        if code in (0xD9, 0xDA):
+            raise ValueError("no SOF segment before the image data")
+        length = struct.unpack('>H', f.read(2))[0]
+        if code in JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>xHH', f.read(5))
+            return width, height, orientation
+        if code == 0xE1 and orientation == 1:
+            orientation = exif_orientation(f.read(length - 2))
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+def scan_header(path):
+    """{"format", "width", "height", "orientation", "truncated"} or {"error"} from the header and the last bytes."""
+    try:
+        with open(path, 'rb') as f:
+            start = f.read(8)
+            if start[:3] == b'\xff\xd8\xff':
+                width, height, orientation = read_jpeg_header(f)
+                image_format = "jpeg"
+                # Some encoders pad after FFD9, so look at a few more bytes than two
+                f.seek(max(0, f.seek(0, os.SEEK_END) - 32))
+                truncated = b'\xff\xd9' not in f.read()
+            elif start == PNG_SIGNATURE:
+                ihdr = f.read(25)
+                if ihdr[4:8] != b'IHDR':
+                    raise ValueError("PNG without IHDR chunk")
+                width, height = struct.unpack('>II', ihdr[8:16])
+                image_format, orientation = "png", 1
+                f.seek(-12, os.SEEK_END)
+                truncated = f.read(12)[4:8] != b'IEND'
+            else:
+                raise ValueError("not a JPEG or PNG file")
+    except (ValueError, struct.error, OSError) as e:
+        return {"error": str(e)}
+    return {"format": image_format, "width": width, "height": height, "orientation": orientation, "truncated": truncated}
+
+def decode_check(data):
+    """{"decoded_width", "decoded_height"} or {"decode_error"} from a full decode of the file bytes."""
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED | cv2.IMREAD_IGNORE_ORIENTATION)
+    if img is None:
+        return {"decode_error": "OpenCV could not decode the file"}
+    return {"decoded_width": img.shape[1], "decoded_height": img.shape[0]}
+
+class ScanCache:
+    """
+    Scan results in one JSON file:
+      files     path -> {"size", "mtime_ns", header fields, "sha256" once decoded}
+      decoded   sha256 -> decode result, shared by every file with that content
+    """
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.files = {}
+        self.decoded = {}
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, 'r') as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                self.files = data["files"]
+                self.decoded = data["decoded"]
+
+    def scan(self, path, decode=False):
+        st = os.stat(path)
+        entry = self.files.get(path)
+        if not entry or entry["size"] != st.st_size or entry["mtime_ns"] != st.st_mtime_ns:
+            entry = dict(scan_header(path), size=st.st_size, mtime_ns=st.st_mtime_ns)
+            self.files[path] = entry
+        if decode and "error" not in entry:
+            if entry.get("sha256") not in self.decoded:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                # Hashing is much cheaper than decoding; the same frame elsewhere is decoded once
+                entry["sha256"] = hashlib.sha256(data).hexdigest()
+                if entry["sha256"] not in self.decoded:
+                    self.decoded[entry["sha256"]] = decode_check(data)
+            entry = dict(entry, **self.decoded[entry["sha256"]])
+        return entry
+
+    def save(self):
+        if not self.cache_file:
+            return
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({"version": CACHE_VERSION, "files": self.files, "decoded": self.decoded}, f)
+        os.replace(tmp_file, self.cache_file)
+
+def scan_files(cache, paths, decode=False, workers=DEFAULT_WORKERS):
+    """{path: scan result} for all paths, in batches on a thread pool."""
+    batches = [paths[i:i + BATCH_SIZE] for i in range(0, len(paths), BATCH_SIZE)]
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for batch, entries in zip(batches, executor.map(lambda batch: [cache.scan(p, decode) for p in batch], batches)):
+            results.update(zip(batch, entries))
+    return results
+
+def file_issues(entry):
+    """Problems of one file's scan result, as (issue, detail)."""
+    if "error" in entry:
+        return [("unreadable", entry["error"])]
+    issues = []
+    if entry["truncated"]:
+        issues.append(("truncated", f"{entry['format']} without end marker"))
+    if "decode_error" in entry:
+        issues.append(("decode_failed", entry["decode_error"]))
+    elif "decoded_width" in entry and (entry["decoded_width"], entry["decoded_height"]) != (entry["width"], entry["height"]):
+        issues.append(("decode_failed", f"header {entry['width']}x{entry['height']}, "
+                                         f"decoded {entry['decoded_width']}x{entry['decoded_height']}"))
+    return issues
+
+def main():
+    parser = argparse.ArgumentParser(description="Header-only image size / integrity scan, checked against a COCO file")
+    parser.add_argument("--images", nargs='+', required=True, help="Image folders (searched recursively)")
+    parser.add_argument("--coco", default=None, help="COCO file whose width/height are checked, e.g. annotations_v4/merged_coco.json")
+    parser.add_argument("--decode", action="store_true", help="Also fully decode every image")
+    parser.add_argument("--cache", default="image_scan_cache.json", help="Scan cache file ('' to disable)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--report", default=None, help="Write every problem to this CSV")
+    parser.add_argument("--show", type=int, default=5, help="Examples printed per problem type")
+    args = parser.parse_args()
+
+    index = build_dir_index(args.images)
+    image_names = sorted(name for name in index if name.lower().endswith(IMAGE_EXTENSIONS))
+    issues = []
+    if args.coco:
+        coco_images = CocoIndex(args.coco).images
+        for img in coco_images:
+            if img["file_name"] not in index:
+                issues.append(("missing", img["file_name"], ", ".join(args.images)))
+        coco_images = [img for img in coco_images if img["file_name"] in index]
+        image_names = [img["file_name"] for img in coco_images]
+
+    cache = ScanCache(args.cache)
+    scanned = {}
+    try:
+        scanned = scan_files(cache, [index[name] for name in image_names], args.decode, args.workers)
+    finally:
+        cache.save()
+
+    for name in image_names:
+        issues.extend((issue, name, detail) for issue, detail in file_issues(scanned[index[name]]))
+    if args.coco:
+        for img in coco_images:
+            entry = scanned[index[img["file_name"]]]
+            if "error" in entry:
+                continue
+            size = (entry["width"], entry["height"])
+            expected = (img["width"], img["height"])
+            rotated = entry["orientation"] in (5, 6, 7, 8)
+            if rotated and size[::-1] != expected:
+                issues.append(("exif_rotated", img["file_name"], f"EXIF orientation {entry['orientation']}: "
+                               f"file {size[0]}x{size[1]} is shown as {size[1]}x{size[0]}, COCO says {expected[0]}x{expected[1]}"))
+            elif not rotated and size != expected:
+                issues.append(("size", img["file_name"], f"COCO {expected[0]}x{expected[1]}, file {size[0]}x{size[1]}"))
+
+    sizes = Counter((entry["width"], entry["height"]) for entry in scanned.values() if "error" not in entry)
+    print(f"Scanned {len(scanned)} images" + (" (decoded)" if args.decode else "")
+          + ", most common sizes: " + ", ".join(f"{w}x{h} ({n})" for (w, h), n in sizes.most_common(3)))
+    counts = Counter(issue for issue, _, _ in issues)
+    if not issues:
+        print("No problems found")
+    for issue_type in ISSUE_TYPES:
+        if counts[issue_type]:
+            print(f"{issue_type}: {counts[issue_type]}")
+            for _, name, detail in [item for item in issues if item[0] == issue_type][:args.show]:
+                print(f"  {name}: {detail}")
+
+    if args.report:
+        with open(args.report, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["issue", "file_name", "detail"])
+            writer.writerows(issues)
+        print(f"Report written to: {args.report}")
+    sys.exit(1 if issues else 0)
+
+if __name__ == "__main__":
+    main()
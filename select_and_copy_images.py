@@ -1,32 +1,65 @@
 import os
-import json
 import shutil
+import argparse
+
+from coco_index import CocoIndex
+from file_transfer import DEFAULT_WORKERS, add_transfer_arguments, build_dir_index, transfer_files
+from image_store import ImageStore, copy_blob
 
 # Paths
 json_file_path = 'annotations_v4/merged_coco.json'
 source_dirs = ['data_v4/img-correct-phase-I-578Done-Mar14', 'data_v4/img-lumbar-phase-I-322Done-Mar14']
 target_dir = 'data_v4/merged'
 
+parser = argparse.ArgumentParser(description="Copy the images referenced by a merged COCO file into one folder")
+parser.add_argument("--json_file", default=json_file_path, help="Merged COCO annotation file")
+parser.add_argument("--source_dirs", nargs='+', default=source_dirs, help="Folders holding the CVAT task images")
+parser.add_argument("--target_dir", default=target_dir, help="Output folder, e.g. data_v4/merged")
+parser.add_argument("--store", default=None, help="Take the images from this image_store.py store instead of --source_dirs")
+parser.add_argument("--store_version", default=None, help="Version in --store, e.g. data_v4")
+add_transfer_arguments(parser)
+args = parser.parse_args()
+if bool(args.store) != bool(args.store_version):
+    parser.error("--store and --store_version go together")
+
 # Create target directory if it doesn't exist
-os.makedirs(target_dir, exist_ok=True)
+os.makedirs(args.target_dir, exist_ok=True)
 
-# Read JSON file
-with open(json_file_path, 'r') as file:
-    data = json.load(file)
+# Image names from the JSON (only the image list is loaded, from the index once it exists)
+image_names = set(CocoIndex(args.json_file).file_names)
 
-# Extract image names from JSON
-image_names = {img['file_name'] for img in data['images']}
+def is_inside(path, folder):
+    folder = os.path.realpath(folder)
+    try:
+        return os.path.commonpath([folder, os.path.realpath(os.path.dirname(path))]) == folder
+    except ValueError:
+        # Different drives on Windows
+        return False
 
 # Function to copy images
-def copy_images(source_dirs, target_dir, image_names):
-    for source_dir in source_dirs:
-        for root, _, files in os.walk(source_dir):
-            for file in files:
-                if file in image_names:
-                    source_file = os.path.join(root, file)
-                    target_file = os.path.join(target_dir, file)
-                    shutil.copy2(source_file, target_file)
-                    print(f'Copied {file} to {target_dir}')
+def copy_images(source_dirs, target_dir, image_names, link_mode='copy', workers=DEFAULT_WORKERS, source_index=None,
+                copy_function=shutil.copy2):
+    # One directory listing per folder instead of walking and checking every file
+    if source_index is None:
+        source_index = build_dir_index(source_dirs)
+        # A source folder may contain the target (e.g. data_v4 and data_v4/merged): never copy a file onto itself
+        source_index = {name: path for name, path in source_index.items() if not is_inside(path, target_dir)}
+    pairs = [(source_index[name], os.path.join(target_dir, name))
+             for name in sorted(image_names) if name in source_index]
+
+    missing = len(image_names) - len(pairs)
+    if missing:
+        print(f"Warning: {missing} images in the JSON were not found in {', '.join(source_dirs)}")
+
+    return transfer_files(pairs, link_mode, copy_function, workers)
 
 # Copy images
-copy_images(source_dirs, target_dir, image_names) 
\ No newline at end of file
+if args.store:
+    # Store blobs are read-only; copy_blob leaves the mode out so the copies stay writable
+    source_dirs, source_index = [f"{args.store} ({args.store_version})"], ImageStore(args.store).index(args.store_version)
+    copy_function = copy_blob
+else:
+    source_dirs, source_index, copy_function = args.source_dirs, None, shutil.copy2
+modes_used = copy_images(source_dirs, args.target_dir, image_names, args.link_mode, args.workers, source_index,
+                         copy_function)
+print(', '.join(f"{count} files via {mode}" for mode, count in modes_used.items()) or "No files copied")
@@ -1,8 +1,11 @@
 import os
 import random
 import shutil
+import argparse
 from collections import defaultdict
 
+from file_transfer import add_transfer_arguments, build_dir_index, transfer_files
+
 # Update this to the folder that contains both your .txt and image files.
 # folder_path = 'yolopose_v3/ultralytics_yolo_pose_1.0_526/both-img-labels'
 folder_path = 'yolopose_v4/ultralytics_yolo_pose_1.0_902/both-img-labels'
@@ -11,14 +14,30 @@ folder_path = 'yolopose_v4/ultralytics_yolo_pose_1.0_902/both-img-labels'
 output_images_dir = os.path.join('yolopose_v4/data', 'images')
 output_labels_dir = os.path.join('yolopose_v4/data', 'labels')
 
+parser = argparse.ArgumentParser(description="Split a YOLO pose export into train/val/test by video id")
+parser.add_argument("--folder_path", default=folder_path, help="Folder that contains both the .txt labels and the images")
+parser.add_argument("--out_dir", default=None,
+                    help="Output data folder (default: yolopose_v4/data), images/ and labels/ are created inside")
+parser.add_argument("--seed", type=int, default=None, help="Random seed for a reproducible split (default: unseeded)")
+add_transfer_arguments(parser)
+args = parser.parse_args()
+
+folder_path = args.folder_path
+if args.out_dir:
+    output_images_dir = os.path.join(args.out_dir, 'images')
+    output_labels_dir = os.path.join(args.out_dir, 'labels')
+
 # Create the directory structure: images/train, images/val, images/test,
 # and labels/train, labels/val, labels/test.
 for split in ['train', 'val', 'test']:
     os.makedirs(os.path.join(output_images_dir, split), exist_ok=True)
     os.makedirs(os.path.join(output_labels_dir, split), exist_ok=True)
 
+# Index the folder once: every label and image name, without probing each file on disk.
+folder_index = build_dir_index([folder_path], recursive=False)
+
 # List all .txt files in the folder.
-txt_files = [f for f in os.listdir(folder_path) if f.endswith('.txt')]
+txt_files = sorted(f for f in folder_index if f.endswith('.txt'))
 
 # Define a list of possible image extensions.
 image_extensions = ['.jpg', '.jpeg', '.png']
@@ -37,6 +56,8 @@ for txt_file in txt_files:
 
 # Get unique video IDs and shuffle them for random splitting.
 video_ids = list(video_groups.keys())
+if args.seed is not None:
+    random.seed(args.seed)
 random.shuffle(video_ids)
 
 total_videos = len(video_ids)
@@ -48,16 +69,17 @@ train_video_ids = video_ids[:train_count]
 val_video_ids = video_ids[train_count:train_count+val_count]
 test_video_ids = video_ids[train_count+val_count:]
 
-def copy_files(video_ids, split):
+def copy_files(video_ids, split, transfers):
+    """Queue the (source, destination) pairs of one split in transfers and count them."""
     images_count = 0
     labels_count = 0
     for vid in video_ids:
         # For each video id, get the corresponding label (txt) files.
         for txt_file in video_groups[vid]:
             # Copy the label file.
-            src_label = os.path.join(folder_path, txt_file)
+            src_label = folder_index[txt_file]
             dest_label = os.path.join(output_labels_dir, split, txt_file)
-            shutil.copy(src_label, dest_label)
+            transfers.append((src_label, dest_label))
             labels_count += 1
 
             # Look for the corresponding image file (same base name with a valid extension).
@@ -65,25 +87,27 @@ def copy_files(video_ids, split):
             found_image = None
             for ext in image_extensions:
                 image_file = base_name + ext
-                image_path = os.path.join(folder_path, image_file)
-                if os.path.exists(image_path):
+                if image_file in folder_index:
                     found_image = image_file
                     break
             if found_image:
-                src_image = os.path.join(folder_path, found_image)
+                src_image = folder_index[found_image]
                 dest_image = os.path.join(output_images_dir, split, found_image)
-                shutil.copy(src_image, dest_image)
+                transfers.append((src_image, dest_image))
                 images_count += 1
             else:
                 print(f"Warning: Image file for {txt_file} not found.")
     return images_count, labels_count
 
-# Copy files for each split.
-train_images, train_labels = copy_files(train_video_ids, 'train')
-val_images, val_labels = copy_files(val_video_ids, 'val')
-test_images, test_labels = copy_files(test_video_ids, 'test')
+# Collect the files of every split, then copy them all in one parallel pass.
+transfers = []
+train_images, train_labels = copy_files(train_video_ids, 'train', transfers)
+val_images, val_labels = copy_files(val_video_ids, 'val', transfers)
+test_images, test_labels = copy_files(test_video_ids, 'test', transfers)
+modes_used = transfer_files(transfers, args.link_mode, shutil.copy, args.workers)
 
 # Print the counts for each split.
 print(f"Train set: {train_labels} label files and {train_images} image files from {len(train_video_ids)} videos")
 print(f"Validation set: {val_labels} label files and {val_images} image files from {len(val_video_ids)} videos")
 print(f"Test set: {test_labels} label files and {test_images} image files from {len(test_video_ids)} videos")
+print(', '.join(f"{count} files via {mode}" for mode, count in modes_used.items()) or "No files copied")
@@ -14,6 +14,14 @@ python split_train_val_test.py --merged_coco annotations_v1/merged_coco.json --o
     --train_ratio 0.7 \
     --val_ratio 0.15 \
     --test_ratio 0.15
+
+K-fold mode (grouped by video ID, ratios are ignored) writes fold_1 .. fold_K folders,
+each with train_coco.json (the other K-1 folds) and val_coco.json (this fold):
+
+  python split_train_val_test.py --merged_coco annotations_v4/merged_coco.json --out_dir annotations_v4/folds --kfold 5
+
+All output subsets are built in a single pass over the images and annotations,
+so the cost stays linear in the dataset size regardless of how many subsets are written.
 """
 
 import json
@@ -22,6 +30,8 @@ import random
 import os
 from collections import defaultdict
 
+from coco_index import CocoIndex
+
 def get_video_id_from_filename(file_name):
     """
     Extract a 'video ID' from the image filename.
@@ -37,6 +47,11 @@ def get_video_id_from_filename(file_name):
         video_key = base
     return video_key
 
+def frame_number(file_name):
+    """"52723_8_10.jpg" -> 10, or -1 when the name doesn't end in a frame number."""
+    tail = os.path.splitext(file_name)[0].rsplit('_', 1)[-1]
+    return int(tail) if tail.isdigit() else -1
+
 def split_train_val_test(video_ids, train_ratio, val_ratio, test_ratio):
     """
     Shuffle and split the list of unique video IDs into train/val/test.
@@ -54,43 +69,75 @@ def split_train_val_test(video_ids, train_ratio, val_ratio, test_ratio):
     test_vids = set(video_ids[train_count + val_count:])
     return train_vids, val_vids, test_vids
 
-def build_subset_coco(merged_data, image_ids_subset):
+def kfold_video_split(video_to_image_ids, k):
     """
-    Build a new COCO dict with only the images (and annotations) whose IDs are in image_ids_subset.
+    Shuffle the video IDs and assign them to k folds, always adding the next video
+    to the fold with the fewest images so the folds stay roughly the same size.
+    Returns a list of k sets of video IDs.
     """
-    subset = {
-        "licenses": merged_data.get("licenses", []),
-        "info": merged_data.get("info", {}),
-        "categories": merged_data.get("categories", []),
-        "images": [],
-        "annotations": []
-    }
-
-    # Create a quick lookup
-    image_ids_subset = set(image_ids_subset)
-
-    # Filter images
-    img_id_map = {}
-    new_img_id = 1
+    if k > len(video_to_image_ids):
+        # A fold without videos would have an empty val set
+        raise ValueError(f"--kfold {k} is more than the {len(video_to_image_ids)} videos in the dataset; "
+                         f"use at most --kfold {len(video_to_image_ids)}")
+    video_ids = list(video_to_image_ids.keys())
+    random.shuffle(video_ids)
+
+    folds = [set() for _ in range(k)]
+    fold_sizes = [0] * k
+    for vid_key in video_ids:
+        smallest = min(range(k), key=lambda i: fold_sizes[i])
+        folds[smallest].add(vid_key)
+        fold_sizes[smallest] += len(video_to_image_ids[vid_key])
+    return folds
+
+def build_subset_cocos(merged_data, image_subsets, subset_names):
+    """
+    Build one COCO dict per subset name in a single pass over images and annotations.
+    image_subsets maps an image ID to the names of the subsets it belongs to
+    (an image can be in several subsets, e.g. the train set of several folds).
+    Image and annotation IDs are renumbered 1..N inside each subset.
+    """
+    subsets = {}
+    for name in subset_names:
+        subsets[name] = {
+            "licenses": merged_data.get("licenses", []),
+            "info": merged_data.get("info", {}),
+            "categories": merged_data.get("categories", []),
+            "images": [],
+            "annotations": []
+        }
+
+    # Index: old image ID -> [(subset, new image ID), ...]
+    img_id_map = defaultdict(list)
     for img in merged_data["images"]:
-        if img["id"] in image_ids_subset:
+        for name in image_subsets.get(img["id"], ()):
+            images = subsets[name]["images"]
             new_img = dict(img)
-            new_img["id"] = new_img_id
-            img_id_map[img["id"]] = new_img_id
-            new_img_id += 1
-            subset["images"].append(new_img)
+            new_img["id"] = len(images) + 1
+            images.append(new_img)
+            img_id_map[img["id"]].append((name, new_img["id"]))
 
-    # Filter annotations
-    new_ann_id = 1
     for ann in merged_data["annotations"]:
-        if ann["image_id"] in img_id_map:
+        for name, new_img_id in img_id_map.get(ann["image_id"], ()):
+            annotations = subsets[name]["annotations"]
             new_ann = dict(ann)
-            new_ann["image_id"] = img_id_map[ann["image_id"]]
-            new_ann["id"] = new_ann_id
-            new_ann_id += 1
-            subset["annotations"].append(new_ann)
+            new_ann["image_id"] = new_img_id
+            new_ann["id"] = len(annotations) + 1
+            annotations.append(new_ann)
+
+    return subsets
 
-    return subset
+def build_subset_coco(merged_data, image_ids_subset):
+    """
+    Build a new COCO dict with only the images (and annotations) whose IDs are in image_ids_subset.
+    """
+    image_subsets = {img_id: ("subset",) for img_id in image_ids_subset}
+    return build_subset_cocos(merged_data, image_subsets, ["subset"])["subset"]
+
+def save_subset(subset, out_file, label):
+    with open(out_file, 'w') as f:
+        json.dump(subset, f)
+    print(f"{label}: {len(subset['images'])} images, {len(subset['annotations'])} annotations => {out_file}")
 
 def main():
     parser = argparse.ArgumentParser()
@@ -100,17 +147,20 @@ def main():
     parser.add_argument("--val_ratio", type=float, default=0.15)
     parser.add_argument("--test_ratio", type=float, default=0.15)
     parser.add_argument("--seed", type=int, default=42, help="Random seed for reproducibility")
+    parser.add_argument("--kfold", type=int, default=0,
+                        help="Write K grouped-by-video folds instead of train/val/test (ratios are ignored)")
     args = parser.parse_args()
 
     # Basic checks
+    if args.kfold == 1 or args.kfold < 0:
+        raise ValueError("--kfold must be at least 2")
     ratio_sum = args.train_ratio + args.val_ratio + args.test_ratio
-    if abs(ratio_sum - 1.0) > 1e-6:
+    if not args.kfold and abs(ratio_sum - 1.0) > 1e-6:
         raise ValueError("train_ratio + val_ratio + test_ratio must equal 1.0")
 
     random.seed(args.seed)
 
-    with open(args.merged_coco, 'r') as f:
-        merged_data = json.load(f)
+    merged_data = CocoIndex(args.merged_coco).data
 
     # 1) Group image IDs by "video ID"
     video_to_image_ids = defaultdict(list)
@@ -120,6 +170,33 @@ def main():
         vid_key = get_video_id_from_filename(file_name)
         video_to_image_ids[vid_key].append(img["id"])
 
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    if args.kfold:
+        # 2) Assign whole videos to folds, 3) each image is in val of its fold and train of the rest
+        folds = kfold_video_split(video_to_image_ids, args.kfold)
+        image_subsets = {}
+        for fold_idx, fold_vids in enumerate(folds, start=1):
+            for vid_key in fold_vids:
+                names = [f"fold_{other}/train" for other in range(1, args.kfold + 1) if other != fold_idx]
+                names.append(f"fold_{fold_idx}/val")
+                for img_id in video_to_image_ids[vid_key]:
+                    image_subsets[img_id] = names
+
+        # 4) Build every fold's subsets in one pass
+        subset_names = [f"fold_{i}/{split}" for i in range(1, args.kfold + 1) for split in ("train", "val")]
+        subsets = build_subset_cocos(merged_data, image_subsets, subset_names)
+
+        # 5) Save them
+        for fold_idx, fold_vids in enumerate(folds, start=1):
+            fold_dir = os.path.join(args.out_dir, f"fold_{fold_idx}")
+            os.makedirs(fold_dir, exist_ok=True)
+            save_subset(subsets[f"fold_{fold_idx}/train"], os.path.join(fold_dir, "train_coco.json"),
+                        f"Fold {fold_idx} train set ({len(video_to_image_ids) - len(fold_vids)} videos)")
+            save_subset(subsets[f"fold_{fold_idx}/val"], os.path.join(fold_dir, "val_coco.json"),
+                        f"Fold {fold_idx} val set ({len(fold_vids)} videos)")
+        return
+
     # 2) Shuffle and split at video level
     all_video_ids = list(video_to_image_ids.keys())
     train_vids, val_vids, test_vids = split_train_val_test(
@@ -129,41 +206,25 @@ def main():
         args.test_ratio
     )
 
-    # 3) Build sets of image IDs for each split
-    train_image_ids = []
-    val_image_ids = []
-    test_image_ids = []
-
+    # 3) Map each image ID to its split
+    image_subsets = {}
     for vid_key, img_ids in video_to_image_ids.items():
         if vid_key in train_vids:
-            train_image_ids.extend(img_ids)
+            split = ("train",)
         elif vid_key in val_vids:
-            val_image_ids.extend(img_ids)
+            split = ("val",)
         else:
-            test_image_ids.extend(img_ids)
+            split = ("test",)
+        for img_id in img_ids:
+            image_subsets[img_id] = split
 
-    # 4) Build subset COCO for each split
-    train_coco = build_subset_coco(merged_data, train_image_ids)
-    val_coco = build_subset_coco(merged_data, val_image_ids)
-    test_coco = build_subset_coco(merged_data, test_image_ids)
+    # 4) Build all three subsets in one pass
+    subsets = build_subset_cocos(merged_data, image_subsets, ["train", "val", "test"])
 
     # 5) Save them
-    os.makedirs(args.out_dir, exist_ok=True)
-
-    train_file = os.path.join(args.out_dir, "train_coco.json")
-    val_file = os.path.join(args.out_dir, "val_coco.json")
-    test_file = os.path.join(args.out_dir, "test_coco.json")
-
-    with open(train_file, 'w') as f:
-        json.dump(train_coco, f)
-    with open(val_file, 'w') as f:
-        json.dump(val_coco, f)
-    with open(test_file, 'w') as f:
-        json.dump(test_coco, f)
-
-    print(f"Train set: {len(train_coco['images'])} images, {len(train_coco['annotations'])} annotations => {train_file}")
-    print(f"Val set: {len(val_coco['images'])} images, {len(val_coco['annotations'])} annotations => {val_file}")
-    print(f"Test set: {len(test_coco['images'])} images, {len(test_coco['annotations'])} annotations => {test_file}")
+    save_subset(subsets["train"], os.path.join(args.out_dir, "train_coco.json"), "Train set")
+    save_subset(subsets["val"], os.path.join(args.out_dir, "val_coco.json"), "Val set")
+    save_subset(subsets["test"], os.path.join(args.out_dir, "test_coco.json"), "Test set")
 
 if __name__ == "__main__":
     main()
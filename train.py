@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+train.py
+
+Fine-tunes a YOLO pose model on a dataset.yaml (e.g. yolopose_v4/dataset.yaml) with
+ultralytics.YOLO, the same call as the model.train(data='dataset.yaml', ...) cell in the
+train.ipynb notebooks, but from the command line.
+
+Besides Ultralytics' own results.csv, every epoch's wall time is split into phases and
+appended to timing.csv in the same run folder:
+  data_s     time the training loop waited for the dataloader (next batch)
+  compute_s  preprocess + forward + backward + optimizer step of all batches
+  val_s      validation
+  other_s    the rest (checkpoint saving, plots, scheduler)
+A high data share means the run is input-bound (try more --workers or --cache ram) rather
+than compute-bound. On GPU the timer synchronizes CUDA after each batch so the compute time
+is real and not just kernel launch time.
+
+--letterbox_cache reads the train split from an image_cache.py cache (built with the same
+--imgsz) instead of decoding every JPEG in every epoch; see letterbox_dataset.py.
+
+A run can be resumed from its last.pt after an interruption; timing.csv keeps growing.
+
+The dataset.yaml files carry the absolute "path" of the machine they were written on. When
+that folder doesn't exist here, the data folder next to the yaml is used instead, through a
+copy with the local path written next to it (dataset.yaml -> dataset.local.yaml).
+
+Usage:
+python train.py --data yolopose_v4/dataset.yaml --model yolo11m-pose.pt --epochs 100 --imgsz 640 --batch 16 --device 0 --name train22
+python train.py --data yolopose_v4/dataset.yaml --resume runs/pose/train22/weights/last.pt
+python train.py --data yolopose_v4/dataset.yaml --resume        # resume the most recent run
+python train.py --data yolopose_v4/dataset.yaml --smoke         # 1 tiny CPU epoch on 10% of the data, to test the setup
+python train.py --data yolopose_v4/dataset.yaml --imgsz 640 --letterbox_cache yolopose_v4/data/cache_640
+"""
+
+import argparse
+import csv
+import glob
+import os
+import time
+
+import yaml
+
+TIMING_FILE = "timing.csv"
+TIMING_FIELDS = ["epoch", "batches", "data_s", "compute_s", "val_s", "other_s", "epoch_s", "data_pct"]
+
+def resolve_dataset_yaml(data_yaml):
+    """Return a dataset.yaml whose "path" exists on this machine (<name>.local.yaml next to it if needed)."""
+    with open(data_yaml, 'r') as f:
+        cfg = yaml.safe_load(f)
+    root = cfg.get("path")
+    if not root or os.path.isdir(root):
+        return data_yaml
+    local_root = os.path.join(os.path.dirname(os.path.abspath(data_yaml)), os.path.basename(root.rstrip("/\\")))
+    if not os.path.isdir(local_root):
+        return data_yaml
+    print(f"Dataset path {root} not found, using {local_root}")
+    cfg["path"] = local_root
+    # Stable name next to the original: rewritten on every run, and args.yaml of the run points at a file that stays
+    resolved = os.path.splitext(data_yaml)[0] + ".local.yaml"
+    with open(resolved, 'w') as f:
+        yaml.safe_dump(cfg, f, sort_keys=False)
+    return resolved
+
+def latest_last_pt(project):
+    candidates = glob.glob(os.path.join(project, "*", "weights", "last.pt"))
+    if not candidates:
+        raise FileNotFoundError(f"No weights/last.pt found under {project} to resume from")
+    return max(candidates, key=os.path.getmtime)
+
+class PhaseTimer:
+    """Ultralytics callbacks that split each training epoch into data / compute / validation time."""
+
+    def __init__(self):
+        self.sync = None
+
+    def attach(self, model):
+        model.add_callback("on_train_epoch_start", self.on_train_epoch_start)
+        model.add_callback("on_train_batch_start", self.on_train_batch_start)
+        model.add_callback("on_train_batch_end", self.on_train_batch_end)
+        model.add_callback("on_val_start", self.on_val_start)
+        model.add_callback("on_val_end", self.on_val_end)
+        model.add_callback("on_fit_epoch_end", self.on_fit_epoch_end)
+        model.add_callback("on_train_end", self.on_train_end)
+        self.epoch_start = None
+        self.rows = []
+
+    def on_train_epoch_start(self, trainer):
+        if self.sync is None:
+            self.sync = lambda: None
+            if trainer.device.type == "cuda":
+                import torch
+                self.sync = lambda: torch.cuda.synchronize(trainer.device)
+        self.epoch_start = self.last_batch_end = time.perf_counter()
+        self.data_s = self.compute_s = self.val_s = 0.0
+        self.batches = 0
+
+    def on_train_batch_start(self, trainer):
+        self.batch_start = time.perf_counter()
+        self.data_s += self.batch_start - self.last_batch_end
+
+    def on_train_batch_end(self, trainer):
+        self.sync()
+        self.last_batch_end = time.perf_counter()
+        self.compute_s += self.last_batch_end - self.batch_start
+        self.batches += 1
+
+    def on_val_start(self, validator):
+        self.val_start = time.perf_counter()
+
+    def on_val_end(self, validator):
+        if self.epoch_start is not None:
+            self.val_s += time.perf_counter() - self.val_start
+
+    def on_fit_epoch_end(self, trainer):
+        # Also fired once more for the final best.pt validation, outside of any epoch
+        if self.epoch_start is None:
+            return
+        epoch_s = time.perf_counter() - self.epoch_start
+        self.epoch_start = None
+        row = {
+            "epoch": trainer.epoch + 1,
+            "batches": self.batches,
+            "data_s": round(self.data_s, 3),
+            "compute_s": round(self.compute_s, 3),
+            "val_s": round(self.val_s, 3),
+            "other_s": round(epoch_s - self.data_s - self.compute_s - self.val_s, 3),
+            "epoch_s": round(epoch_s, 3),
+            "data_pct": round(100 * self.data_s / epoch_s, 1) if epoch_s else 0.0,
+        }
+        self.rows.append(row)
+
+        timing_file = os.path.join(trainer.save_dir, TIMING_FILE)
+        new_file = not os.path.exists(timing_file)
+        with open(timing_file, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=TIMING_FIELDS)
+            if new_file:
+                writer.writeheader()
+            writer.writerow(row)
+
+    def on_train_end(self, trainer):
+        if not self.rows:
+            return
+        totals = {key: sum(row[key] for row in self.rows) for key in ("data_s", "compute_s", "val_s", "other_s", "epoch_s")}
+        shares = {key: 100 * value / totals["epoch_s"] for key, value in totals.items() if key != "epoch_s"}
+        bound = "input-bound" if totals["data_s"] > totals["compute_s"] else "compute-bound"
+        print(f"Epoch time split over {len(self.rows)} epochs: data {shares['data_s']:.0f}%, "
+              f"compute {shares['compute_s']:.0f}%, val {shares['val_s']:.0f}%, other {shares['other_s']:.0f}% "
+              f"-> {bound}")
+        print(f"Per-epoch timing written to: {os.path.join(trainer.save_dir, TIMING_FILE)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune YOLO pose on a dataset.yaml with per-epoch phase timing")
+    parser.add_argument("--data", required=True, help="Dataset yaml, e.g. yolopose_v4/dataset.yaml")
+    parser.add_argument("--model", default="yolo11n-pose.pt",
+                        help="Pretrained weights (e.g. yolo11m-pose.pt) or a model yaml to train from scratch")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--device", default=None, help="cuda device (0, 0,1) or cpu; default picks the GPU if there is one")
+    parser.add_argument("--workers", type=int, default=8, help="Dataloader workers")
+    parser.add_argument("--cache", choices=["false", "ram", "disk"], default="false", help="Ultralytics image caching")
+    parser.add_argument("--letterbox_cache", default=None,
+                        help="image_cache.py cache folder (e.g. yolopose_v4/data/cache_640) to read the train images from")
+    parser.add_argument("--fraction", type=float, default=1.0, help="Fraction of the train split to use")
+    parser.add_argument("--project", default="runs/pose")
+    parser.add_argument("--name", default=None, help="Run name (folder under --project)")
+    parser.add_argument("--resume", nargs='?', const="latest", default=None,
+                        help="Resume from a last.pt (default: the most recent one under --project)")
+    parser.add_argument("--smoke", action="store_true",
+                        help="Quick setup test: 1 epoch on CPU, imgsz 320, batch 4, 10%% of the data, no plots")
+    args = parser.parse_args()
+
+    from ultralytics import YOLO
+
+    data = resolve_dataset_yaml(args.data)
+    train_args = dict(data=data, device=args.device, workers=args.workers,
+                      cache=False if args.cache == "false" else args.cache)
+    if args.smoke:
+        train_args.update(device="cpu", workers=0)
+
+    trainer = None
+    if args.letterbox_cache:
+        from letterbox_dataset import LetterboxPoseTrainer
+        LetterboxPoseTrainer.cache_root = args.letterbox_cache
+        trainer = LetterboxPoseTrainer
+
+    timer = PhaseTimer()
+    if args.resume:
+        last = latest_last_pt(args.project) if args.resume == "latest" else args.resume
+        print(f"Resuming from {last}")
+        model = YOLO(last)
+        timer.attach(model)
+        model.train(resume=True, trainer=trainer, **train_args)
+        return
+
+    train_args.update(epochs=args.epochs, imgsz=args.imgsz, batch=args.batch, fraction=args.fraction,
+                      project=os.path.abspath(args.project), name=args.name)
+    if args.smoke:
+        train_args.update(epochs=1, imgsz=320, batch=4, fraction=min(args.fraction, 0.1), plots=False)
+
+    model = YOLO(args.model)
+    timer.attach(model)
+    model.train(trainer=trainer, **train_args)
+
+if __name__ == "__main__":
+    main()
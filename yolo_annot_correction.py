@@ -9,75 +9,189 @@ The best practice for YOLO pose annotation correction is:
         If either x or y is outside [0,1] (negative or > 1.0):
             Set both (x, y) to 0 (or a neutral value within image bounds, usually 0.0).
             Set visibility to 0 for that keypoint.
-"""
 
+All label lines of a directory are loaded into one (objects, 5 + 17*3) array and checked with
+vectorized NumPy operations. An object with no visible valid keypoint left is dropped, a file
+is deleted only when none of its objects survive, and every changed file is written once,
+atomically (temp file + rename), so hardlinked/symlinked sources are never modified.
+Bounding boxes outside [0, 1] are reported but left unchanged.
 
-import os
+A file with a line that isn't 5 + K*3 numbers (wrong --num_keypoints, a tree with a different
+kpt_shape, or a token like "abc") is reported and left untouched, and the script exits with
+status 1.
+
+Usage:
+python yolo_annot_correction.py --labels yolopose_v4/data/labels/train yolopose_v4/data/labels/val yolopose_v4/data/labels/test
 
-# annotations_path = "C:/Users/UDESIAS/Documents/FYP/Fine-Tune/yolopose_v3/data/labels/train/"
-# annotations_path = "C:/Users/UDESIAS/Documents/FYP/Fine-Tune/yolopose_v3/data/labels/test/"
-# annotations_path = "C:/Users/UDESIAS/Documents/FYP/Fine-Tune/yolopose_v3/data/labels/val/"
-
-# annotations_path = "C:/Users/UDESIAS/Documents/FYP/Fine-Tune/yolopose_v4/data/labels/train/"
-annotations_path = "C:/Users/UDESIAS/Documents/FYP/Fine-Tune/yolopose_v4/data/labels/test/"
-# annotations_path = "C:/Users/UDESIAS/Documents/FYP/Fine-Tune/yolopose_v4/data/labels/val/"
-
-def is_valid_coord(x):
-    return 0.0 <= float(x) <= 1.0
-
-for file_name in os.listdir(annotations_path):
-    if not file_name.endswith(".txt"):
-        continue
-
-    file_path = os.path.join(annotations_path, file_name)
-    updated_lines = []
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-
-    for line in lines:
-        values = line.strip().split()
-        if len(values) < 5:
-            continue  # skip if format is obviously incorrect
-
-        class_id = values[0]
-        box_coords = values[1:5]
-
-        # Check if bbox coordinates are valid first
-        box_valid = all(0.0 <= float(coord) <= 1.0 for coord in box_coords)
-
-        keypoints = values[5:]
-        new_keypoints = []
-        valid_keypoints_exist = False
-
-        # Process keypoints (each keypoint is x,y,v)
-        for i in range(0, len(keypoints), 3):
-            x, y, v = keypoints[i:i+3]
-            x_float = float(x)
-            y_float = float(y)
-
-            # Check coordinate validity
-            if not (0.0 <= x_float <= 1.0) or not (0.0 <= float(y) <= 1.0):
-                # Invalid keypoint found: set visibility=0 and coords=0.0
-                new_keypoints.extend(["0.0", "0.0", "0"])
-            else:
-                # Keypoint is valid; keep as is
-                new_keypoints.extend([x, y, v])
-                if int(v) != 0:
-                    valid_keypoints_exist = True
-
-        if valid_keypoints_exist:
-            corrected_line = values[:5] + new_keypoints
-            updated_lines.append(' '.join(corrected for corrected in new_keypoints))
-        else:
-            print(f"❌ Removed invalid annotation from {file_name} (no valid keypoints left).")
-
-        # Rewrite annotation only if valid keypoints remain
-        if valid_keypoints_exist:
-            with open(file_path, 'w') as f:
-                f.write(' '.join(values[:5] + new_keypoints) + '\n')
-        else:
-            # Optionally remove entirely invalid annotations
-            os.remove(file_path)
-            print(f"❌ Removed annotation with no valid keypoints: {file_name}")
-
-print("✅ Annotation cleaning and validation completed!")
+Report what would change without touching any file:
+python yolo_annot_correction.py --labels yolopose_v4/data/labels/test --dry-run
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+NUM_KEYPOINTS = 17
+
+def list_label_files(paths):
+    """Expand label directories (and single .txt files) into a sorted list of .txt paths."""
+    label_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                label_files.extend(entry.path for entry in entries
+                                   if entry.is_file() and entry.name.endswith(".txt"))
+        elif path.endswith(".txt"):
+            label_files.append(path)
+    return sorted(label_files)
+
+def load_labels(label_files, num_keypoints=NUM_KEYPOINTS):
+    """
+    Read every label line into one token array.
+    Returns (tokens, file_index, malformed) where tokens is a (objects, 5 + K*3) string array,
+    file_index[i] is the position in label_files of object i, and malformed counts the lines
+    per file that don't have the expected number of values.
+    """
+    width = 5 + num_keypoints * 3
+    rows = []
+    file_index = []
+    malformed = np.zeros(len(label_files), dtype=np.int64)
+
+    for idx, file_path in enumerate(label_files):
+        with open(file_path, 'r') as f:
+            for line in f:
+                values = line.split()
+                if not values:
+                    continue
+                if len(values) != width:
+                    malformed[idx] += 1
+                    continue
+                rows.append(values)
+                file_index.append(idx)
+
+    tokens = np.array(rows, dtype=str).reshape(len(rows), width)
+    if tokens.dtype.itemsize < np.dtype('U3').itemsize:
+        # Make room for the "0.0" replacement values
+        tokens = tokens.astype('U3')
+    return tokens, np.array(file_index, dtype=np.int64), malformed
+
+def numeric_rows(tokens):
+    """(objects,) bool: the row's tokens are all numbers."""
+    ok = np.ones(len(tokens), dtype=bool)
+    for i, row in enumerate(tokens):
+        try:
+            np.array(row, dtype=np.float64)
+        except ValueError:
+            ok[i] = False
+    return ok
+
+def correct_keypoints(values, num_keypoints=NUM_KEYPOINTS):
+    """
+    Vectorized validation of a (objects, 5 + K*3) float array.
+    Returns (invalid_kpts, keep, invalid_box):
+      invalid_kpts (objects, K): keypoint x or y is outside [0, 1] -> becomes 0.0 0.0 0
+      keep (objects,): at least one valid keypoint with visibility != 0 remains
+      invalid_box (objects,): a bbox value is outside [0, 1]
+    """
+    kpts = values[:, 5:].reshape(-1, num_keypoints, 3)
+    xy = kpts[:, :, :2]
+    invalid_kpts = ((xy < 0.0) | (xy > 1.0)).any(axis=2)
+    keep = (~invalid_kpts & (kpts[:, :, 2] != 0)).any(axis=1)
+    box = values[:, 1:5]
+    invalid_box = ((box < 0.0) | (box > 1.0)).any(axis=1)
+    return invalid_kpts, keep, invalid_box
+
+def write_atomic(file_path, text):
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, file_path)
+
+def correct_label_files(label_files, num_keypoints=NUM_KEYPOINTS, dry_run=False):
+    tokens, file_index, malformed = load_labels(label_files, num_keypoints)
+    try:
+        values = tokens.astype(np.float64)
+    except ValueError:
+        # Some line has a token that isn't a number; find it the slow way and count it as malformed
+        numeric = numeric_rows(tokens)
+        np.add.at(malformed, file_index[~numeric], 1)
+        tokens, file_index = tokens[numeric], file_index[numeric]
+        values = tokens.astype(np.float64)
+    invalid_kpts, keep, invalid_box = correct_keypoints(values, num_keypoints)
+
+    # Zero invalid keypoints in the token array, other values keep their original text
+    obj_idx, kpt_idx = np.nonzero(invalid_kpts)
+    x_cols = 5 + kpt_idx * 3
+    tokens[obj_idx, x_cols] = "0.0"
+    tokens[obj_idx, x_cols + 1] = "0.0"
+    tokens[obj_idx, x_cols + 2] = "0"
+
+    # Per-file summaries in one go
+    n_files = len(label_files)
+    objects_per_file = np.bincount(file_index, minlength=n_files)
+    kept_per_file = np.bincount(file_index, weights=keep, minlength=n_files).astype(np.int64)
+    fixed_kpts_per_file = np.bincount(file_index, weights=invalid_kpts.sum(axis=1), minlength=n_files).astype(np.int64)
+    bad_boxes_per_file = np.bincount(file_index, weights=invalid_box, minlength=n_files).astype(np.int64)
+    # Files with malformed lines are never rewritten or removed: the lines may be fine for another kpt_shape
+    changed = ((fixed_kpts_per_file > 0) | (kept_per_file < objects_per_file)) & (malformed == 0)
+
+    # Rows are grouped by file, so each file's objects are one contiguous slice
+    starts = np.concatenate(([0], np.cumsum(objects_per_file)))
+    rewritten = removed = 0
+    for idx in np.flatnonzero(changed):
+        file_name = os.path.basename(label_files[idx])
+        rows = slice(starts[idx], starts[idx + 1])
+        dropped = objects_per_file[idx] - kept_per_file[idx]
+        if dry_run:
+            print(f"[dry-run] {file_name}: {fixed_kpts_per_file[idx]} keypoints zeroed, "
+                  f"{dropped} objects without valid keypoints")
+
+        if kept_per_file[idx] == 0:
+            removed += 1
+            if not dry_run:
+                os.remove(label_files[idx])
+                print(f"❌ Removed annotation with no valid keypoints: {file_name}")
+            continue
+
+        rewritten += 1
+        if not dry_run:
+            lines = [' '.join(row) for row in tokens[rows][keep[rows]]]
+            write_atomic(label_files[idx], '\n'.join(lines) + '\n')
+
+    malformed_files = np.flatnonzero(malformed)
+    if len(malformed_files):
+        examples = ', '.join(f"{os.path.basename(label_files[idx])} ({malformed[idx]} lines)" for idx in malformed_files[:5])
+        print(f"Error: {len(malformed_files)} files have lines that aren't {5 + num_keypoints * 3} numbers "
+              f"(is --num_keypoints {num_keypoints} right?), left unchanged: {examples}")
+
+    bad_box_files = np.flatnonzero(bad_boxes_per_file)
+    if len(bad_box_files):
+        examples = ', '.join(os.path.basename(label_files[idx]) for idx in bad_box_files[:5])
+        print(f"Warning: {len(bad_box_files)} files have bounding boxes outside [0, 1] (e.g. {examples})")
+
+    action = "would be" if dry_run else "were"
+    print(f"Checked {n_files} files / {len(tokens)} objects: {int(invalid_kpts.sum())} keypoints out of range, "
+          f"{int((~keep).sum())} objects without valid keypoints.")
+    print(f"{rewritten} files {action} rewritten, {removed} {action} removed.")
+    return len(malformed_files)
+
+def main():
+    parser = argparse.ArgumentParser(description="Zero out-of-range keypoints in YOLO pose label files")
+    parser.add_argument("--labels", nargs='+', required=True,
+                        help="Label directories (e.g. yolopose_v4/data/labels/train) or single .txt files")
+    parser.add_argument("--num_keypoints", type=int, default=NUM_KEYPOINTS,
+                        help="Keypoints per object (kpt_shape[0] in dataset.yaml)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    args = parser.parse_args()
+
+    label_files = list_label_files(args.labels)
+    malformed_files = correct_label_files(label_files, args.num_keypoints, args.dry_run)
+    if malformed_files:
+        sys.exit(1)
+    if not args.dry_run:
+        print("✅ Annotation cleaning and validation completed!")
+
+if __name__ == "__main__":
+    main()
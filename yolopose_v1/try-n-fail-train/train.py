@@ -4,40 +4,53 @@ train.py
 
 Script for fine-tuning the YOLOPose11 model on a custom COCO keypoint dataset.
 
+The training itself is the ultralytics.YOLO run of the top-level train.py (same per-epoch
+timing.csv); this script only keeps the old command line. Values from the train_cfg section of
+--cfg (epochs, batch_size, optimizer type and lr) are used unless given on the command line.
+
 Usage:
-  python train.py --cfg yolopose11.yaml --data data.yaml --weights yolo11m-pose.pt --batch-size 8 --epochs 50
+  python train.py --cfg yolopose11.yaml --data ../dataset.yaml --weights yolo11m-pose.pt --batch-size 8 --epochs 50
 """
 
 import argparse
 import os
+import sys
+
+import yaml
 from ultralytics import YOLO
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from train import PhaseTimer, resolve_dataset_yaml
+
 def main():
     parser = argparse.ArgumentParser(description="Train YOLOPose11 on custom pose dataset")
-    parser.add_argument('--cfg', type=str, required=True, help='Path to YOLOPose11 config file (yolopose11.yaml)')
-    parser.add_argument('--data', type=str, required=True, help='Path to data YAML file (e.g., data.yaml)')
-    parser.add_argument('--weights', type=str, default=None, help='Path to pretrained weights (e.g., yolopose11.pt)')
-    parser.add_argument('--batch-size', type=int, default=8, help='Training batch size')
-    parser.add_argument('--epochs', type=int, default=50, help='Number of training epochs')
-    parser.add_argument('--gpu-id', type=int, default=0, help='GPU id to use')
+    parser.add_argument('--cfg', type=str, default=None, help='Path to YOLOPose11 config file (yolopose11.yaml)')
+    parser.add_argument('--data', type=str, required=True, help='Path to the Ultralytics dataset YAML (e.g., ../dataset.yaml)')
+    parser.add_argument('--weights', type=str, default='yolo11m-pose.pt', help='Path to pretrained weights (e.g., yolo11m-pose.pt)')
+    parser.add_argument('--batch-size', type=int, default=None, help='Training batch size (default: train_cfg.batch_size or 8)')
+    parser.add_argument('--epochs', type=int, default=None, help='Number of training epochs (default: train_cfg.epochs or 50)')
+    parser.add_argument('--gpu-id', type=str, default='0', help='GPU id to use, or cpu')
     args = parser.parse_args()
 
     # Load the configuration file
-    cfg = Config.fromfile(args.cfg)
-    
-    # Update configuration with command-line parameters
-    cfg.data.data_yaml = args.data  # the data YAML path is set in the data section
-    cfg.train_cfg.epochs = args.epochs
-    cfg.train_cfg.optimizer.lr = cfg.train_cfg.optimizer.lr if hasattr(cfg.train_cfg.optimizer, "lr") else 0.0005
-    cfg.train_cfg.batch_size = args.batch_size
-    if args.weights:
-        cfg.model.backbone.pretrained = args.weights
-
-    # Set GPU device if needed (depends on your training library)
-    os.environ["CUDA_VISIBLE_DEVICES"] = str(args.gpu_id)
-
-    # Launch training; train_model() should handle model, dataset creation, logging, checkpointing, etc.
-    train_model(cfg)
+    train_cfg = {}
+    if args.cfg:
+        with open(args.cfg, 'r') as f:
+            train_cfg = (yaml.safe_load(f) or {}).get("train_cfg", {})
+    optimizer = train_cfg.get("optimizer", {})
+
+    train_args = dict(
+        data=resolve_dataset_yaml(args.data),
+        epochs=args.epochs or train_cfg.get("epochs", 50),
+        batch=args.batch_size or train_cfg.get("batch_size", 8),
+        device=args.gpu_id,
+    )
+    if "lr" in optimizer:
+        train_args.update(optimizer=optimizer.get("type", "Adam"), lr0=optimizer["lr"])
+
+    model = YOLO(args.weights)
+    PhaseTimer().attach(model)
+    model.train(**train_args)
 
 if __name__ == '__main__':
     main()